@@ -1,7 +1,10 @@
 import subprocess
-import requests
 import tempfile
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "InterbankService"))
+import secureClient
 
 country = "VN"
 state = "Ha Noi"
@@ -9,19 +12,7 @@ org = "Maritime Bank"
 public_ip = "192.168.1.11"
 server_domain = "www.sbv.org"
 
-def load_context(path="../context.txt"):
-    context = {}
-    try:
-        with open(path, "r") as f:
-            for line in f:
-                if "=" in line:
-                    k, v = line.strip().split("=", 1)
-                    context[k.strip()] = v.strip()
-    except Exception:
-        pass
-    return context
-
-context = load_context()
+context = secureClient.load_context()
 commonname = context.get("BANK_CODE")
 
 # === 1. Tạo file config tạm có SAN ===
@@ -65,17 +56,18 @@ subprocess.run([
     "-config", config_path
 ], check=True)
 
-# === 5. Gửi CSR qua HTTPS ===
+# === 5. Gửi CSR qua HTTPS (session tin cậy RootCA, tự gửi lại khi lỗi mạng) ===
 with open(csr_path, "rb") as f:
     csr_data = f.read()
+with open(config_path, "rb") as f:
+    config_data = f.read()
 SERVER_URL = f"https://{server_domain}:443/submit-csr"
-response = requests.post(
+response = secureClient.get_client("./RootCA.crt").post(
     SERVER_URL,
     files = {
-    "csr": (f"{commonname}.csr", open(csr_path, "rb"), "application/pkcs10"),
-    "config": (f"{commonname}.cnf", open(config_path, "rb"), "text/plain")
+    "csr": (f"{commonname}.csr", csr_data, "application/pkcs10"),
+    "config": (f"{commonname}.cnf", config_data, "text/plain")
     },
-    verify="./RootCA.crt",
     timeout=(10, 300)
 )
 
@@ -1,56 +1,165 @@
-import psycopg2
+"""
+File: getCustomerInfo.py
+Mô tả: Lấy chỉ số tín dụng của khách hàng từ PostgreSQL
+Chức năng chính:
+- Tra cứu một khách hàng theo tên (chế độ tương tác)
+- Chế độ hàng loạt: connection pool, một truy vấn JOIN duy nhất, cursor phía server đọc theo lô
+- Trả về mỗi lô dưới dạng mảng NumPy theo cột, sẵn sàng đóng gói vào slot của ciphertext
+- Lọc theo danh sách CustomerID hoặc theo điều kiện SQL
+- Bỏ qua khách hàng thiếu chỉ số (NULL hoặc không có dòng Data) và liệt kê được các CustomerID bị bỏ qua
+Ví dụ (hàng loạt):
+    pool = create_pool(get_conn_info(password))
+    for customer_ids, columns in iter_feature_batches(pool, customer_ids=[1, 2, 3]):
+        ...
+"""
+
+import os
+import sys
+import numpy as np
+from psycopg2 import pool as pg_pool
+from contextlib import contextmanager
 from getpass import getpass
 
-passw = getpass("Get PostgreSQL password: ")
+# Số khách hàng mỗi lô mặc định bằng số slot mỗi ciphertext, dùng chung tham số với HEModule
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "HEModule"))
+from fheParameters import BATCH_SIZE
+
+# Các cột chỉ số trong bảng Data
+FIELDS = ["Spayment", "Sutil", "Slength", "Screditmix",
+          "Sinquiries", "Sincomestability", "Sbehaviorial"]
+
+# Kích thước connection pool
+POOL_MIN_CONNECTIONS = 1
+POOL_MAX_CONNECTIONS = 8
+
+def get_conn_info(password: str, host: str = "localhost", port: int = 5432,
+                  dbname: str = "msb_db", user: str = "postgres") -> dict:
+    # Thông tin kết nối PostgreSQL
+    return {
+        "host": host,
+        "port": port,
+        "dbname": dbname,
+        "user": user,
+        "password": password
+    }
+
+def create_pool(conn_info: dict, minconn: int = POOL_MIN_CONNECTIONS, maxconn: int = POOL_MAX_CONNECTIONS):
+    """Connection pool dùng chung giữa các thread, tránh mở kết nối mới cho mỗi lần truy vấn."""
+    return pg_pool.ThreadedConnectionPool(minconn, maxconn, **conn_info)
+
+@contextmanager
+def pooled_connection(pool):
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        # Kết thúc transaction (và cursor phía server) trước khi trả kết nối về pool
+        conn.rollback()
+        pool.putconn(conn)
+
+def feature_conditions(fields, customer_ids=None, where: str = None, params=()):
+    """Kiểm tra tên cột và dựng (danh sách điều kiện SQL, tham số) cho các truy vấn hàng loạt."""
+    for field in fields:
+        if field not in FIELDS:
+            raise ValueError(f"Unknown field: {field}")
+    conditions, query_params = [], []
+    if customer_ids is not None:
+        conditions.append("c.CustomerID = ANY(%s)")
+        query_params.append(list(customer_ids))
+    if where:
+        conditions.append(f"({where})")
+        query_params.extend(params)
+    return conditions, query_params
 
-# Thông tin kết nối PostgreSQL
-conn_info = {
-    "host": "localhost",
-    "port": 5432,
-    "dbname": "msb_db",  
-    "user": "postgres", 
-    "password": f"{passw}"      
-}
+def find_incomplete_customers(pool, fields=FIELDS, customer_ids=None, where: str = None, params=()) -> list:
+    """
+    CustomerID (theo thứ tự) mà iter_feature_batches bỏ qua với cùng tham số: không có dòng Data
+    hoặc có cột chỉ số NULL. NULL mà đóng gói vào slot sẽ thành NaN và làm hỏng cả ciphertext.
+    """
+    conditions, query_params = feature_conditions(fields, customer_ids, where, params)
+    conditions.append(f"(d.CustomerID IS NULL OR {' OR '.join(f'd.{field} IS NULL' for field in fields)})")
+    with pooled_connection(pool) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT c.CustomerID
+                FROM Customer c LEFT JOIN Data d ON d.CustomerID = c.CustomerID
+                WHERE {" AND ".join(conditions)}
+                ORDER BY c.CustomerID
+            """, query_params)
+            return [row[0] for row in cursor.fetchall()]
 
-def get_credit_scores_by_name():
+def iter_feature_batches(pool, fields=FIELDS, customer_ids=None, where: str = None, params=(),
+                         batch_size: int = BATCH_SIZE):
+    """
+    Đọc Customer JOIN Data bằng một truy vấn, cursor phía server trả về mỗi lần batch_size dòng.
+    Mỗi lô: (mảng CustomerID, {tên cột: mảng float64}), theo thứ tự CustomerID.
+    Khách hàng có cột chỉ số NULL bị bỏ qua; find_incomplete_customers liệt kê các khách hàng này.
+    customer_ids: chỉ lấy các khách hàng này.
+    where: điều kiện SQL bổ sung trên bảng c (Customer) / d (Data), giá trị truyền qua params với %s,
+    vd. where="d.Spayment >= %s", params=(0.5,). Chỉ dùng với điều kiện do chương trình tạo ra.
+    """
+    conditions, query_params = feature_conditions(fields, customer_ids, where, params)
+    conditions.extend(f"d.{field} IS NOT NULL" for field in fields)
+    query = f"""
+        SELECT c.CustomerID, {", ".join(f"d.{field}" for field in fields)}
+        FROM Customer c JOIN Data d ON d.CustomerID = c.CustomerID
+        WHERE {" AND ".join(conditions)}
+        ORDER BY c.CustomerID
+    """
+
+    with pooled_connection(pool) as conn:
+        with conn.cursor(name="feature_extraction") as cursor:
+            cursor.execute(query, query_params)
+            while rows := cursor.fetchmany(batch_size):
+                customer_ids_array = np.array([row[0] for row in rows])
+                values = np.array([row[1:] for row in rows], dtype=np.float64)
+                yield customer_ids_array, {field: values[:, i] for i, field in enumerate(fields)}
+
+def load_features(pool, fields=FIELDS, customer_ids=None, where: str = None, params=(),
+                  batch_size: int = BATCH_SIZE):
+    """Đọc toàn bộ kết quả thành một mảng CustomerID và một mảng cho mỗi cột."""
+    id_chunks, column_chunks = [], {field: [] for field in fields}
+    for ids, columns in iter_feature_batches(pool, fields, customer_ids, where, params, batch_size):
+        id_chunks.append(ids)
+        for field in fields:
+            column_chunks[field].append(columns[field])
+    if not id_chunks:
+        return np.array([]), {field: np.array([], dtype=np.float64) for field in fields}
+    return np.concatenate(id_chunks), {field: np.concatenate(chunks) for field, chunks in column_chunks.items()}
+
+def get_credit_scores_by_name(pool):
     try:
-        conn = psycopg2.connect(**conn_info)
-        cursor = conn.cursor()
         name = input("Input customer name: ").strip()
-        # Truy vấn lấy CustomerID
-        cursor.execute("SELECT CustomerID FROM Customer WHERE Name = %s", (name,))
-        result = cursor.fetchone()
+        with pooled_connection(pool) as conn:
+            with conn.cursor() as cursor:
+                # Một truy vấn JOIN thay vì tra Customer rồi mới tra Data
+                cursor.execute(f"""
+                    SELECT c.CustomerID, {", ".join(f"d.{field}" for field in FIELDS)}
+                    FROM Customer c LEFT JOIN Data d ON d.CustomerID = c.CustomerID
+                    WHERE c.Name = %s
+                """, (name,))
+                result = cursor.fetchone()
 
         if not result:
             print("Không tìm thấy khách hàng:", name)
             return
 
-        customer_id = result[0]
-
-        # Truy vấn bảng Data
-        cursor.execute("""
-            SELECT Spayment, Sutil, Slength, Screditmix,
-                   Sinquiries, Sincomestability, Sbehaviorial
-            FROM Data
-            WHERE CustomerID = %s
-        """, (customer_id,))
-        data = cursor.fetchone()
-
-        if data:
+        data = result[1:]
+        if any(value is not None for value in data):
             print(f"Chỉ số tín dụng của '{name}':")
-            fields = ["Spayment", "Sutil", "Slength", "Screditmix",
-                      "Sinquiries", "Sincomestability", "Sbehaviorial"]
-            for field, value in zip(fields, data):
+            for field, value in zip(FIELDS, data):
                 print(f"  {field}: {value}")
         else:
             print(f"Không có dữ liệu tín dụng cho khách hàng '{name}'")
 
-        cursor.close()
-        conn.close()
-
     except Exception as e:
         print("Lỗi kết nối/truy vấn:", e)
 
-
-# Ví dụ dùng
-get_credit_scores_by_name()
+if __name__ == "__main__":
+    passw = getpass("Get PostgreSQL password: ")
+    connection_pool = create_pool(get_conn_info(passw))
+    try:
+        # Ví dụ dùng
+        get_credit_scores_by_name(connection_pool)
+    finally:
+        connection_pool.closeall()
@@ -0,0 +1,133 @@
+"""
+File: aggregateParts.py
+Mô tả: Bên tổng hợp gộp các phần EvalMultKey cuối cùng hoặc các phần giải mã từ mọi ngân hàng
+Chức năng chính:
+- Nhận danh sách phần từ một thư mục hoặc file manifest thay vì nhập từng đường dẫn
+- Gộp EvalMultKey lần lượt khi đọc từng phần, chỉ giữ khóa đang gộp và phần vừa đọc trong bộ nhớ
+- Ghép các phần giải mã để lấy điểm tín dụng
+Các hàm của OpenFHE không nhả GIL nên đọc/gộp bằng thread không nhanh hơn; số phần bằng số ngân hàng
+nên gộp tuần tự là đủ.
+Ví dụ:
+    python aggregateParts.py eval-keys Received/final_parts/ -o Keys/evalMultKey_merged.txt
+    python aggregateParts.py decryptions partials.txt --customers 100
+"""
+
+import os
+import json
+import argparse
+import openfhe as fhe
+from fheParameters import BATCH_SIZE, MULTIPLICATIVE_DEPTH, SCALING_MOD_SIZE
+
+def make_crypto_context():
+    parameters = fhe.CCParamsCKKSRNS()
+    parameters.SetMultiplicativeDepth(MULTIPLICATIVE_DEPTH)  # Độ sâu tối đa cho phép nhân
+    parameters.SetScalingModSize(SCALING_MOD_SIZE)  # Kích thước hệ số tỷ lệ
+    parameters.SetBatchSize(BATCH_SIZE)    # Số lượng slot xử lý hàng loạt
+
+    cc = fhe.GenCryptoContext(parameters)
+    cc.Enable(fhe.PKESchemeFeature.PKE)           # Mã hóa công khai cơ bản
+    cc.Enable(fhe.PKESchemeFeature.KEYSWITCH)     # Chuyển đổi khóa
+    cc.Enable(fhe.PKESchemeFeature.LEVELEDSHE)    # Mã hóa đồng hình có cấp độ
+    cc.Enable(fhe.PKESchemeFeature.ADVANCEDSHE)   # Mã hóa đồng hình nâng cao
+    cc.Enable(fhe.PKESchemeFeature.MULTIPARTY)    # Hỗ trợ nhiều bên
+    return cc
+
+def resolve_part_paths(source: str) -> list:
+    """
+    source là thư mục (mọi file trong đó, theo thứ tự tên, bỏ qua file .json metadata và file ẩn)
+    hoặc manifest: file JSON chứa danh sách đường dẫn, hoặc file text mỗi dòng một đường dẫn.
+    Đường dẫn tương đối trong manifest tính từ thư mục chứa manifest.
+    """
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in sorted(os.listdir(source))
+                 if not name.endswith(".json") and not name.startswith(".")
+                 and os.path.isfile(os.path.join(source, name))]
+    else:
+        with open(source, "r") as f:
+            content = f.read()
+        try:
+            entries = json.loads(content)
+        except json.JSONDecodeError:
+            entries = [line.strip() for line in content.splitlines() if line.strip() and not line.startswith("#")]
+        base_dir = os.path.dirname(os.path.abspath(source))
+        paths = [entry if os.path.isabs(entry) else os.path.join(base_dir, entry) for entry in entries]
+
+    for path in paths:
+        if not os.path.exists(path):
+            raise Exception(f"File '{path}' does not exist.")
+    if not paths:
+        raise Exception(f"No parts found in '{source}'.")
+    return paths
+
+def load_eval_key(path: str):
+    with open(path, 'rb') as f:
+        eval_key = fhe.DeserializeEvalKeyString(f.read(), fhe.BINARY)
+    if not isinstance(eval_key, fhe.EvalKey):
+        raise Exception(f"Invalid EvalKey type in '{path}'.")
+    return eval_key
+
+def load_ciphertext(path: str):
+    with open(path, 'rb') as f:
+        ciphertext = fhe.DeserializeCiphertextString(f.read(), fhe.BINARY)
+    if not isinstance(ciphertext, fhe.Ciphertext):
+        raise Exception(f"Invalid ciphertext in '{path}'.")
+    return ciphertext
+
+def merge_eval_keys(cc, eval_keys):
+    """eval_keys có thể là generator: mỗi phần được gộp ngay khi đọc rồi bỏ đi."""
+    merged_key = None
+    for eval_key in eval_keys:
+        if merged_key is None:
+            merged_key = eval_key
+        else:
+            merged_key = cc.MultiAddEvalMultKeys(merged_key, eval_key, merged_key.GetKeyTag())
+    if merged_key is None:
+        raise Exception("No EvalMultKey parts to merge.")
+    return merged_key
+
+def merge_eval_key_files(cc, source: str, output_path: str):
+    paths = resolve_part_paths(source)
+    print(f"Merging {len(paths)} final EvalMultKey parts...")
+    merged_key = merge_eval_keys(cc, map(load_eval_key, paths))
+    merged_bytes = fhe.Serialize(merged_key, fhe.BINARY)
+    if not merged_bytes:
+        raise Exception("Cannot serialize merged EvalMultKey.")
+    with open(output_path, 'wb') as f:
+        f.write(merged_bytes)
+    print(f"Final merged EvalMultKey saved to: {output_path}")
+
+def fuse_partial_decryption_files(cc, source: str, customer_count: int = 1) -> list:
+    """Ghép các phần giải mã, trả về điểm tín dụng (thang 300 - 850) của từng khách hàng."""
+    if not 1 <= customer_count <= BATCH_SIZE:
+        raise Exception(f"Customer count must be between 1 and {BATCH_SIZE}.")
+    paths = resolve_part_paths(source)
+    print(f"Merging {len(paths)} partial decryptions...")
+    # MultipartyDecryptFusion cần toàn bộ danh sách các phần
+    part_decryptions = [load_ciphertext(path) for path in paths]
+    result_ptxt = cc.MultipartyDecryptFusion(part_decryptions)
+    result_ptxt.SetLength(customer_count)
+    raw_scores = result_ptxt.GetRealPackedValue()[:customer_count]
+    return [300 + (raw_score * 550) for raw_score in raw_scores]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gộp các phần EvalMultKey hoặc phần giải mã từ thư mục/manifest")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    eval_parser = subparsers.add_parser("eval-keys", help="Gộp các phần EvalMultKey cuối cùng")
+    eval_parser.add_argument("source", help="Thư mục hoặc manifest các phần")
+    eval_parser.add_argument("-o", "--output", default=os.path.join("Keys", "evalMultKey_merged.txt"))
+    decrypt_parser = subparsers.add_parser("decryptions", help="Ghép các phần giải mã")
+    decrypt_parser.add_argument("source", help="Thư mục hoặc manifest các phần")
+    decrypt_parser.add_argument("--customers", type=int, default=1, help="Số khách hàng trong ciphertext kết quả")
+    args = parser.parse_args()
+
+    cc = make_crypto_context()
+    if args.command == "eval-keys":
+        merge_eval_key_files(cc, args.source, args.output)
+    else:
+        credit_scores = fuse_partial_decryption_files(cc, args.source, args.customers)
+        print("\n=== Final Decryption Result ===")
+        if len(credit_scores) == 1:
+            print("Credit score:", credit_scores[0])
+        else:
+            for i, credit_score in enumerate(credit_scores):
+                print(f"Customer #{i + 1} credit score: {credit_score}")
@@ -0,0 +1,231 @@
+"""
+File: batchDecrypt.py
+Mô tả: Giải mã đa bên nhiều ciphertext kết quả trong một vòng trao đổi giữa các ngân hàng
+Chức năng chính:
+- Mỗi ngân hàng giải mã từng phần mọi kết quả trong thư mục/manifest bằng process pool
+- Các phần giải mã được gói trong một bundle duy nhất để gửi cho bên tổng hợp
+- Bên tổng hợp ghép các bundle và xuất điểm tín dụng (thang 300 - 850) ra file CSV
+Ví dụ:
+    python batchDecrypt.py partial Received/ --key Keys/MSB_privateKey.txt --lead
+    python batchDecrypt.py partial Received/ --key Keys/MSB_privateKey.txt --batches Encrypted/batches.json
+    python batchDecrypt.py fuse Received/bundles/ -o scores.csv
+Số khách hàng của từng ciphertext lấy theo thứ tự:
+- manifest kết quả dạng JSON {đường dẫn: số khách hàng}
+- batches.json của bulkEncrypt.py (--batches), với file kết quả đặt tên theo lô (batch_00000.bin)
+- file <kết quả>.json do sendToFECredit.py ghi cạnh kết quả
+- --customers; thiếu cả bốn thì báo lỗi thay vì đoán, vì đoán sai sẽ cắt mất điểm của khách hàng
+"""
+
+import os
+import csv
+import json
+import zipfile
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import openfhe as fhe
+from aggregateParts import make_crypto_context, resolve_part_paths, BATCH_SIZE
+
+# Số process giải mã song song
+DECRYPT_WORKERS = int(os.environ.get("DECRYPT_WORKERS", os.cpu_count() or 1))
+# Tên file mô tả nội dung bên trong bundle
+BUNDLE_MANIFEST = "manifest.json"
+
+# CryptoContext và private key của từng worker process, khởi tạo một lần
+_crypto_context = None
+_private_key = None
+
+def init_worker(private_key_path: str = None):
+    global _crypto_context, _private_key
+    _crypto_context = make_crypto_context()
+    if private_key_path is not None:
+        _private_key, result = fhe.DeserializePrivateKey(private_key_path, fhe.BINARY)
+        if not result:
+            raise Exception("Cannot deserialize private key.")
+
+def make_executor(private_key_path: str = None) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=DECRYPT_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(private_key_path,)
+    )
+
+def chunk(items: list, count: int) -> list:
+    """Chia items thành tối đa count phần liên tiếp, giữ nguyên thứ tự."""
+    size = -(-len(items) // max(1, count))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def read_batch_counts(batches_path: str) -> dict:
+    """Số khách hàng theo tên lô trong batches.json của bulkEncrypt.py."""
+    with open(batches_path, "r") as f:
+        index = json.load(f)
+    return {name: int(batch["customer_count"]) for name, batch in index["batches"].items()}
+
+def read_result_count(path: str):
+    """Số khách hàng sendToFECredit.py ghi cạnh kết quả (<kết quả>.json), None nếu không có."""
+    info_path = path + ".json"
+    if not os.path.exists(info_path):
+        return None
+    with open(info_path, "r") as f:
+        return int(json.load(f)["customer_count"])
+
+def resolve_results(source: str, default_count: int = None, batches_path: str = None) -> list:
+    """
+    Trả về [(đường dẫn, số khách hàng)]. Số khách hàng lấy từ manifest JSON dạng object, batches.json,
+    file <kết quả>.json hoặc default_count; báo lỗi nếu không nguồn nào có.
+    """
+    batch_counts = read_batch_counts(batches_path) if batches_path else {}
+    customer_counts = {}
+    if os.path.isfile(source) and source.endswith(".json"):
+        with open(source, "r") as f:
+            entries = json.load(f)
+        if isinstance(entries, dict):
+            base_dir = os.path.dirname(os.path.abspath(source))
+            customer_counts = {os.path.join(base_dir, path): int(count) for path, count in entries.items()}
+            paths = list(customer_counts)
+            for path in paths:
+                if not os.path.exists(path):
+                    raise Exception(f"File '{path}' does not exist.")
+    if not customer_counts:
+        paths = resolve_part_paths(source)
+
+    results = []
+    for path in paths:
+        count = customer_counts.get(path)
+        if count is None:
+            count = batch_counts.get(os.path.splitext(os.path.basename(path))[0])
+        if count is None:
+            count = read_result_count(path)
+        if count is None:
+            count = default_count
+        if count is None:
+            raise Exception(f"Customer count of '{path}' is unknown: use a manifest, --batches or --customers.")
+        results.append((path, count))
+    for path, count in results:
+        if not 1 <= count <= BATCH_SIZE:
+            raise Exception(f"Customer count of '{path}' must be between 1 and {BATCH_SIZE}.")
+    names = [os.path.basename(path) for path, _ in results]
+    if len(set(names)) != len(names):
+        raise Exception("Result files must have distinct names.")
+    return results
+
+def partial_decrypt_chunk(paths: list, lead: bool) -> list:
+    """Chạy trong worker: giải mã từng phần một nhóm ciphertext bằng một lần gọi Lead/Main."""
+    ciphertexts = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            ciphertext = fhe.DeserializeCiphertextString(f.read(), fhe.BINARY)
+        if not isinstance(ciphertext, fhe.Ciphertext):
+            raise Exception(f"Invalid ciphertext in '{path}'.")
+        ciphertexts.append(ciphertext)
+    if lead:
+        partials = _crypto_context.MultipartyDecryptLead(ciphertexts, _private_key)
+    else:
+        partials = _crypto_context.MultipartyDecryptMain(ciphertexts, _private_key)
+    return [fhe.Serialize(partial, fhe.BINARY) for partial in partials]
+
+def create_partial_bundle(source: str, private_key_path: str, lead: bool, bundle_path: str,
+                          bank_name: str = "", default_count: int = None, batches_path: str = None):
+    """Giải mã từng phần mọi kết quả trong source và ghi một bundle duy nhất."""
+    results = resolve_results(source, default_count, batches_path)
+    paths = [path for path, _ in results]
+    print(f"Partially decrypting {len(paths)} results with {DECRYPT_WORKERS} workers...")
+
+    with make_executor(private_key_path) as executor:
+        chunks = chunk(paths, DECRYPT_WORKERS)
+        partials = [data for chunk_partials in executor.map(partial_decrypt_chunk, chunks, [lead] * len(chunks))
+                    for data in chunk_partials]
+
+    manifest = {
+        "bank": bank_name,
+        "lead": lead,
+        "results": [{"name": os.path.basename(path), "customer_count": count} for path, count in results],
+    }
+    # Ciphertext gần như không nén được nên lưu nguyên (ZIP_STORED)
+    tmp_path = bundle_path + ".tmp"
+    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_STORED) as bundle:
+        bundle.writestr(BUNDLE_MANIFEST, json.dumps(manifest, indent=2))
+        for (path, _), data in zip(results, partials):
+            bundle.writestr(os.path.basename(path), data)
+    os.replace(tmp_path, bundle_path)
+    print(f"Partial decryption bundle saved to: {bundle_path}")
+
+def read_bundle_manifest(bundle_path: str) -> dict:
+    with zipfile.ZipFile(bundle_path) as bundle:
+        return json.loads(bundle.read(BUNDLE_MANIFEST))
+
+def fuse_chunk(bundle_paths: list, results: list) -> list:
+    """Chạy trong worker: ghép phần giải mã của một nhóm kết quả từ mọi bundle, trả về điểm từng khách hàng."""
+    bundles = [zipfile.ZipFile(path) for path in bundle_paths]
+    try:
+        scores = []
+        for name, customer_count in results:
+            part_decryptions = []
+            for bundle in bundles:
+                part = fhe.DeserializeCiphertextString(bundle.read(name), fhe.BINARY)
+                if not isinstance(part, fhe.Ciphertext):
+                    raise Exception(f"Invalid partial decryption '{name}' in '{bundle.filename}'.")
+                part_decryptions.append(part)
+            result_ptxt = _crypto_context.MultipartyDecryptFusion(part_decryptions)
+            result_ptxt.SetLength(customer_count)
+            raw_scores = result_ptxt.GetRealPackedValue()[:customer_count]
+            scores.append([300 + (raw_score * 550) for raw_score in raw_scores])
+        return scores
+    finally:
+        for bundle in bundles:
+            bundle.close()
+
+def fuse_bundles(source: str, output_csv: str) -> int:
+    """Ghép các bundle của mọi ngân hàng và ghi CSV (result, customer_index, credit_score); trả về số khách hàng."""
+    bundle_paths = resolve_part_paths(source)
+    manifests = [read_bundle_manifest(path) for path in bundle_paths]
+
+    # Mọi bundle phải chứa cùng danh sách kết quả, và đúng một bundle từ bên lead
+    results = [(r["name"], r["customer_count"]) for r in manifests[0]["results"]]
+    for path, manifest in zip(bundle_paths, manifests):
+        if [(r["name"], r["customer_count"]) for r in manifest["results"]] != results:
+            raise Exception(f"Bundle '{path}' does not cover the same results as '{bundle_paths[0]}'.")
+    lead_count = sum(1 for manifest in manifests if manifest["lead"])
+    if lead_count != 1:
+        raise Exception(f"Exactly one lead bundle is required, found {lead_count}.")
+    print(f"Fusing {len(results)} results from {len(bundle_paths)} bundles with {DECRYPT_WORKERS} workers...")
+
+    with make_executor() as executor:
+        chunks = chunk(results, DECRYPT_WORKERS)
+        scores = [s for chunk_scores in executor.map(fuse_chunk, [bundle_paths] * len(chunks), chunks)
+                  for s in chunk_scores]
+
+    customer_total = 0
+    with open(output_csv, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["result", "customer_index", "credit_score"])
+        for (name, _), credit_scores in zip(results, scores):
+            for i, credit_score in enumerate(credit_scores):
+                writer.writerow([name, i + 1, f"{credit_score:.2f}"])
+            customer_total += len(credit_scores)
+    print(f"{customer_total} credit scores saved to: {output_csv}")
+    return customer_total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Giải mã đa bên nhiều kết quả trong một vòng")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    partial_parser = subparsers.add_parser("partial", help="Giải mã từng phần và tạo bundle")
+    partial_parser.add_argument("source", help="Thư mục hoặc manifest các ciphertext kết quả")
+    partial_parser.add_argument("--key", required=True, help="Private key của ngân hàng")
+    partial_parser.add_argument("--lead", action="store_true", help="Ngân hàng lead của lần giải mã")
+    partial_parser.add_argument("--bank", default="MSB")
+    partial_parser.add_argument("--batches", help="batches.json của bulkEncrypt.py, file kết quả đặt tên theo lô")
+    partial_parser.add_argument("--customers", type=int,
+                                help="Số khách hàng mỗi ciphertext nếu manifest, --batches và <kết quả>.json không ghi")
+    partial_parser.add_argument("-o", "--output", help="Mặc định Keys/<bank>_partialBundle.zip")
+    fuse_parser = subparsers.add_parser("fuse", help="Ghép các bundle thành điểm tín dụng")
+    fuse_parser.add_argument("source", help="Thư mục hoặc manifest các bundle")
+    fuse_parser.add_argument("-o", "--output", default="creditScores.csv")
+    args = parser.parse_args()
+
+    if args.command == "partial":
+        output = args.output or os.path.join("Keys", f"{args.bank}_partialBundle.zip")
+        create_partial_bundle(args.source, args.key, args.lead, output, args.bank, args.customers, args.batches)
+    else:
+        fuse_bundles(args.source, args.output)
@@ -0,0 +1,249 @@
+"""
+File: bulkEncrypt.py
+Mô tả: Mã hóa toàn bộ danh mục khách hàng của một ngân hàng, không cần giao diện
+Chức năng chính:
+- Đọc các chỉ số tín dụng từ file CSV hoặc từ PostgreSQL (DBService/getCustomerInfo.py, chế độ hàng loạt)
+- Mỗi lô tối đa BATCH_SIZE khách hàng, mỗi khách hàng một slot, mỗi chỉ số một ciphertext
+- Mã hóa bằng joint public key trên process pool
+- Ghi ciphertext vào thư mục đầu ra có chỉ mục: batches.json (lô -> file, SHA-256)
+  và manifest.csv (khách hàng -> lô, slot); khách hàng thiếu chỉ số trong DB ghi vào skipped.csv
+- Báo cáo tốc độ theo số khách hàng mỗi giây
+Ví dụ:
+    python bulkEncrypt.py --public-key Keys/jointPublicKey.txt --csv customers.csv --bank MSB \
+        --features S_payment S_util S_length -o Encrypted/
+Mỗi thư mục batch_XXXXX chứa ciphertext_{bank}_{chỉ số}.txt như interactiveEncrypt.py,
+gửi cho FE Credit bằng sendToFECredit.py với số khách hàng ghi trong batches.json.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
+from getpass import getpass
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+import openfhe as fhe
+from fheParameters import BATCH_SIZE, MULTIPLICATIVE_DEPTH, SCALING_MOD_SIZE
+
+# Số process mã hóa song song
+ENCRYPT_WORKERS = int(os.environ.get("ENCRYPT_WORKERS", os.cpu_count() or 1))
+
+# Tên chỉ số (như HEServer và sendToFECredit) -> tên cột trong bảng Data
+FEATURE_COLUMNS = {
+    'S_payment': 'Spayment',
+    'S_util': 'Sutil',
+    'S_length': 'Slength',
+    'S_creditmix': 'Screditmix',
+    'S_inquiries': 'Sinquiries',
+    'S_behavioral': 'Sbehaviorial',
+    'S_incomestability': 'Sincomestability',
+}
+
+# CryptoContext và public key của từng worker process, khởi tạo một lần
+_crypto_context = None
+_public_key = None
+
+def make_crypto_context():
+    parameters = fhe.CCParamsCKKSRNS()
+    parameters.SetMultiplicativeDepth(MULTIPLICATIVE_DEPTH)
+    parameters.SetScalingModSize(SCALING_MOD_SIZE)
+    parameters.SetBatchSize(BATCH_SIZE)
+
+    cc = fhe.GenCryptoContext(parameters)
+    cc.Enable(fhe.PKESchemeFeature.PKE)
+    cc.Enable(fhe.PKESchemeFeature.LEVELEDSHE)
+    cc.Enable(fhe.PKESchemeFeature.ADVANCEDSHE)
+    return cc
+
+def init_worker(public_key_path: str):
+    global _crypto_context, _public_key
+    _crypto_context = make_crypto_context()
+    _public_key, result = fhe.DeserializePublicKey(public_key_path, fhe.BINARY)
+    if not result:
+        raise Exception("Cannot deserialize public key.")
+
+def write_atomic(path: str, data: bytes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def encrypt_batch(output_dir: str, batch_name: str, bank_name: str, columns: dict) -> dict:
+    """
+    Chạy trong worker: mã hóa mỗi chỉ số của một lô thành một ciphertext, ghi ra output_dir/batch_name.
+    Đường dẫn trả về tính từ output_dir.
+    """
+    batch_dir = os.path.join(output_dir, batch_name)
+    os.makedirs(batch_dir, exist_ok=True)
+    files = {}
+    for feature, values in columns.items():
+        plaintext = _crypto_context.MakeCKKSPackedPlaintext(np.asarray(values, dtype=np.float64).tolist())
+        ciphertext = _crypto_context.Encrypt(_public_key, plaintext)
+        serialized = fhe.Serialize(ciphertext, fhe.BINARY)
+        if not serialized:
+            raise Exception(f"Cannot serialize ciphertext for {feature}.")
+        filename = f"ciphertext_{bank_name}_{feature}.txt"
+        write_atomic(os.path.join(batch_dir, filename), serialized)
+        files[feature] = {
+            "path": os.path.join(batch_name, filename),
+            "sha256": hashlib.sha256(serialized).hexdigest(),
+            "size": len(serialized),
+        }
+    return files
+
+def read_csv_batches(path: str, features: list, slots: int):
+    """
+    Mỗi dòng: customer_id và các cột chỉ số (tên như FEATURE_COLUMNS, key hoặc value).
+    Trả về từng lô (danh sách customer_id, {chỉ số: mảng giá trị}) tối đa slots khách hàng.
+    """
+    def make_batch(ids, rows):
+        values = np.array(rows, dtype=np.float64)
+        return ids, {feature: values[:, i] for i, feature in enumerate(features)}
+
+    with open(path, newline='') as f:
+        ids, rows = [], []
+        for row in csv.DictReader(f):
+            values = []
+            for feature in features:
+                value = row.get(feature, row.get(FEATURE_COLUMNS[feature]))
+                if value is None:
+                    raise Exception(f"Column '{feature}' not found in {path}.")
+                values.append(float(value))
+            ids.append(row["customer_id"])
+            rows.append(values)
+            if len(ids) == slots:
+                yield make_batch(ids, rows)
+                ids, rows = [], []
+        if ids:
+            yield make_batch(ids, rows)
+
+def read_db_batches(conn_info: dict, features: list, slots: int, customer_ids=None, skipped_path: str = None):
+    """
+    Đọc theo lô bằng getCustomerInfo (một truy vấn JOIN, cursor phía server), đổi tên cột thành tên chỉ số.
+    Khách hàng thiếu chỉ số (NULL) không được mã hóa; CustomerID của họ được ghi vào skipped_path.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "DBService"))
+    import getCustomerInfo
+
+    pool = getCustomerInfo.create_pool(conn_info)
+    try:
+        fields = [FEATURE_COLUMNS[feature] for feature in features]
+        skipped = getCustomerInfo.find_incomplete_customers(pool, fields, customer_ids)
+        if skipped:
+            print(f"Skipping {len(skipped)} customers with missing features"
+                  + (f", listed in {skipped_path}" if skipped_path else f": {skipped}"))
+            if skipped_path:
+                with open(skipped_path, 'w', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(["customer_id"])
+                    writer.writerows([customer_id] for customer_id in skipped)
+        for ids, columns in getCustomerInfo.iter_feature_batches(pool, fields, customer_ids, batch_size=slots):
+            yield ids.tolist(), {feature: columns[FEATURE_COLUMNS[feature]] for feature in features}
+    finally:
+        pool.closeall()
+
+def encrypt_customers(batches, features: list, public_key_path: str, output_dir: str, bank_name: str,
+                      slots: int = BATCH_SIZE) -> int:
+    """
+    Mã hóa mọi lô trong batches ((danh sách customer_id, {chỉ số: mảng giá trị}), tối đa slots
+    khách hàng mỗi lô) và ghi chỉ mục. Chỉ giữ tối đa 2 lô mỗi worker trong bộ nhớ.
+    Trả về số khách hàng đã mã hóa.
+    """
+    if not 1 <= slots <= BATCH_SIZE:
+        raise Exception(f"Slots per ciphertext must be between 1 and {BATCH_SIZE}.")
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    encrypted_batches = {}
+    customer_total = 0
+
+    manifest_path = os.path.join(output_dir, "manifest.csv")
+    with open(manifest_path + ".tmp", 'w', newline='') as manifest_file, ProcessPoolExecutor(
+        max_workers=ENCRYPT_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(public_key_path,)
+    ) as executor:
+        manifest = csv.writer(manifest_file)
+        manifest.writerow(["customer_id", "batch", "slot"])
+        pending = {}
+
+        def collect(done):
+            for future in done:
+                batch_name, customer_count = pending.pop(future)
+                encrypted_batches[batch_name] = {"customer_count": customer_count, "files": future.result()}
+
+        for index, (customer_ids, columns) in enumerate(batches):
+            if len(customer_ids) > slots:
+                raise Exception(f"Batch {index} has more than {slots} customers.")
+            batch_name = f"batch_{index:05d}"
+            future = executor.submit(encrypt_batch, output_dir, batch_name, bank_name, columns)
+            pending[future] = (batch_name, len(customer_ids))
+            for slot, customer_id in enumerate(customer_ids):
+                manifest.writerow([customer_id, batch_name, slot])
+            customer_total += len(customer_ids)
+
+            if len(pending) >= 2 * ENCRYPT_WORKERS:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+                encrypted = sum(b['customer_count'] for b in encrypted_batches.values())
+                print(f"Encrypted {encrypted} customers "
+                      f"({encrypted / (time.perf_counter() - start):.1f} customers/s)", end="\r")
+        collect(wait(pending)[0])
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    with open(os.path.join(output_dir, "batches.json"), 'w') as f:
+        json.dump({
+            "bank": bank_name,
+            "features": features,
+            "slots": slots,
+            "batches": dict(sorted(encrypted_batches.items())),
+        }, f, indent=2)
+
+    elapsed = time.perf_counter() - start
+    print(f"\nEncrypted {customer_total} customers in {len(encrypted_batches)} batches, {elapsed:.2f}s "
+          f"({customer_total / elapsed if elapsed > 0 else 0:.1f} customers/s, {ENCRYPT_WORKERS} workers)")
+    print(f"Index: {manifest_path}, {os.path.join(output_dir, 'batches.json')}")
+    return customer_total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mã hóa hàng loạt chỉ số tín dụng bằng joint public key")
+    parser.add_argument("--public-key", default=os.path.join("Keys", "jointPublicKey.txt"))
+    parser.add_argument("--bank", default="MSB")
+    parser.add_argument("--features", nargs="+", choices=list(FEATURE_COLUMNS), default=list(FEATURE_COLUMNS),
+                        help="Các chỉ số ngân hàng này đóng góp")
+    parser.add_argument("--slots", type=int, default=BATCH_SIZE, help="Số khách hàng mỗi ciphertext")
+    parser.add_argument("-o", "--output", default="Encrypted")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="File CSV có cột customer_id và các cột chỉ số")
+    source.add_argument("--db", action="store_true", help="Đọc từ PostgreSQL (Customer JOIN Data)")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5432)
+    parser.add_argument("--dbname", default="msb_db")
+    parser.add_argument("--user", default="postgres")
+    parser.add_argument("--ids", help="File chứa danh sách CustomerID cần mã hóa, mỗi dòng một ID (chỉ với --db)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.public_key):
+        raise Exception(f"File '{args.public_key}' does not exist.")
+    if args.csv:
+        batches = read_csv_batches(args.csv, args.features, args.slots)
+    else:
+        conn_info = {
+            "host": args.host,
+            "port": args.port,
+            "dbname": args.dbname,
+            "user": args.user,
+            "password": getpass("Get PostgreSQL password: "),
+        }
+        customer_ids = None
+        if args.ids:
+            with open(args.ids) as f:
+                customer_ids = [int(line) for line in f if line.strip()]
+        os.makedirs(args.output, exist_ok=True)
+        batches = read_db_batches(conn_info, args.features, args.slots, customer_ids,
+                                  os.path.join(args.output, "skipped.csv"))
+    encrypt_customers(batches, args.features, args.public_key, args.output, args.bank, args.slots)
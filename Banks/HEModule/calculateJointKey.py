@@ -9,7 +9,7 @@ Chức năng chính:
 
 import os
 import openfhe as fhe
-
+from fheParameters import BATCH_SIZE, MULTIPLICATIVE_DEPTH, SCALING_MOD_SIZE
 
 def ensure_dir(path):
     """
@@ -44,9 +44,9 @@ if __name__ == "__main__":
 
     # 1. Thiết lập môi trường mã hóa CKKS
     parameters = fhe.CCParamsCKKSRNS()
-    parameters.SetMultiplicativeDepth(15)  # Độ sâu tối đa cho phép nhân
-    parameters.SetScalingModSize(59)       # Kích thước hệ số tỷ lệ
-    parameters.SetBatchSize(1)             # Số lượng slot xử lý hàng loạt
+    parameters.SetMultiplicativeDepth(MULTIPLICATIVE_DEPTH)  # Độ sâu tối đa cho phép nhân
+    parameters.SetScalingModSize(SCALING_MOD_SIZE)  # Kích thước hệ số tỷ lệ
+    parameters.SetBatchSize(BATCH_SIZE)    # Số lượng slot xử lý hàng loạt
 
     # Khởi tạo context mã hóa và bật các tính năng cần thiết
     cc = fhe.GenCryptoContext(parameters)
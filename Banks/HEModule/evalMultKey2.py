@@ -9,6 +9,8 @@ Chức năng chính:
 
 import os
 import openfhe as fhe
+from fheParameters import BATCH_SIZE, MULTIPLICATIVE_DEPTH, SCALING_MOD_SIZE
+from aggregateParts import merge_eval_key_files
 
 def save_file(file_path: str, data: bytes) -> None:
     """
@@ -43,9 +45,9 @@ if __name__ == "__main__":
 
     # Thiết lập môi trường mã hóa CKKS
     parameters = fhe.CCParamsCKKSRNS()
-    parameters.SetMultiplicativeDepth(15)  # Độ sâu tối đa cho phép nhân
-    parameters.SetScalingModSize(59)       # Kích thước hệ số tỷ lệ
-    parameters.SetBatchSize(1)             # Số lượng slot xử lý hàng loạt
+    parameters.SetMultiplicativeDepth(MULTIPLICATIVE_DEPTH)  # Độ sâu tối đa cho phép nhân
+    parameters.SetScalingModSize(SCALING_MOD_SIZE)  # Kích thước hệ số tỷ lệ
+    parameters.SetBatchSize(BATCH_SIZE)    # Số lượng slot xử lý hàng loạt
 
     # Khởi tạo context mã hóa và bật các tính năng cần thiết
     cc = fhe.GenCryptoContext(parameters)
@@ -92,30 +94,9 @@ if __name__ == "__main__":
     if is_aggregator == 'y':
         print("Now merging all final EvalMultKey parts...")
 
-        # Nhập số lượng phần khóa cần gộp
-        num_parts = int(input("How many final EvalMultKey parts to merge?: "))
-        final_keys = []
-
-        # Tải từng phần khóa
-        for i in range(num_parts):
-            path = input(f"Path to final EvalMultKey part #{i + 1}: ").strip()
-            if not os.path.exists(path):
-                raise Exception(f"File '{path}' does not exist.")
-            
-            with open(path, 'rb') as f:
-                part_bytes = f.read()
-            key_part = fhe.DeserializeEvalKeyString(part_bytes, fhe.BINARY)
-            final_keys.append(key_part)
-
-        # Gộp tuần tự các phần khóa
-        merged_key = final_keys[0]
-        for i in range(1, num_parts):
-            merged_key = cc.MultiAddEvalMultKeys(merged_key, final_keys[i], merged_key.GetKeyTag())
-
-        # Lưu khóa đã gộp
-        merged_path = os.path.join(key_dir, "evalMultKey_merged.txt")
-        print("Serializing merged EvalMultKey...")
-        merged_bytes = fhe.Serialize(merged_key, fhe.BINARY)
-        save_file(merged_path, merged_bytes)
+        # Thư mục chứa mọi phần khóa (kể cả phần của mình) hoặc manifest liệt kê đường dẫn
+        source = input("Path to directory or manifest of final EvalMultKey parts: ").strip()
 
-        print(f"Final merged EvalMultKey saved to: {merged_path}")
+        # Đọc song song và gộp theo cây cặp đôi
+        merged_path = os.path.join(key_dir, "evalMultKey_merged.txt")
+        merge_eval_key_files(cc, source, merged_path)
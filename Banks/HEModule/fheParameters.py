@@ -0,0 +1,29 @@
+"""
+File: fheParameters.py
+Mô tả: Tham số CKKS dùng chung cho mọi script HEModule và DBService
+Chức năng chính:
+- Chọn profile bằng biến môi trường FHE_PARAMETER_PROFILE, giống HEServer:
+  standard (độ sâu 15) hoặc low_depth (độ sâu 9)
+- Số slot mỗi ciphertext lấy từ FHE_BATCH_SIZE (mặc định 4096), giống HEServer
+Mọi ngân hàng và FE Credit phải chạy với cùng FHE_PARAMETER_PROFILE và FHE_BATCH_SIZE,
+nếu không khóa và ciphertext sẽ không dùng được với CryptoContext của bên kia.
+Lưu ý: giữ đồng bộ với PARAMETER_PROFILES trong FinanceOrg/HEServer.py
+"""
+
+import os
+
+PARAMETER_PROFILES = {
+    "standard": {"multiplicative_depth": 15, "scaling_mod_size": 59},
+    "low_depth": {"multiplicative_depth": 9, "scaling_mod_size": 59},
+}
+
+PROFILE_NAME = os.environ.get("FHE_PARAMETER_PROFILE", "standard")
+if PROFILE_NAME not in PARAMETER_PROFILES:
+    raise ValueError(f"Unknown FHE_PARAMETER_PROFILE: {PROFILE_NAME} (expected one of {', '.join(PARAMETER_PROFILES)})")
+PARAMETER_PROFILE = PARAMETER_PROFILES[PROFILE_NAME]
+
+# Số slot mỗi ciphertext (số khách hàng tối đa trong một batch)
+BATCH_SIZE = int(os.environ.get("FHE_BATCH_SIZE", 4096))
+# Độ sâu nhân và kích thước hệ số tỷ lệ của context
+MULTIPLICATIVE_DEPTH = PARAMETER_PROFILE["multiplicative_depth"]
+SCALING_MOD_SIZE = PARAMETER_PROFILE["scaling_mod_size"]
@@ -11,6 +11,7 @@ import sys
 import os
 import numpy as np
 import openfhe as fhe
+from fheParameters import BATCH_SIZE, MULTIPLICATIVE_DEPTH, SCALING_MOD_SIZE
 from PyQt6 import QtWidgets, uic
 from PyQt6.QtWidgets import QFileDialog, QMessageBox
 from PyQt6.QtCore import QTimer
@@ -47,9 +48,9 @@ class MainWindow(QtWidgets.QMainWindow):
     def initialize_crypto_context(self):
         """Initialize crypto context with required parameters"""
         parameters = fhe.CCParamsCKKSRNS()
-        parameters.SetMultiplicativeDepth(15)
-        parameters.SetScalingModSize(59)
-        parameters.SetBatchSize(1)
+        parameters.SetMultiplicativeDepth(MULTIPLICATIVE_DEPTH)
+        parameters.SetScalingModSize(SCALING_MOD_SIZE)
+        parameters.SetBatchSize(BATCH_SIZE)
 
         self.cc = fhe.GenCryptoContext(parameters)
         self.cc.Enable(fhe.PKESchemeFeature.PKE)
@@ -151,10 +152,15 @@ class MainWindow(QtWidgets.QMainWindow):
             for key, value in fields.items():
                 if value.strip():  # Only include non-empty values
                     try:
-                        user_data[key] = [float(value)]
+                        # Nhiều khách hàng cách nhau bởi dấu phẩy, mỗi khách hàng một slot
+                        values = [float(v) for v in value.split(',') if v.strip()]
                     except ValueError:
                         QMessageBox.warning(self, "Cảnh báo", f"Giá trị không hợp lệ cho {key}: {value}")
                         continue
+                    if len(values) > BATCH_SIZE:
+                        QMessageBox.warning(self, "Cảnh báo", f"{key} có quá {BATCH_SIZE} giá trị")
+                        continue
+                    user_data[key] = values
 
             if not user_data:
                 QMessageBox.warning(self, "Cảnh báo", "Không có dữ liệu nào để mã hóa")
@@ -0,0 +1,103 @@
+"""
+File: keyCeremony.py
+Mô tả: Các bước của một ngân hàng trong nghi thức sinh khóa chung, thao tác trực tiếp trên bytes
+Chức năng chính:
+- Sinh đóng góp vào public key chung (như calculateJointKey.py)
+- Tích lũy tiến EvalMultKey (như evalMultKey1.py)
+- Hoàn thiện ngược EvalMultKey và gộp các phần (như evalMultKey2.py)
+- Kiểm tra EvalMultKey đã gộp thuộc đúng joint public key trước khi cài
+Được interbankAPI gọi khi ceremonyCoordinator điều phối nghi thức qua mạng.
+"""
+
+import openfhe as fhe
+from fheParameters import BATCH_SIZE, MULTIPLICATIVE_DEPTH, SCALING_MOD_SIZE
+from aggregateParts import merge_eval_keys
+
+_crypto_context = None
+
+def get_crypto_context():
+    """CryptoContext dùng chung trong process, tạo một lần."""
+    global _crypto_context
+    if _crypto_context is None:
+        parameters = fhe.CCParamsCKKSRNS()
+        parameters.SetMultiplicativeDepth(MULTIPLICATIVE_DEPTH)  # Độ sâu tối đa cho phép nhân
+        parameters.SetScalingModSize(SCALING_MOD_SIZE)  # Kích thước hệ số tỷ lệ
+        parameters.SetBatchSize(BATCH_SIZE)    # Số lượng slot xử lý hàng loạt
+
+        cc = fhe.GenCryptoContext(parameters)
+        cc.Enable(fhe.PKESchemeFeature.PKE)           # Mã hóa công khai cơ bản
+        cc.Enable(fhe.PKESchemeFeature.KEYSWITCH)     # Chuyển đổi khóa
+        cc.Enable(fhe.PKESchemeFeature.LEVELEDSHE)    # Mã hóa đồng hình có cấp độ
+        cc.Enable(fhe.PKESchemeFeature.ADVANCEDSHE)   # Mã hóa đồng hình nâng cao
+        cc.Enable(fhe.PKESchemeFeature.MULTIPARTY)    # Hỗ trợ nhiều bên
+        _crypto_context = cc
+    return _crypto_context
+
+def _serialize(obj, name: str) -> bytes:
+    data = fhe.Serialize(obj, fhe.BINARY)
+    if not data:
+        raise Exception(f"Cannot serialize {name}.")
+    return data
+
+def _load_public_key(data: bytes):
+    public_key = fhe.DeserializePublicKeyString(data, fhe.BINARY)
+    if not isinstance(public_key, fhe.PublicKey):
+        raise Exception("Invalid public key.")
+    return public_key
+
+def _load_private_key(data: bytes):
+    private_key = fhe.DeserializePrivateKeyString(data, fhe.BINARY)
+    if not isinstance(private_key, fhe.PrivateKey):
+        raise Exception("Invalid private key.")
+    return private_key
+
+def _load_eval_key(data: bytes):
+    eval_key = fhe.DeserializeEvalKeyString(data, fhe.BINARY)
+    if not isinstance(eval_key, fhe.EvalKey):
+        raise Exception("Invalid EvalKey type.")
+    return eval_key
+
+def joint_key_step(prev_public_key: bytes = None):
+    """
+    Bên đầu tiên sinh cặp khóa mới, các bên sau đóng góp vào public key của bên trước.
+    Trả về (public key mới, private key của bên này) dạng bytes.
+    """
+    cc = get_crypto_context()
+    if prev_public_key is None:
+        key_pair = cc.KeyGen()
+    else:
+        key_pair = cc.MultipartyKeyGen(_load_public_key(prev_public_key))
+    return _serialize(key_pair.publicKey, "public key"), _serialize(key_pair.secretKey, "private key")
+
+def forward_eval_key_step(private_key: bytes, prev_eval_key: bytes = None) -> bytes:
+    """Giai đoạn 1: bên đầu tiên tạo EvalMultKey ban đầu, các bên sau cộng phần đóng góp của mình."""
+    cc = get_crypto_context()
+    secret_key = _load_private_key(private_key)
+    if prev_eval_key is None:
+        eval_key = cc.KeySwitchGen(secret_key, secret_key)
+    else:
+        prev = _load_eval_key(prev_eval_key)
+        new_key_part = cc.MultiKeySwitchGen(secret_key, secret_key, prev)
+        eval_key = cc.MultiAddEvalKeys(prev, new_key_part, secret_key.GetKeyTag())
+    return _serialize(eval_key, "EvalMultKey")
+
+def final_eval_key_step(private_key: bytes, accumulated_eval_key: bytes, joint_public_key: bytes) -> bytes:
+    """Giai đoạn 2: phần đóng góp ngược của một bên; mọi bên có thể chạy bước này đồng thời."""
+    cc = get_crypto_context()
+    final_key_part = cc.MultiMultEvalKey(
+        _load_private_key(private_key),
+        _load_eval_key(accumulated_eval_key),
+        _load_public_key(joint_public_key).GetKeyTag()
+    )
+    return _serialize(final_key_part, "EvalMultKey contribution")
+
+def check_published_keys(joint_public_key: bytes, eval_mult_key: bytes):
+    """EvalMultKey được cài phải thuộc cùng joint public key (cùng key tag)."""
+    if _load_eval_key(eval_mult_key).GetKeyTag() != _load_public_key(joint_public_key).GetKeyTag():
+        raise Exception("EvalMultKey does not belong to the joint public key.")
+
+def merge_eval_key_parts(parts) -> bytes:
+    """Gộp các phần EvalMultKey cuối cùng của mọi bên thành khóa dùng cho HEServer."""
+    cc = get_crypto_context()
+    merged_key = merge_eval_keys(cc, map(_load_eval_key, parts))
+    return _serialize(merged_key, "merged EvalMultKey")
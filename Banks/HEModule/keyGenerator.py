@@ -8,6 +8,7 @@ Chức năng chính:
 """
 
 import openfhe as fhe
+from fheParameters import BATCH_SIZE, MULTIPLICATIVE_DEPTH, SCALING_MOD_SIZE
 import os
 
 def generate_and_export_keys():
@@ -24,11 +25,11 @@ def generate_and_export_keys():
     # CKKS is a scheme that supports approximate arithmetic on encrypted real numbers
     parameters = fhe.CCParamsCKKSRNS()
     # Set the maximum depth of multiplication operations allowed
-    parameters.SetMultiplicativeDepth(15)
+    parameters.SetMultiplicativeDepth(MULTIPLICATIVE_DEPTH)
     # Set the scaling factor size for CKKS encoding
-    parameters.SetScalingModSize(59)
+    parameters.SetScalingModSize(SCALING_MOD_SIZE)
     # Set the number of slots for batch processing
-    parameters.SetBatchSize(1)
+    parameters.SetBatchSize(BATCH_SIZE)
 
     # Create crypto context with the specified parameters
     # The crypto context manages all cryptographic operations
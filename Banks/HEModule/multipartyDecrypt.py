@@ -5,10 +5,14 @@ Chức năng chính:
 - Giải mã từng phần ciphertext bằng private key của từng ngân hàng
 - Lưu phần giải mã cục bộ
 - Nếu là bên tổng hợp, ghép các phần giải mã để lấy kết quả cuối cùng
+- Chế độ batch: nhập thư mục/manifest kết quả để giải mã nhiều ciphertext trong một vòng (batchDecrypt.py)
 """
 
 import os
 import openfhe as fhe
+from fheParameters import BATCH_SIZE, MULTIPLICATIVE_DEPTH, SCALING_MOD_SIZE
+from aggregateParts import fuse_partial_decryption_files
+from batchDecrypt import create_partial_bundle, fuse_bundles
 
 bank_name = "MSB"
 
@@ -23,9 +27,9 @@ if __name__ == "__main__":
 
     # Thiết lập môi trường mã hóa CKKS
     parameters = fhe.CCParamsCKKSRNS()
-    parameters.SetMultiplicativeDepth(15)  # Độ sâu tối đa cho phép nhân
-    parameters.SetScalingModSize(59)       # Kích thước hệ số tỷ lệ
-    parameters.SetBatchSize(1)             # Số lượng slot xử lý hàng loạt
+    parameters.SetMultiplicativeDepth(MULTIPLICATIVE_DEPTH)  # Độ sâu tối đa cho phép nhân
+    parameters.SetScalingModSize(SCALING_MOD_SIZE)  # Kích thước hệ số tỷ lệ
+    parameters.SetBatchSize(BATCH_SIZE)    # Số lượng slot xử lý hàng loạt
 
     # Khởi tạo context mã hóa và bật các tính năng cần thiết
     cc = fhe.GenCryptoContext(parameters)
@@ -41,9 +45,26 @@ if __name__ == "__main__":
         raise Exception("Cannot deserialize private key.")
 
     # === Giải mã kết quả mã hóa liên ngân hàng ===
-    encrypted_file = input("Path to current encrypted result file: ").strip()
+    encrypted_file = input("Path to encrypted result file (or directory/JSON manifest for batch mode): ").strip()
     if not os.path.exists(encrypted_file):
         raise Exception(f"Encrypted file '{encrypted_file}' does not exist.")
+
+    if os.path.isdir(encrypted_file) or encrypted_file.endswith(".json"):
+        # Chế độ batch: một bundle chứa phần giải mã của mọi kết quả, gửi cho bên tổng hợp trong một lần
+        lead = input("Are you the 'lead' bank for decryption? (y/n): ").strip().lower() == 'y'
+        batches_path = input("Path to bulkEncrypt batches.json (leave empty if not used): ").strip()
+        count_input = input("Customers per result when no manifest/batches.json records it "
+                            "(leave empty to require one): ").strip()
+        bundle_path = os.path.join(key_dir, f"{bank_name}_partialBundle.zip")
+        create_partial_bundle(encrypted_file, prv_key_file, lead, bundle_path, bank_name,
+                              int(count_input) if count_input else None, batches_path or None)
+
+        if input("Are you the aggregator bank? (y/n): ").strip().lower() == 'y':
+            source = input("Path to directory or manifest of partial decryption bundles: ").strip()
+            output_csv = input("Output CSV path (default creditScores.csv): ").strip() or "creditScores.csv"
+            fuse_bundles(source, output_csv)
+        raise SystemExit(0)
+
     with open(encrypted_file, 'rb') as f:
         ct_bytes = f.read()
     encrypted_result = fhe.DeserializeCiphertextString(ct_bytes, fhe.BINARY)
@@ -70,22 +91,18 @@ if __name__ == "__main__":
     # Hỏi người dùng có phải bên tập hợp kết quả không
     is_aggregator = input("Are you the aggregator bank? (y/n): ").strip().lower()
     if is_aggregator == 'y':
-        print("Merging all partial decryptions...")
-        num_parts = int(input("How many partial decryptions to merge?: "))
-        part_decryptions = []
-
-        for i in range(num_parts):
-            path = input(f"Path to partial decryption #{i + 1}: ").strip()
-            if not os.path.exists(path):
-                raise Exception(f"File '{path}' does not exist.")
-            part_ct, _ = fhe.DeserializeCiphertext(path, fhe.BINARY)
-            part_decryptions.append(part_ct)
-
-        # Ghép các phần giải mã lại
-        result_ptxt = cc.MultipartyDecryptFusion(part_decryptions)
-        result_ptxt.SetLength(1)  # chỉ giải mã một giá trị duy nhất
-        # Trả về kết quả thang 300 - 850
-        raw_score = result_ptxt.GetRealPackedValue()[0]
-        credit_score = 300 + (raw_score * 550)
+        # Thư mục chứa mọi phần giải mã (kể cả phần của mình) hoặc manifest liệt kê đường dẫn
+        source = input("Path to directory or manifest of partial decryptions: ").strip()
+
+        # Số khách hàng được đóng gói trong ciphertext kết quả (1 nếu không dùng batch)
+        count_input = input("How many customers are packed in the result? (default 1): ").strip()
+        customer_count = int(count_input) if count_input else 1
+
+        # Đọc song song các phần giải mã rồi ghép lại; kết quả thang 300 - 850, mỗi slot một khách hàng
+        credit_scores = fuse_partial_decryption_files(cc, source, customer_count)
         print("\n=== Final Decryption Result ===")
-        print("Credit score:", credit_score)
\ No newline at end of file
+        if customer_count == 1:
+            print("Credit score:", credit_scores[0])
+        else:
+            for i, credit_score in enumerate(credit_scores):
+                print(f"Customer #{i + 1} credit score: {credit_score}")
\ No newline at end of file
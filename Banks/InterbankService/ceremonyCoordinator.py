@@ -0,0 +1,163 @@
+"""
+File: ceremonyCoordinator.py
+Mô tả: Điều phối nghi thức sinh khóa chung và EvalMultKey giữa các ngân hàng qua interbankAPI
+Chức năng chính:
+- Chuỗi public key chung và tích lũy tiến EvalMultKey lần lượt qua từng ngân hàng
+- Phần đóng góp ngược của mọi ngân hàng được tính đồng thời, sau đó gộp tại bên tổng hợp
+- Cài joint public key và EvalMultKey đã gộp cho mọi ngân hàng
+- Lưu checkpoint sau mỗi bước, chạy lại cùng ceremony id sẽ tiếp tục từ bước còn dang dở
+Ví dụ: python ceremonyCoordinator.py rotation-2025-06 --parties MSB ACB --aggregator MSB
+"""
+
+import os
+import json
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import secureClient
+
+URL_MAPPER = {
+    "MSB": "192.168.1.11",
+    "ACB": "192.168.1.12"
+}
+CEREMONY_DIR = Path("Ceremonies")
+
+BANK_CODE = secureClient.load_context().get("BANK_CODE", "MSB")
+
+# Khóa ký và certificate của bên điều phối, nạp một lần; mọi bước dùng chung một session keep-alive
+IDENTITY = secureClient.get_identity(BANK_CODE)
+CLIENT = secureClient.get_client()
+
+def call_step(bank: str, ceremony_id: str, step: str, parts: dict) -> bytes:
+    """
+    Gửi một bước tới interbankAPI của ngân hàng bank, trả về kết quả dạng bytes.
+    parts: tên field -> bytes; riêng bước merge là danh sách bytes gửi dưới field 'parts'.
+    """
+    metadata = {"ceremony_id": ceremony_id, "step": step}
+    if isinstance(parts, list):
+        named_parts = {f"part_{i}": data for i, data in enumerate(parts)}
+        files = [("parts", (f"part_{i}.bin", data)) for i, data in enumerate(parts)]
+    else:
+        named_parts = parts
+        files = [(name, (f"{name}.bin", data)) for name, data in parts.items()]
+    files.append(("certificate", (f"{BANK_CODE}.crt", IDENTITY.cert_pem)))
+
+    signed_digest = secureClient.compute_signed_digest({k: hashlib.sha256(v).digest() for k, v in named_parts.items()}, metadata)
+    data = {"metadata": json.dumps(metadata), "signature": IDENTITY.sign_digest_b64(signed_digest)}
+
+    url = f"https://{URL_MAPPER[bank]}/ceremony/{ceremony_id}/{step}"
+    try:
+        response = CLIENT.post(url, data=data, files=files, timeout=(10, 3600))
+    except Exception as e:
+        raise Exception(f"{bank} {step} failed after {CLIENT.max_attempts} attempts: {e}")
+    if response.status_code != 200:
+        raise Exception(f"{bank} {step} rejected ({response.status_code}): {response.text}")
+    return response.content
+
+class Checkpoint:
+    """Kết quả của từng bước được lưu ra file; checkpoint.json ghi lại các bước đã xong."""
+    def __init__(self, ceremony_id: str, parties, aggregator: str):
+        self.directory = CEREMONY_DIR / ceremony_id
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / "checkpoint.json"
+        plan = {"parties": list(parties), "aggregator": aggregator}
+        if self.path.exists():
+            with open(self.path) as f:
+                self.state = json.load(f)
+            if self.state["plan"] != plan:
+                raise Exception(f"Ceremony {ceremony_id} was started with {self.state['plan']}, not {plan}.")
+        else:
+            self.state = {"plan": plan, "completed": []}
+            self._write()
+
+    def _write(self):
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _artifact(self, key: str) -> Path:
+        return self.directory / (key.replace("/", "_") + ".bin")
+
+    def done(self, key: str) -> bool:
+        return key in self.state["completed"]
+
+    def load(self, key: str) -> bytes:
+        return self._artifact(key).read_bytes()
+
+    def save(self, key: str, data: bytes):
+        self._artifact(key).write_bytes(data)
+        self.state["completed"].append(key)
+        self._write()
+
+    def run(self, key: str, func) -> bytes:
+        if self.done(key):
+            print(f"  {key}: already done")
+        else:
+            self.save(key, func())
+            print(f"  {key}: done")
+        return self.load(key)
+
+def run_on_all_parties(checkpoint: Checkpoint, ceremony_id: str, step: str, parties, parts: dict):
+    """Gửi cùng một bước tới mọi bên chưa xong, đồng thời; lưu kết quả của các bên thành công trước khi báo lỗi."""
+    errors = []
+    with ThreadPoolExecutor(max_workers=len(parties)) as pool:
+        futures = {
+            bank: pool.submit(call_step, bank, ceremony_id, step, parts)
+            for bank in parties if not checkpoint.done(f"{step}/{bank}")
+        }
+        for bank, future in futures.items():
+            try:
+                checkpoint.save(f"{step}/{bank}", future.result())
+                print(f"  {step}/{bank}: done")
+            except Exception as e:
+                errors.append(f"{bank}: {e}")
+    if errors:
+        raise Exception(f"Step '{step}' failed for: " + "; ".join(errors))
+
+def run_ceremony(ceremony_id: str, parties, aggregator: str):
+    checkpoint = Checkpoint(ceremony_id, parties, aggregator)
+
+    # 1. Public key chung: mỗi bên đóng góp vào public key của bên trước
+    print("--- Joint public key ---")
+    public_key = None
+    for bank in parties:
+        step_parts = {"prev_public_key": public_key} if public_key is not None else {}
+        public_key = checkpoint.run(f"joint-key/{bank}", lambda: call_step(bank, ceremony_id, "joint-key", step_parts))
+    joint_public_key = public_key
+
+    # 2. Tích lũy tiến EvalMultKey theo cùng thứ tự
+    print("--- Stage 1: Forward Accumulation ---")
+    eval_key = None
+    for bank in parties:
+        step_parts = {"prev_eval_key": eval_key} if eval_key is not None else {}
+        eval_key = checkpoint.run(f"forward/{bank}", lambda: call_step(bank, ceremony_id, "forward", step_parts))
+
+    # 3. Hoàn thiện ngược: các bên không phụ thuộc nhau nên gửi đồng thời
+    print("--- Stage 2: Backward Finalization ---")
+    final_parts = {"accumulated_eval_key": eval_key, "joint_public_key": joint_public_key}
+    run_on_all_parties(checkpoint, ceremony_id, "final", parties, final_parts)
+    key_parts = [checkpoint.load(f"final/{bank}") for bank in parties]
+
+    # 4. Gộp tại bên tổng hợp
+    print("--- Merge ---")
+    merged_key = checkpoint.run("merge", lambda: call_step(aggregator, ceremony_id, "merge", key_parts))
+
+    # 5. Cài khóa mới cho mọi bên
+    print("--- Publish ---")
+    publish_parts = {"joint_public_key": joint_public_key, "eval_mult_key": merged_key}
+    run_on_all_parties(checkpoint, ceremony_id, "publish", parties, publish_parts)
+
+    print(f"\nCeremony {ceremony_id} completed. Artifacts: {checkpoint.directory}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Điều phối nghi thức sinh khóa chung giữa các ngân hàng")
+    parser.add_argument("ceremony_id", help="Dùng lại cùng id để tiếp tục sau khi lỗi")
+    parser.add_argument("--parties", nargs="+", default=list(URL_MAPPER), help="Thứ tự các ngân hàng trong chuỗi")
+    parser.add_argument("--aggregator", default=BANK_CODE)
+    args = parser.parse_args()
+    if args.aggregator not in args.parties:
+        parser.error("aggregator must be one of the parties")
+    run_ceremony(args.ceremony_id, args.parties, args.aggregator)
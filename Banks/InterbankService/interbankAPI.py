@@ -1,12 +1,28 @@
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
-from fastapi.responses import JSONResponse
-from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi.responses import JSONResponse, Response
+from cryptography.hazmat.primitives.asymmetric import ec, utils
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.exceptions import InvalidSignature
 from cryptography import x509
+from cryptography.x509.oid import NameOID
 import base64, json
+import os
+import re
+import sys
+import time
+import asyncio
+import shutil
+import hashlib
+import secrets
+import threading
+from typing import Dict, List, Optional
 from pathlib import Path
-from datetime import datetime
+import transportCodec
+import metrics
+import peerCertificates
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "HEModule"))
+import keyCeremony
 
 app = FastAPI()
 UPLOAD_DIR = Path("Received")
@@ -14,24 +30,38 @@ UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 # Custom CA (Root CA) của bạn
 CUSTOM_CA_PATH = "./RootCA.crt"
+# Trust anchor được nạp một lần khi khởi động
+with open(CUSTOM_CA_PATH, "rb") as f:
+    ROOT_CERT = x509.load_pem_x509_certificate(f.read())
+
+# Certificate đã xác thực được cache theo fingerprint, xem peerCertificates.py
+verify_peer_certificate = peerCertificates.PeerCertificateVerifier(ROOT_CERT).verify
+
+def certificate_common_name(cert: x509.Certificate) -> Optional[str]:
+    names = cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
+    return names[0].value if names else None
+
+# --- METRICS ---
+REQUESTS_TOTAL = metrics.REGISTRY.counter(
+    "interbank_requests_total", "HTTP requests by endpoint and status code.", ("endpoint", "method", "status"))
+REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    "interbank_request_seconds", "HTTP request latency.", ("endpoint",))
+REQUESTS_IN_FLIGHT = metrics.REGISTRY.gauge(
+    "interbank_requests_in_flight", "HTTP requests currently being handled.")
+UPLOADS_TOTAL = metrics.REGISTRY.counter(
+    "interbank_uploads_total", "Uploads by outcome.", ("outcome",))
+UPLOAD_BYTES = metrics.REGISTRY.histogram(
+    "interbank_upload_bytes", "Size of received files after decompression.", buckets=metrics.SIZE_BUCKETS)
+STAGE_SECONDS = metrics.REGISTRY.histogram(
+    "interbank_stage_seconds", "Time spent in each upload processing stage.", ("stage",))
+OBJECTS_DEDUPLICATED = metrics.REGISTRY.counter(
+    "interbank_objects_deduplicated_total", "Uploads whose content was already in the object store.")
 
-def verify_certificate_signed_by_root(cert: x509.Certificate, root_cert: x509.Certificate):
-    try:
-        # Lấy public key của RootCA
-        root_pubkey = root_cert.public_key()
-        # Verify cert được ký bởi RootCA
-        root_pubkey.verify(
-            cert.signature,
-            cert.tbs_certificate_bytes,
-            ec.ECDSA(cert.signature_hash_algorithm)
-        )
-        return True
-    except Exception:
-        return False
-    
 # Danh sách IP cho phép: MSB, ACB, FECREDIT
 ALLOWED_IPS = {"192.168.1.11", "192.168.1.12", "192.168.1.14"}  
 
+metrics.instrument_app(app, REQUESTS_TOTAL, REQUEST_SECONDS, REQUESTS_IN_FLIGHT)
+
 @app.middleware("http")
 async def verify_client_ip(request: Request, call_next):
     client_ip = request.client.host
@@ -40,66 +70,887 @@ async def verify_client_ip(request: Request, call_next):
     response = await call_next(request)
     return response
 
+# Kích thước chunk khi đọc file upload
+READ_CHUNK_SIZE = 1024 * 1024
+# Tổng dung lượng tối đa (sau giải nén) của các file trong một request /upload hoặc /upload/batch
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", 2 * 1024 ** 3))
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus scrape endpoint
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/codecs")
+async def list_codecs():
+    # Client chọn codec nén từ danh sách này
+    return {"codecs": transportCodec.available_codecs()}
+
+# --- KHO NỘI DUNG THEO SHA-256 ---
+# Mỗi nội dung được lưu một lần tại Received/.objects/<2 ký tự đầu>/<sha256>;
+# Received/<tên file> là hard link tới object, nên script đọc Received/ không cần đổi.
+# Số hard link của object chính là số tham chiếu: object chỉ còn 1 link (của kho) sẽ bị xóa.
+OBJECT_DIR = UPLOAD_DIR / ".objects"
+OBJECT_DIR.mkdir(parents=True, exist_ok=True)
+# Chỉ mục tên file -> sha256, kích thước, thời điểm cập nhật
+INDEX_PATH = UPLOAD_DIR / ".index.json"
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+store_lock = threading.RLock()
+
+def is_valid_upload_name(name: str) -> bool:
+    # Tên bắt đầu bằng "." dành cho kho, phiên upload và file tạm
+    return bool(name) and not name.startswith(".")
+
+def metadata_name(name: str) -> str:
+    """File metadata cạnh Received/<name>: <stem>.json; file .json dùng <stem>.meta.json để không ghi đè chính nó."""
+    sidecar = Path(name).with_suffix(".json").name
+    return sidecar if sidecar != name else f"{Path(name).stem}.meta.json"
+
+def metadata_path_for(file_path: Path) -> Path:
+    return file_path.with_name(metadata_name(file_path.name))
+
+def name_conflict(name: str, other_names) -> bool:
+    """name là file metadata của một file khác, hoặc file metadata của name là một file khác."""
+    sidecar = metadata_name(name)
+    return any(other != name and (metadata_name(other) == name or other == sidecar) for other in other_names)
+
+def conflicting_names(names) -> List[str]:
+    """Các tên trong names trùng file metadata của file đã lưu hoặc của file khác trong cùng request."""
+    with store_lock:
+        stored = set(load_index())
+    others = stored | set(names)
+    return [name for name in names if name_conflict(name, others)]
+
+def reject_conflicting_names(names):
+    conflicts = conflicting_names(names)
+    if conflicts:
+        UPLOADS_TOTAL.inc(outcome="name_conflict")
+        raise HTTPException(status_code=409, detail={"message": "Names clash with stored metadata files.",
+                                                     "names": conflicts})
+
+def object_path(digest_hex: str) -> Path:
+    return OBJECT_DIR / digest_hex[:2] / digest_hex
+
+def load_index() -> dict:
+    if not INDEX_PATH.exists():
+        return {}
+    return json.loads(INDEX_PATH.read_text())
+
+def link_name(name: str, digest_hex: str):
+    """Trỏ Received/<name> tới object (thay thế nguyên tử), cập nhật chỉ mục và dọn object cũ không còn tham chiếu."""
+    target = object_path(digest_hex)
+    file_path = UPLOAD_DIR / name
+    link_tmp = UPLOAD_DIR / f".{name}.{secrets.token_hex(8)}.link"
+    with store_lock:
+        index = load_index()
+        if name_conflict(name, index):
+            raise ValueError(f"'{name}' clashes with a stored metadata file.")
+        old_digest = index.get(name, {}).get("sha256")
+        try:
+            os.link(target, link_tmp)
+        except OSError:
+            # Hệ thống file không hỗ trợ hard link: lưu bản sao
+            shutil.copyfile(target, link_tmp)
+        os.replace(link_tmp, file_path)
+        index[name] = {"sha256": digest_hex, "size": target.stat().st_size, "updated": time.time()}
+        write_atomic(INDEX_PATH, json.dumps(index, indent=2).encode("utf-8"))
+        if old_digest and old_digest != digest_hex:
+            old_target = object_path(old_digest)
+            if old_target.exists() and old_target.stat().st_nlink <= 1:
+                old_target.unlink()
+
+def store_file(tmp_path: Path, digest_hex: str, name: str):
+    """Đưa file tạm vào kho (bỏ đi nếu nội dung đã có) rồi gắn tên name cho nó."""
+    target = object_path(digest_hex)
+    # Giữ khóa tới khi gắn tên xong, để object không bị dọn giữa hai bước
+    with store_lock:
+        if target.exists():
+            tmp_path.unlink(missing_ok=True)
+            OBJECTS_DEDUPLICATED.inc()
+        else:
+            target.parent.mkdir(exist_ok=True)
+            os.replace(tmp_path, target)
+        link_name(name, digest_hex)
+
+async def save_verified_file(tmp_path: Path, digest: bytes, name: str, metadata_dict: dict) -> Path:
+    """Lưu file đã xác minh vào kho và ghi metadata cạnh Received/<name>; trả về đường dẫn file."""
+    file_path = UPLOAD_DIR / name
+    await asyncio.to_thread(store_file, tmp_path, digest.hex(), name)
+    await asyncio.to_thread(write_atomic, metadata_path_for(file_path), json.dumps(metadata_dict, indent=2).encode("utf-8"))
+    return file_path
+
+@app.get("/objects/{sha256}")
+async def get_object(sha256: str):
+    """Kiểm tra nhanh trước khi gửi: 200 nếu đã có nội dung này (kèm các tên đang trỏ tới), 404 nếu chưa."""
+    if not SHA256_PATTERN.match(sha256):
+        raise HTTPException(status_code=400, detail="Invalid SHA-256 digest.")
+    target = object_path(sha256)
+    if not target.exists():
+        raise HTTPException(status_code=404, detail="Object not found.")
+    index = await asyncio.to_thread(load_index)
+    names = sorted(name for name, entry in index.items() if entry["sha256"] == sha256)
+    return {"sha256": sha256, "size": target.stat().st_size, "names": names}
+
+@app.post("/objects/link")
+async def link_objects(
+    manifest: str = Form(...),
+    certificate: UploadFile = File(...),
+    signature: str = Form(...),
+    metadata: str = Form(...)
+):
+    """
+    Gắn tên cho các nội dung đã có trong kho mà không gửi lại dữ liệu.
+    manifest: JSON {tên file: sha256}; chữ ký giống /upload/batch, tính trên digest của manifest
+    (compute_signed_digest), nên bên gửi ký như khi gửi chính các file đó.
+    """
+    try:
+        entries = json.loads(manifest)
+        metadata_dict = json.loads(metadata)
+        cert = x509.load_pem_x509_certificate(await certificate.read())
+    except Exception:
+        UPLOADS_TOTAL.inc(outcome="invalid_request")
+        raise HTTPException(status_code=400, detail="Invalid manifest, certificate or metadata.")
+    if (not isinstance(entries, dict) or not entries
+            or any(not is_valid_upload_name(Path(name).name) or Path(name).name != name for name in entries)
+            or any(not isinstance(digest, str) or not SHA256_PATTERN.match(digest) for digest in entries.values())):
+        UPLOADS_TOTAL.inc(outcome="invalid_request")
+        raise HTTPException(status_code=400, detail="Manifest must map file names to SHA-256 digests.")
+    await asyncio.to_thread(reject_conflicting_names, list(entries))
+    if not isinstance(cert.public_key(), ec.EllipticCurvePublicKey) or not verify_peer_certificate(cert):
+        UPLOADS_TOTAL.inc(outcome="certificate_rejected")
+        raise HTTPException(status_code=403, detail="Certificate expired or not signed by trusted RootCA.")
+    try:
+        signed_digest = compute_signed_digest({name: bytes.fromhex(digest) for name, digest in entries.items()}, metadata_dict)
+        cert.public_key().verify(base64.b64decode(signature), signed_digest, ec.ECDSA(utils.Prehashed(hashes.SHA256())))
+    except InvalidSignature:
+        UPLOADS_TOTAL.inc(outcome="signature_rejected")
+        raise HTTPException(status_code=403, detail="Invalid signature.")
+    except Exception as e:
+        UPLOADS_TOTAL.inc(outcome="signature_rejected")
+        raise HTTPException(status_code=400, detail=f"Error verifying signature: {e}")
+
+    missing = [name for name, digest in entries.items() if not object_path(digest).exists()]
+    if missing:
+        raise HTTPException(status_code=404, detail={"message": "Objects not found.", "missing": missing})
+    saved = []
+    for name, digest in entries.items():
+        await asyncio.to_thread(link_name, name, digest)
+        await asyncio.to_thread(write_atomic, metadata_path_for(UPLOAD_DIR / name),
+                                json.dumps(metadata_dict, indent=2).encode("utf-8"))
+        saved.append({"file_path": str(UPLOAD_DIR / name), "sha256": digest})
+    UPLOADS_TOTAL.inc(len(saved), outcome="linked")
+    return JSONResponse(status_code=200, content={"message": f"{len(saved)} files linked.", "files": saved})
+
+async def stream_to_file(upload: UploadFile, content_encoding: str, path: Path, hasher,
+                         max_size: int = MAX_UPLOAD_SIZE) -> int:
+    """
+    Giải nén theo luồng và ghi upload ra path, cập nhật hasher trên dữ liệu gốc; trả về số byte đã ghi.
+    Dữ liệu gốc vượt max_size byte thì ném transportCodec.OutputLimitExceeded.
+    """
+    decompressor = transportCodec.decompressor(content_encoding, max_size)
+    with open(path, "wb") as f:
+        def write(data: bytes):
+            hasher.update(data)
+            f.write(data)
+
+        # Giải nén, băm và ghi trong thread, không chặn event loop
+        while chunk := await upload.read(READ_CHUNK_SIZE):
+            await asyncio.to_thread(decompressor.decompress, chunk, write)
+        await asyncio.to_thread(decompressor.flush, write)
+    return decompressor.output_size
+
 @app.post("/upload")
 async def upload_file(
     file: UploadFile = File(...),
     certificate: UploadFile = File(...),
     signature: str = Form(...),
-    metadata: str = Form(...)
+    metadata: str = Form(...),
+    content_encoding: str = Form(transportCodec.IDENTITY)
 ):
-    # Step 1: Đọc file và metadata
+    if content_encoding not in transportCodec.available_codecs():
+        UPLOADS_TOTAL.inc(outcome="unsupported_encoding")
+        raise HTTPException(status_code=415, detail=f"Unsupported content encoding: {content_encoding}")
+    filename = Path(file.filename or "").name
     try:
-        file_bytes = await file.read()
         metadata_dict = json.loads(metadata)
     except Exception:
+        metadata_dict = None
+    if not is_valid_upload_name(filename) or metadata_dict is None:
+        UPLOADS_TOTAL.inc(outcome="invalid_request")
         raise HTTPException(status_code=400, detail="Invalid file or metadata.")
+    await asyncio.to_thread(reject_conflicting_names, [filename])
+
+    # Step 1: Load cert và verify bằng RootCA, trước khi nhận dữ liệu lớn
+    try:
+        with STAGE_SECONDS.time(stage="certificate_verify"):
+            cert_pem = await certificate.read()
+            cert = x509.load_pem_x509_certificate(cert_pem)
+            public_key = cert.public_key()
+
+            if not isinstance(public_key, ec.EllipticCurvePublicKey):
+                raise HTTPException(status_code=400, detail="Certificate must use EC key.")
 
-    # Step 2: Load cert và verify bằng RootCA
+            if not verify_peer_certificate(cert):
+                raise HTTPException(status_code=403, detail="Certificate expired or not signed by trusted RootCA.")
+    except Exception as e:
+        UPLOADS_TOTAL.inc(outcome="certificate_rejected")
+        raise HTTPException(status_code=400, detail=f"Certificate error: {e}")
+
+    # Step 2: Ghi file (giải nén theo luồng nếu cần) ra file tạm, băm đồng thời; bộ nhớ chỉ giữ một chunk
+    tmp_path = UPLOAD_DIR / f".{filename}.{secrets.token_hex(8)}.tmp"
     try:
-        cert_pem = await certificate.read()
-        cert = x509.load_pem_x509_certificate(cert_pem)
-        public_key = cert.public_key()
+        try:
+            with STAGE_SECONDS.time(stage="upload_read"):
+                hasher = hashlib.sha256()
+                size = await stream_to_file(file, content_encoding, tmp_path, hasher)
+        except transportCodec.OutputLimitExceeded:
+            UPLOADS_TOTAL.inc(outcome="too_large")
+            raise HTTPException(status_code=413, detail=f"File exceeds {MAX_UPLOAD_SIZE} bytes.")
+        except Exception:
+            UPLOADS_TOTAL.inc(outcome="invalid_request")
+            raise HTTPException(status_code=400, detail="Invalid file or metadata.")
+        UPLOAD_BYTES.observe(size)
+
+        # Step 3: Verify chữ ký số trên SHA-256(file_bytes + metadata), tương đương ký trực tiếp trên dữ liệu
+        try:
+            with STAGE_SECONDS.time(stage="signature_verify"):
+                # Digest riêng của file là khóa trong kho nội dung
+                file_digest = hasher.digest()
+                hasher.update(json.dumps(metadata_dict, sort_keys=True).encode("utf-8"))
+                decoded_sig = base64.b64decode(signature)
+
+                public_key.verify(
+                    decoded_sig,
+                    hasher.digest(),
+                    ec.ECDSA(utils.Prehashed(hashes.SHA256()))
+                )
+        except InvalidSignature:
+            UPLOADS_TOTAL.inc(outcome="signature_rejected")
+            raise HTTPException(status_code=403, detail="Invalid signature.")
+        except Exception as e:
+            UPLOADS_TOTAL.inc(outcome="signature_rejected")
+            raise HTTPException(status_code=400, detail=f"Error verifying signature: {e}")
 
-        if not isinstance(public_key, ec.EllipticCurvePublicKey):
-            raise HTTPException(status_code=400, detail="Certificate must use EC key.")
+        # Step 4: Đưa file tạm vào kho nội dung, gắn tên trong Received/ và lưu metadata
+        try:
+            with STAGE_SECONDS.time(stage="write"):
+                file_path = await save_verified_file(tmp_path, file_digest, filename, metadata_dict)
+            UPLOADS_TOTAL.inc(outcome="accepted")
 
-        with open(CUSTOM_CA_PATH, "rb") as f:
-            root_cert_pem = f.read()
-            root_cert = x509.load_pem_x509_certificate(root_cert_pem)
+            return JSONResponse(status_code=200, content={
+                "message": "File received and verified.",
+                "file_path": str(file_path),
+                "metadata_path": str(metadata_path_for(file_path)),
+                "sha256": file_digest.hex(),
+            })
+        except Exception as e:
+            UPLOADS_TOTAL.inc(outcome="write_failed")
+            raise HTTPException(status_code=500, detail=f"Error saving file: {e}")
+    finally:
+        tmp_path.unlink(missing_ok=True)
 
-        if not verify_certificate_signed_by_root(cert, root_cert):
-            raise HTTPException(status_code=403, detail="Certificate not signed by trusted RootCA.")
+@app.post("/upload/batch")
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    certificate: UploadFile = File(...),
+    signature: str = Form(...),
+    metadata: str = Form(...),
+    content_encoding: str = Form(transportCodec.IDENTITY)
+):
+    """
+    Nhiều file trong một request với một chữ ký, ký trên digest của manifest:
+    SHA-256(H(file_1) || ... || H(file_n) || H(metadata)), các file sắp xếp theo tên (compute_signed_digest).
+    Chỉ khi chữ ký hợp lệ thì mọi file mới được chuyển vào Received/, kèm metadata cho từng file như /upload.
+    """
+    if content_encoding not in transportCodec.available_codecs():
+        UPLOADS_TOTAL.inc(outcome="unsupported_encoding")
+        raise HTTPException(status_code=415, detail=f"Unsupported content encoding: {content_encoding}")
+    filenames = [Path(upload.filename or "").name for upload in files]
+    try:
+        metadata_dict = json.loads(metadata)
+    except Exception:
+        metadata_dict = None
+    if (metadata_dict is None or len(set(filenames)) != len(filenames)
+            or not all(is_valid_upload_name(name) for name in filenames)):
+        UPLOADS_TOTAL.inc(outcome="invalid_request")
+        raise HTTPException(status_code=400, detail="Invalid metadata or file names (must be distinct).")
+    await asyncio.to_thread(reject_conflicting_names, filenames)
+
+    # Certificate được kiểm tra một lần cho cả batch, trước khi nhận dữ liệu
+    try:
+        with STAGE_SECONDS.time(stage="certificate_verify"):
+            cert = x509.load_pem_x509_certificate(await certificate.read())
+            public_key = cert.public_key()
+            if not isinstance(public_key, ec.EllipticCurvePublicKey):
+                raise HTTPException(status_code=400, detail="Certificate must use EC key.")
+            if not verify_peer_certificate(cert):
+                raise HTTPException(status_code=403, detail="Certificate expired or not signed by trusted RootCA.")
     except Exception as e:
+        UPLOADS_TOTAL.inc(outcome="certificate_rejected")
         raise HTTPException(status_code=400, detail=f"Certificate error: {e}")
 
-    # Step 3: Verify chữ ký số
+    token = secrets.token_hex(8)
+    tmp_paths = {name: UPLOAD_DIR / f".{name}.{token}.tmp" for name in filenames}
+    try:
+        part_digests: Dict[str, bytes] = {}
+        try:
+            with STAGE_SECONDS.time(stage="upload_read"):
+                # Giới hạn tính trên tổng các file của batch
+                remaining = MAX_UPLOAD_SIZE
+                for name, upload in zip(filenames, files):
+                    hasher = hashlib.sha256()
+                    size = await stream_to_file(upload, content_encoding, tmp_paths[name], hasher, remaining)
+                    remaining -= size
+                    UPLOAD_BYTES.observe(size)
+                    part_digests[name] = hasher.digest()
+        except transportCodec.OutputLimitExceeded:
+            UPLOADS_TOTAL.inc(outcome="too_large")
+            raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_UPLOAD_SIZE} bytes.")
+        except Exception:
+            UPLOADS_TOTAL.inc(outcome="invalid_request")
+            raise HTTPException(status_code=400, detail="Invalid file or metadata.")
+
+        try:
+            with STAGE_SECONDS.time(stage="signature_verify"):
+                public_key.verify(
+                    base64.b64decode(signature),
+                    compute_signed_digest(part_digests, metadata_dict),
+                    ec.ECDSA(utils.Prehashed(hashes.SHA256()))
+                )
+        except InvalidSignature:
+            UPLOADS_TOTAL.inc(outcome="signature_rejected")
+            raise HTTPException(status_code=403, detail="Invalid signature.")
+        except Exception as e:
+            UPLOADS_TOTAL.inc(outcome="signature_rejected")
+            raise HTTPException(status_code=400, detail=f"Error verifying signature: {e}")
+
+        try:
+            saved = []
+            with STAGE_SECONDS.time(stage="write"):
+                for name in filenames:
+                    file_path = await save_verified_file(tmp_paths[name], part_digests[name], name, metadata_dict)
+                    saved.append({"file_path": str(file_path), "sha256": part_digests[name].hex()})
+            UPLOADS_TOTAL.inc(len(saved), outcome="accepted")
+        except Exception as e:
+            UPLOADS_TOTAL.inc(outcome="write_failed")
+            raise HTTPException(status_code=500, detail=f"Error saving files: {e}")
+        return JSONResponse(status_code=200, content={"message": f"{len(saved)} files received and verified.", "files": saved})
+    finally:
+        for tmp_path in tmp_paths.values():
+            tmp_path.unlink(missing_ok=True)
+
+# --- UPLOAD THEO CHUNK, CÓ THỂ TIẾP TỤC SAU KHI MẤT KẾT NỐI ---
+# Mỗi phiên có một thư mục riêng: data.part (cấp phát đủ kích thước) và session.json (các đoạn đã nhận)
+SESSION_DIR = UPLOAD_DIR / ".sessions"
+SESSION_DIR.mkdir(parents=True, exist_ok=True)
+SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+# Chunk lớn nhất (sau giải nén) trong một request
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+# Phiên không có chunk mới trong khoảng này sẽ bị xóa
+UPLOAD_SESSION_TTL_SECONDS = int(os.environ.get("UPLOAD_SESSION_TTL_SECONDS", 24 * 3600))
+# Số phiên chưa commit tối đa của mỗi bên gửi (theo CN của certificate)
+MAX_SESSIONS_PER_PEER = int(os.environ.get("MAX_SESSIONS_PER_PEER", 8))
+# Lock của các phiên còn tồn tại; bị xóa khi phiên được commit hoặc hết hạn
+session_locks: Dict[str, asyncio.Lock] = {}
+# Đếm và tạo phiên dưới cùng một lock để không vượt MAX_SESSIONS_PER_PEER khi tạo đồng thời
+session_create_lock = asyncio.Lock()
+
+def session_path(session_id: str) -> Path:
+    if not SESSION_ID_PATTERN.match(session_id):
+        raise HTTPException(status_code=400, detail="Invalid session id.")
+    path = SESSION_DIR / session_id
+    if not (path / "session.json").exists():
+        raise HTTPException(status_code=404, detail="Upload session not found.")
+    return path
+
+def session_lock(session_id: str) -> asyncio.Lock:
+    """Lock ghi/commit của một phiên còn tồn tại; phiên không còn thì trả 404 thay vì tạo lock mới."""
+    lock = session_locks.get(session_id)
+    if lock is None:
+        session_path(session_id)
+        lock = session_locks.setdefault(session_id, asyncio.Lock())
+    return lock
+
+def require_live_session(session_id: str, path: Path):
+    """Gọi khi đã giữ lock: phiên có thể đã được commit hoặc xóa trong lúc chờ lock."""
+    if not (path / "session.json").exists():
+        session_locks.pop(session_id, None)
+        raise HTTPException(status_code=404, detail="Upload session not found.")
+
+def load_session(path: Path) -> dict:
+    return json.loads((path / "session.json").read_text())
+
+def save_session(path: Path, session: dict):
+    write_atomic(path / "session.json", json.dumps(session).encode("utf-8"))
+
+def add_range(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+    """Thêm đoạn [start, end) và gộp các đoạn chồng lấn hoặc liền kề."""
+    merged: List[List[int]] = []
+    for range_start, range_end in sorted(ranges + [[start, end]]):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return merged
+
+def missing_ranges(ranges: List[List[int]], size: int) -> List[List[int]]:
+    missing, position = [], 0
+    for start, end in ranges:
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < size:
+        missing.append([position, size])
+    return missing
+
+def session_status(session_id: str, session: dict) -> dict:
+    return {
+        "session_id": session_id,
+        "filename": session["filename"],
+        "size": session["size"],
+        "received": session["ranges"],
+        "missing": missing_ranges(session["ranges"], session["size"]),
+    }
+
+def write_chunk(data_path: Path, offset: int, data: bytes):
+    with open(data_path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+
+def purge_expired_sessions(busy=frozenset()) -> List[str]:
+    """Xóa các phiên hết hạn, trừ các phiên trong busy (đang giữ lock); trả về id các phiên đã xóa."""
+    now = time.time()
+    purged = []
+    for path in SESSION_DIR.iterdir():
+        if path.name in busy:
+            continue
+        state_path = path / "session.json"
+        mtime = state_path.stat().st_mtime if state_path.exists() else path.stat().st_mtime
+        if now - mtime > UPLOAD_SESSION_TTL_SECONDS:
+            for child in path.iterdir():
+                child.unlink()
+            path.rmdir()
+            purged.append(path.name)
+    return purged
+
+def count_peer_sessions(peer: str) -> int:
+    count = 0
+    for path in SESSION_DIR.iterdir():
+        try:
+            count += load_session(path).get("peer") == peer
+        except (OSError, ValueError):
+            continue
+    return count
+
+def hash_signed_upload(data_path: Path, metadata_dict: dict):
+    """
+    Trả về (SHA-256 của file, SHA-256 của file_bytes + metadata). Digest thứ hai tương đương
+    chữ ký ECDSA-SHA256 trên file_bytes + metadata của /upload, nhưng băm theo luồng.
+    """
+    hasher = hashlib.sha256()
+    with open(data_path, "rb") as f:
+        while chunk := f.read(READ_CHUNK_SIZE):
+            hasher.update(chunk)
+    file_digest = hasher.digest()
+    hasher.update(json.dumps(metadata_dict, sort_keys=True).encode("utf-8"))
+    return file_digest, hasher.digest()
+
+@app.post("/upload/sessions")
+async def create_upload_session(
+    filename: str = Form(...),
+    size: int = Form(...),
+    sha256: str = Form(...),
+    certificate: UploadFile = File(...),
+    signature: str = Form(...),
+    metadata: str = Form(...)
+):
+    """
+    Mở phiên upload cho một file đã ký. Chữ ký giống /objects/link: compute_signed_digest({filename: sha256}, metadata),
+    nên bên nhận xác thực bên gửi trước khi cấp phát chỗ ghi; khi commit, dữ liệu phải khớp sha256 đã khai báo.
+    """
+    filename = Path(filename).name
+    try:
+        metadata_dict = json.loads(metadata)
+        cert = x509.load_pem_x509_certificate(await certificate.read())
+    except Exception:
+        metadata_dict = cert = None
+    if not is_valid_upload_name(filename) or size < 0 or not SHA256_PATTERN.match(sha256) or cert is None:
+        UPLOADS_TOTAL.inc(outcome="invalid_request")
+        raise HTTPException(status_code=400, detail="Invalid filename, size, digest, certificate or metadata.")
+    await asyncio.to_thread(reject_conflicting_names, [filename])
+    if size > MAX_UPLOAD_SIZE:
+        UPLOADS_TOTAL.inc(outcome="too_large")
+        raise HTTPException(status_code=413, detail=f"File exceeds {MAX_UPLOAD_SIZE} bytes.")
+    if not isinstance(cert.public_key(), ec.EllipticCurvePublicKey) or not verify_peer_certificate(cert):
+        UPLOADS_TOTAL.inc(outcome="certificate_rejected")
+        raise HTTPException(status_code=403, detail="Certificate expired or not signed by trusted RootCA.")
     try:
-        data_to_verify = file_bytes + json.dumps(metadata_dict, sort_keys=True).encode("utf-8")
-        decoded_sig = base64.b64decode(signature)
-
-        public_key.verify(
-            decoded_sig,
-            data_to_verify,
-            ec.ECDSA(hashes.SHA256())
-        )
+        signed_digest = compute_signed_digest({filename: bytes.fromhex(sha256)}, metadata_dict)
+        cert.public_key().verify(base64.b64decode(signature), signed_digest, ec.ECDSA(utils.Prehashed(hashes.SHA256())))
     except InvalidSignature:
+        UPLOADS_TOTAL.inc(outcome="signature_rejected")
         raise HTTPException(status_code=403, detail="Invalid signature.")
     except Exception as e:
+        UPLOADS_TOTAL.inc(outcome="signature_rejected")
         raise HTTPException(status_code=400, detail=f"Error verifying signature: {e}")
 
-    # Step 4: Lưu file và metadata
+    peer = certificate_common_name(cert)
+    async with session_create_lock:
+        busy = {session_id for session_id, lock in session_locks.items() if lock.locked()}
+        for purged_id in await asyncio.to_thread(purge_expired_sessions, busy):
+            session_locks.pop(purged_id, None)
+        if await asyncio.to_thread(count_peer_sessions, peer) >= MAX_SESSIONS_PER_PEER:
+            UPLOADS_TOTAL.inc(outcome="too_many_sessions")
+            raise HTTPException(status_code=429, detail=f"At most {MAX_SESSIONS_PER_PEER} open upload sessions per peer.")
+
+        session_id = secrets.token_hex(16)
+        path = SESSION_DIR / session_id
+        path.mkdir()
+        with open(path / "data.part", "wb") as f:
+            f.truncate(size)
+        session = {
+            "filename": filename,
+            "size": size,
+            "sha256": sha256,
+            "peer": peer,
+            "peer_fingerprint": cert.fingerprint(hashes.SHA256()).hex(),
+            "ranges": [],
+            "created": time.time(),
+        }
+        save_session(path, session)
+    UPLOADS_TOTAL.inc(outcome="session_created")
+    return JSONResponse(status_code=201, content=session_status(session_id, session))
+
+@app.get("/upload/sessions/{session_id}")
+async def get_upload_session(session_id: str):
+    return session_status(session_id, load_session(session_path(session_id)))
+
+@app.put("/upload/sessions/{session_id}")
+async def put_upload_chunk(
+    session_id: str,
+    request: Request,
+    offset: int,
+    content_encoding: str = transportCodec.IDENTITY
+):
+    path = session_path(session_id)
+    if content_encoding not in transportCodec.available_codecs():
+        raise HTTPException(status_code=415, detail=f"Unsupported content encoding: {content_encoding}")
+
+    # Offset tính trên dữ liệu gốc; mỗi chunk được nén độc lập.
+    # Giới hạn được kiểm tra trong lúc giải nén, trước khi phần vượt quá nằm trong bộ nhớ.
+    try:
+        decompressor = transportCodec.decompressor(content_encoding, MAX_CHUNK_SIZE)
+        parts = []
+        async for piece in request.stream():
+            decompressor.decompress(piece, parts.append)
+        decompressor.flush(parts.append)
+        data = b"".join(parts)
+    except transportCodec.OutputLimitExceeded:
+        raise HTTPException(status_code=413, detail=f"Chunk larger than {MAX_CHUNK_SIZE} bytes.")
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid chunk encoding.")
+
+    # Ghi dưới lock của phiên: commit có thể đang băm data.part hoặc đã đưa nó vào kho nội dung
+    async with session_lock(session_id):
+        require_live_session(session_id, path)
+        session = load_session(path)
+        size = session["size"]
+        if offset < 0 or offset + len(data) > size:
+            raise HTTPException(status_code=416, detail=f"Chunk [{offset}, {offset + len(data)}) outside file of {size} bytes.")
+        with STAGE_SECONDS.time(stage="chunk_write"):
+            await asyncio.to_thread(write_chunk, path / "data.part", offset, data)
+        if data:
+            session["ranges"] = add_range(session["ranges"], offset, offset + len(data))
+        await asyncio.to_thread(save_session, path, session)
+    return session_status(session_id, session)
+
+@app.post("/upload/sessions/{session_id}/commit")
+async def commit_upload_session(
+    session_id: str,
+    certificate: UploadFile = File(...),
+    signature: str = Form(...),
+    metadata: str = Form(...)
+):
+    path = session_path(session_id)
+    async with session_lock(session_id):
+        require_live_session(session_id, path)
+        session = load_session(path)
+        missing = missing_ranges(session["ranges"], session["size"])
+        if missing:
+            raise HTTPException(status_code=409, detail={"message": "Upload incomplete.", "missing": missing})
+
+        try:
+            metadata_dict = json.loads(metadata)
+            cert = x509.load_pem_x509_certificate(await certificate.read())
+        except Exception:
+            UPLOADS_TOTAL.inc(outcome="invalid_request")
+            raise HTTPException(status_code=400, detail="Invalid certificate or metadata.")
+        if not isinstance(cert.public_key(), ec.EllipticCurvePublicKey) or not verify_peer_certificate(cert):
+            UPLOADS_TOTAL.inc(outcome="certificate_rejected")
+            raise HTTPException(status_code=403, detail="Certificate expired or not signed by trusted RootCA.")
+        # Chỉ bên đã mở phiên mới được commit
+        if cert.fingerprint(hashes.SHA256()).hex() != session["peer_fingerprint"]:
+            UPLOADS_TOTAL.inc(outcome="certificate_rejected")
+            raise HTTPException(status_code=403, detail="Certificate does not match the one that opened the session.")
+
+        data_path = path / "data.part"
+        try:
+            with STAGE_SECONDS.time(stage="signature_verify"):
+                file_digest, digest = await asyncio.to_thread(hash_signed_upload, data_path, metadata_dict)
+                cert.public_key().verify(base64.b64decode(signature), digest, ec.ECDSA(utils.Prehashed(hashes.SHA256())))
+        except InvalidSignature:
+            UPLOADS_TOTAL.inc(outcome="signature_rejected")
+            raise HTTPException(status_code=403, detail="Invalid signature.")
+        except Exception as e:
+            UPLOADS_TOTAL.inc(outcome="signature_rejected")
+            raise HTTPException(status_code=400, detail=f"Error verifying signature: {e}")
+        if file_digest.hex() != session["sha256"]:
+            UPLOADS_TOTAL.inc(outcome="signature_rejected")
+            raise HTTPException(status_code=409, detail="Uploaded data does not match the SHA-256 declared for the session.")
+
+        # Chuyển file vào kho nội dung như /upload, rồi xóa phiên
+        with STAGE_SECONDS.time(stage="write"):
+            file_path = await save_verified_file(data_path, file_digest, session["filename"], metadata_dict)
+            metadata_path = metadata_path_for(file_path)
+            (path / "session.json").unlink()
+            path.rmdir()
+        session_locks.pop(session_id, None)
+    UPLOADS_TOTAL.inc(outcome="accepted")
+    UPLOAD_BYTES.observe(session["size"])
+    return JSONResponse(status_code=200, content={
+        "message": "File received and verified.",
+        "file_path": str(file_path),
+        "metadata_path": str(metadata_path),
+        "sha256": file_digest.hex(),
+    })
+
+# --- KEY CEREMONY (ĐIỀU PHỐI BỞI ceremonyCoordinator.py) ---
+def load_context(path="../context.txt"):
+    context = {}
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                if "=" in line:
+                    k, v = line.strip().split("=", 1)
+                    context[k.strip()] = v.strip()
+    except Exception:
+        pass
+    return context
+
+CONTEXT = load_context()
+BANK_CODE = CONTEXT.get("BANK_CODE", "MSB")
+# CN của các certificate được phép điều phối nghi thức. Mọi certificate do RootCA ký (kể cả của FE Credit)
+# đều qua được verify_peer_certificate, nên chỉ các bên trong danh sách này mới được gọi các bước bên dưới.
+CEREMONY_COORDINATORS = {
+    name.strip() for name in CONTEXT.get("CEREMONY_COORDINATORS", "MSB,ACB").split(",") if name.strip()
+}
+KEY_DIR = Path("../HEModule/Keys")
+# Mỗi nghi thức có một thư mục riêng chứa private key và đầu ra của từng bước (checkpoint phía ngân hàng)
+CEREMONY_DIR = KEY_DIR / "ceremonies"
+CEREMONY_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+ceremony_locks: Dict[str, asyncio.Lock] = {}
+
+def ceremony_path(ceremony_id: str) -> Path:
+    if not CEREMONY_ID_PATTERN.match(ceremony_id):
+        raise HTTPException(status_code=400, detail="Invalid ceremony id.")
+    path = CEREMONY_DIR / ceremony_id
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+def compute_signed_digest(part_digests: Dict[str, bytes], metadata_dict: dict) -> bytes:
+    """
+    Digest được ký: SHA-256(H(part_1) || ... || H(part_n) || H(metadata)),
+    các phần sắp xếp theo tên, H là SHA-256. Giống HEServer.compute_signed_digest.
+    """
+    hasher = hashlib.sha256()
+    for key in sorted(part_digests.keys()):
+        hasher.update(part_digests[key])
+    hasher.update(hashlib.sha256(json.dumps(metadata_dict, sort_keys=True).encode("utf-8")).digest())
+    return hasher.digest()
+
+def write_atomic(path: Path, data: bytes):
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+async def read_signed_ceremony_request(
+    ceremony_id: str,
+    step: str,
+    uploads: Dict[str, Optional[UploadFile]],
+    certificate: UploadFile,
+    signature: str,
+    metadata: str
+) -> Dict[str, bytes]:
+    """
+    Đọc các file của một bước và xác minh chữ ký của bên điều phối.
+    Certificate phải do RootCA ký và có CN thuộc CEREMONY_COORDINATORS.
+    metadata phải ghi đúng ceremony_id và step để chữ ký không dùng lại được cho bước khác.
+    """
     try:
-        filename_base = f"{file.filename}"
-        file_path = UPLOAD_DIR / filename_base
-        metadata_path = file_path.with_suffix(".json")
-
-        file_path.write_bytes(file_bytes)
-        metadata_path.write_text(json.dumps(metadata_dict, indent=2))
-
-        return JSONResponse(status_code=200, content={
-            "message": "File received and verified.",
-            "file_path": str(file_path),
-            "metadata_path": str(metadata_path),
-        })
+        metadata_dict = json.loads(metadata)
+        cert = x509.load_pem_x509_certificate(await certificate.read())
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid certificate or metadata.")
+    if metadata_dict.get("ceremony_id") != ceremony_id or metadata_dict.get("step") != step:
+        raise HTTPException(status_code=400, detail="Metadata does not match this ceremony step.")
+    if not isinstance(cert.public_key(), ec.EllipticCurvePublicKey) or not verify_peer_certificate(cert):
+        raise HTTPException(status_code=403, detail="Certificate expired or not signed by trusted RootCA.")
+    if certificate_common_name(cert) not in CEREMONY_COORDINATORS:
+        raise HTTPException(status_code=403, detail="Certificate is not an authorized ceremony coordinator.")
+
+    parts: Dict[str, bytes] = {}
+    for name, upload in uploads.items():
+        if upload is not None:
+            parts[name] = await upload.read()
+    try:
+        signed_digest = compute_signed_digest(
+            {name: hashlib.sha256(data).digest() for name, data in parts.items()}, metadata_dict)
+        cert.public_key().verify(base64.b64decode(signature), signed_digest, ec.ECDSA(utils.Prehashed(hashes.SHA256())))
+    except InvalidSignature:
+        raise HTTPException(status_code=403, detail="Invalid signature.")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error saving file: {e}")
+        raise HTTPException(status_code=400, detail=f"Error verifying signature: {e}")
+    return parts
+
+async def run_ceremony_step(ceremony_id: str, step: str, parts: Dict[str, bytes], compute) -> Response:
+    """
+    Chạy một bước đúng một lần: nếu bước đã xong với cùng đầu vào thì trả lại kết quả cũ,
+    nhờ vậy bên điều phối có thể gửi lại sau khi lỗi mà không sinh khóa mới.
+    """
+    directory = ceremony_path(ceremony_id)
+    output_path = directory / f"{step}.bin"
+    input_path = directory / f"{step}.input"
+    input_digest = compute_signed_digest({name: hashlib.sha256(data).digest() for name, data in parts.items()}, {}).hex()
+
+    lock = ceremony_locks.setdefault(f"{ceremony_id}/{step}", asyncio.Lock())
+    async with lock:
+        if output_path.exists():
+            if input_path.read_text().strip() != input_digest:
+                raise HTTPException(status_code=409, detail=f"Step '{step}' already completed with different inputs.")
+        else:
+            try:
+                output = await asyncio.to_thread(compute, directory)
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Ceremony step '{step}' failed: {e}")
+            input_path.write_text(input_digest)
+            write_atomic(output_path, output)
+    return Response(content=output_path.read_bytes(), media_type="application/octet-stream")
+
+def load_ceremony_private_key(directory: Path) -> bytes:
+    private_key_path = directory / "privateKey.bin"
+    if not private_key_path.exists():
+        raise HTTPException(status_code=409, detail="Joint key step has not been run for this ceremony.")
+    return private_key_path.read_bytes()
+
+@app.post("/ceremony/{ceremony_id}/joint-key")
+async def ceremony_joint_key(
+    ceremony_id: str,
+    prev_public_key: Optional[UploadFile] = File(None),
+    certificate: UploadFile = File(...),
+    signature: str = Form(...),
+    metadata: str = Form(...)
+):
+    parts = await read_signed_ceremony_request(ceremony_id, "joint-key", {"prev_public_key": prev_public_key},
+                                               certificate, signature, metadata)
+
+    def compute(directory: Path) -> bytes:
+        public_key, private_key = keyCeremony.joint_key_step(parts.get("prev_public_key"))
+        # Private key được ghi trước, để checkpoint của bước không bao giờ thiếu khóa tương ứng
+        write_atomic(directory / "privateKey.bin", private_key)
+        return public_key
+
+    return await run_ceremony_step(ceremony_id, "joint-key", parts, compute)
+
+@app.post("/ceremony/{ceremony_id}/forward")
+async def ceremony_forward(
+    ceremony_id: str,
+    prev_eval_key: Optional[UploadFile] = File(None),
+    certificate: UploadFile = File(...),
+    signature: str = Form(...),
+    metadata: str = Form(...)
+):
+    parts = await read_signed_ceremony_request(ceremony_id, "forward", {"prev_eval_key": prev_eval_key},
+                                               certificate, signature, metadata)
+
+    def compute(directory: Path) -> bytes:
+        return keyCeremony.forward_eval_key_step(load_ceremony_private_key(directory), parts.get("prev_eval_key"))
+
+    return await run_ceremony_step(ceremony_id, "forward", parts, compute)
+
+@app.post("/ceremony/{ceremony_id}/final")
+async def ceremony_final(
+    ceremony_id: str,
+    accumulated_eval_key: UploadFile = File(...),
+    joint_public_key: UploadFile = File(...),
+    certificate: UploadFile = File(...),
+    signature: str = Form(...),
+    metadata: str = Form(...)
+):
+    parts = await read_signed_ceremony_request(
+        ceremony_id, "final",
+        {"accumulated_eval_key": accumulated_eval_key, "joint_public_key": joint_public_key},
+        certificate, signature, metadata)
+
+    def compute(directory: Path) -> bytes:
+        key_part = keyCeremony.final_eval_key_step(
+            load_ceremony_private_key(directory), parts["accumulated_eval_key"], parts["joint_public_key"])
+        # Joint public key mà phần EvalMultKey của ngân hàng này gắn với; bước publish chỉ cài đúng khóa này
+        write_atomic(directory / "jointPublicKey.bin", parts["joint_public_key"])
+        return key_part
+
+    return await run_ceremony_step(ceremony_id, "final", parts, compute)
+
+@app.post("/ceremony/{ceremony_id}/merge")
+async def ceremony_merge(
+    ceremony_id: str,
+    parts: List[UploadFile] = File(...),
+    certificate: UploadFile = File(...),
+    signature: str = Form(...),
+    metadata: str = Form(...)
+):
+    key_parts = await read_signed_ceremony_request(
+        ceremony_id, "merge", {f"part_{i}": part for i, part in enumerate(parts)},
+        certificate, signature, metadata)
+
+    def compute(directory: Path) -> bytes:
+        return keyCeremony.merge_eval_key_parts([key_parts[f"part_{i}"] for i in range(len(key_parts))])
+
+    return await run_ceremony_step(ceremony_id, "merge", key_parts, compute)
+
+@app.post("/ceremony/{ceremony_id}/publish")
+async def ceremony_publish(
+    ceremony_id: str,
+    joint_public_key: UploadFile = File(...),
+    eval_mult_key: UploadFile = File(...),
+    certificate: UploadFile = File(...),
+    signature: str = Form(...),
+    metadata: str = Form(...)
+):
+    parts = await read_signed_ceremony_request(
+        ceremony_id, "publish", {"joint_public_key": joint_public_key, "eval_mult_key": eval_mult_key},
+        certificate, signature, metadata)
+
+    def compute(directory: Path) -> bytes:
+        private_key = load_ceremony_private_key(directory)
+        # Chỉ cài joint public key mà ngân hàng này đã tạo ra (bên cuối chuỗi) hoặc đã nhận ở bước final
+        # của chính nghi thức này, không cài bytes tùy ý
+        known_public_keys = [
+            path.read_bytes() for path in (directory / "joint-key.bin", directory / "jointPublicKey.bin")
+            if path.exists()
+        ]
+        if parts["joint_public_key"] not in known_public_keys:
+            raise HTTPException(status_code=409, detail="Joint public key does not match the one from this ceremony.")
+        # Nếu ngân hàng này là bên tổng hợp, EvalMultKey phải đúng là khóa đã gộp ở bước merge
+        merged_path = directory / "merge.bin"
+        if merged_path.exists() and merged_path.read_bytes() != parts["eval_mult_key"]:
+            raise HTTPException(status_code=409, detail="EvalMultKey does not match the one merged in this ceremony.")
+        keyCeremony.check_published_keys(parts["joint_public_key"], parts["eval_mult_key"])
+
+        # Cài khóa mới vào đúng tên file mà các script HEModule và sendToFECredit đang dùng
+        write_atomic(KEY_DIR / "jointPublicKey.txt", parts["joint_public_key"])
+        write_atomic(KEY_DIR / "evalMultKey_merged.txt", parts["eval_mult_key"])
+        write_atomic(KEY_DIR / f"{BANK_CODE}_privateKey.txt", private_key)
+        return json.dumps({"ceremony_id": ceremony_id, "bank": BANK_CODE}).encode("utf-8")
+
+    return await run_ceremony_step(ceremony_id, "publish", parts, compute)
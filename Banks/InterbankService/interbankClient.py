@@ -1,40 +1,25 @@
-import requests
 import json
-import base64
-from getpass import getpass
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import ec
-from cryptography import x509
 from pathlib import Path
+import secureClient
 
 URL_MAPPER = {
     "MSB": "192.168.1.11",
     "ACB": "192.168.1.12"
 }
 
-def load_context(path="../context.txt"):
-    context = {}
-    try:
-        with open(path, "r") as f:
-            for line in f:
-                if "=" in line:
-                    k, v = line.strip().split("=", 1)
-                    context[k.strip()] = v.strip()
-    except Exception:
-        pass
-    return context
-
-context = load_context()
+context = secureClient.load_context()
 BANK_CODE = context.get("BANK_CODE", "MSB")
 BANK_TARGET = context.get("TARGET_BANK", "ACB")
-SERVER_URL = f"https://{URL_MAPPER[BANK_TARGET]}/upload" 
+BASE_URL = f"https://{URL_MAPPER[BANK_TARGET]}"
 
-# === INPUT FILE ===
-file_path = input("Input file path: ").strip()
-file_path = Path(file_path)
-if not file_path.exists():
+# === INPUT FILE, THƯ MỤC HOẶC DANH SÁCH FILE ===
+# Thư mục hoặc nhiều file (cách nhau bởi dấu phẩy): gửi dưới một chữ ký qua vài request /upload/batch song song
+path_input = input("Input file path, directory, or comma-separated file paths: ").strip()
+input_paths = [Path(p.strip()) for p in path_input.split(",") if p.strip()]
+if not input_paths or not all(p.exists() for p in input_paths):
     print("File not exist.")
     exit(1)
+file_path = input_paths[0]
 
 # === OPTIONAL METADATA ===
 metadata_input = input("Input Metadata (JSON): ").strip()
@@ -44,58 +29,35 @@ except json.JSONDecodeError:
     print("Metadata not valid.")
     exit(1)
 
-# === LOAD EC PRIVATE KEY ===
-key_path = f"../Certificate/{BANK_CODE}.key"  
-try:
-    with open(key_path, "rb") as f:
-        private_key = serialization.load_pem_private_key(
-            f.read(),
-            password=None,
-        )  
-    if not isinstance(private_key, ec.EllipticCurvePrivateKey):
-        raise TypeError("Wrong EC Key")
-except Exception as e:
-    print(f"Lỗi khi tải private key: {e}")
-    exit(1)
-
-# === TẠO CHỮ KÝ SỐ ===
+# === LOAD EC PRIVATE KEY VÀ X.509 CERT ===
 try:
-    with open(file_path, "rb") as f:
-        file_bytes = f.read()
-    data_to_sign = file_bytes + json.dumps(metadata, sort_keys=True).encode()
-
-    signature = private_key.sign(
-        data_to_sign,
-        ec.ECDSA(hashes.SHA256())
-    )
-    signature_b64 = base64.b64encode(signature).decode()
+    identity = secureClient.get_identity(BANK_CODE)
 except Exception as e:
-    print(f"Lỗi khi tạo chữ ký số: {e}")
+    print(f"Lỗi khi tải private key/certificate: {e}")
     exit(1)
 
-# === LOAD X.509 CERT ===
-cert_path = f"../Certificate/{BANK_CODE}.crt"
-try:
-    with open(cert_path, "rb") as f:
-        cert_pem = f.read()
-        cert_obj = x509.load_pem_x509_certificate(cert_pem)
-except Exception as e:
-    print(f"Lỗi khi đọc certificate: {e}")
-    exit(1)
-
-# === GỬI REQUEST ===
-files = {
-    "file": (file_path.name, file_bytes),
-    "certificate": ("cert.pem", cert_pem),
-}
-data = {
-    "metadata": json.dumps(metadata),
-    "signature": signature_b64
-}
-
+# === GỬI CẢ THƯ MỤC HOẶC NHIỀU FILE ===
+if len(input_paths) > 1 or file_path.is_dir():
+    try:
+        print("Send batch requests...")
+        if file_path.is_dir():
+            responses = secureClient.upload_directory(BASE_URL, file_path, metadata, identity)
+        else:
+            responses = secureClient.upload_files(BASE_URL, input_paths, metadata, identity)
+        for response in responses:
+            print(f"✅ Server response({response.status_code}):\n{response.text}")
+    except Exception as e:
+        print(f"Lỗi khi gửi HTTPS request: {e}")
+    exit(0)
+
+# === GỬI THEO CHUNK, TỰ TIẾP TỤC PHIÊN CŨ NẾU CÓ ===
+# Chữ ký tính trên dữ liệu gốc; mỗi chunk được nén độc lập bằng codec mà hai bên cùng hỗ trợ
 try:
+    codec = secureClient.negotiate_codec(BASE_URL)
+    print(f"Codec: {codec}")
     print("Send request...")
-    response = requests.post(SERVER_URL, data=data, files=files, verify="./RootCA.crt", timeout=(10, 300))
+    response = secureClient.upload_resumable(BASE_URL, file_path, metadata, identity, codec=codec)
     print(f"✅ Server response({response.status_code}):\n{response.text}")
 except Exception as e:
     print(f"Lỗi khi gửi HTTPS request: {e}")
+    print("Chạy lại với cùng file để tiếp tục phần còn thiếu.")
@@ -0,0 +1,79 @@
+"""
+File: peerCertificates.py
+Mô tả: Xác thực certificate của bên gửi với RootCA, có cache
+Chức năng chính:
+- Kiểm tra chữ ký RootCA trên certificate
+- Cache các certificate đã xác thực theo SHA-256 fingerprint
+- PeerCertificateVerifier: kiểm tra thời hạn và chữ ký RootCA, bỏ qua nếu đã có trong cache
+Lưu ý: giữ đồng bộ với FinanceOrg/peerCertificates.py
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+
+def verify_certificate_signed_by_root(cert: x509.Certificate, root_cert: x509.Certificate) -> bool:
+    try:
+        # Verify cert được ký bởi RootCA bằng public key của RootCA
+        root_cert.public_key().verify(
+            cert.signature,
+            cert.tbs_certificate_bytes,
+            ec.ECDSA(cert.signature_hash_algorithm)
+        )
+        return True
+    except Exception:
+        return False
+
+class VerifiedCertificateCache:
+    """
+    Cache các certificate đã xác thực với RootCA, khóa theo SHA-256 fingerprint.
+    Mỗi entry hết hạn sau ttl_seconds hoặc khi certificate hết hạn, tùy mốc nào đến trước.
+    """
+    def __init__(self, max_entries: int = 256, ttl_seconds: int = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # fingerprint -> thời điểm hết hạn của entry
+        self._lock = threading.Lock()
+
+    def is_verified(self, cert: x509.Certificate) -> bool:
+        fingerprint = cert.fingerprint(hashes.SHA256())
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            expires_at = self._entries.get(fingerprint)
+            if expires_at is None:
+                return False
+            if now >= expires_at:
+                del self._entries[fingerprint]
+                return False
+            self._entries.move_to_end(fingerprint)
+            return True
+
+    def add(self, cert: x509.Certificate):
+        fingerprint = cert.fingerprint(hashes.SHA256())
+        expires_at = min(cert.not_valid_after_utc, datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds))
+        with self._lock:
+            self._entries[fingerprint] = expires_at
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class PeerCertificateVerifier:
+    """Xác thực certificate của bên gửi với một RootCA, dùng chung một cache."""
+    def __init__(self, root_cert: x509.Certificate, cache: VerifiedCertificateCache = None):
+        self.root_cert = root_cert
+        self.cache = cache or VerifiedCertificateCache()
+
+    def verify(self, cert: x509.Certificate) -> bool:
+        """Kiểm tra thời hạn và chữ ký RootCA của certificate, bỏ qua bước kiểm tra chuỗi nếu đã có trong cache."""
+        if self.cache.is_verified(cert):
+            return True
+        now = datetime.now(timezone.utc)
+        if not (cert.not_valid_before_utc <= now < cert.not_valid_after_utc):
+            return False
+        if not verify_certificate_signed_by_root(cert, self.root_cert):
+            return False
+        self.cache.add(cert)
+        return True
@@ -0,0 +1,377 @@
+"""
+File: secureClient.py
+Mô tả: Thư viện HTTPS dùng chung cho các script gửi dữ liệu phía ngân hàng
+Chức năng chính:
+- Session giữ kết nối (keep-alive) với connection pool, tái sử dụng TLS giữa các request
+- Nạp khóa ký, certificate và RootCA một lần cho mỗi process
+- Gửi lại khi lỗi mạng hoặc lỗi 5xx, chờ tăng dần giữa các lần
+- Upload theo chunk có thể tiếp tục tới /upload/sessions của interbankAPI
+- Upload nhiều file (cả thư mục) dưới một chữ ký tới /upload/batch, vài request song song
+- Hỏi /objects trước khi gửi: nội dung bên nhận đã có thì chỉ gắn tên, không gửi lại dữ liệu
+Được dùng bởi interbankClient.py, sendToFECredit.py, ceremonyCoordinator.py và Certificate/requestCert.py.
+"""
+
+import json
+import time
+import base64
+import hashlib
+import threading
+from pathlib import Path
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, utils
+import transportCodec
+
+ROOT_CA_PATH = "./RootCA.crt"
+CERT_DIR = Path("../Certificate")
+
+# Số host giữ pool riêng và số kết nối tối đa mỗi host
+POOL_CONNECTIONS = 8
+POOL_MAXSIZE = 16
+# Gửi lại khi lỗi mạng hoặc lỗi 5xx
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 2
+DEFAULT_TIMEOUT = (10, 300)
+
+# Upload theo chunk; phiên upload được lưu lại để lần chạy sau tiếp tục từ phần còn thiếu
+CHUNK_SIZE = 8 * 1024 * 1024
+STATE_DIR = Path("Uploads")
+# Số request /upload/batch gửi đồng thời khi upload cả thư mục
+BATCH_REQUESTS = 4
+
+def load_context(path="../context.txt"):
+    context = {}
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                if "=" in line:
+                    k, v = line.strip().split("=", 1)
+                    context[k.strip()] = v.strip()
+    except Exception:
+        pass
+    return context
+
+class SigningIdentity:
+    """Khóa EC và certificate của một ngân hàng, đọc từ ../Certificate/<bank>.key/.crt."""
+    def __init__(self, bank_code: str, cert_dir: Path = CERT_DIR):
+        self.bank_code = bank_code
+        with open(Path(cert_dir) / f"{bank_code}.key", "rb") as f:
+            self.private_key = serialization.load_pem_private_key(f.read(), password=None)
+        if not isinstance(self.private_key, ec.EllipticCurvePrivateKey):
+            raise TypeError("Key không phải là Elliptic Curve Private Key.")
+        with open(Path(cert_dir) / f"{bank_code}.crt", "rb") as f:
+            self.cert_pem = f.read()
+        self.certificate = x509.load_pem_x509_certificate(self.cert_pem)
+
+    def sign_digest(self, digest: bytes) -> bytes:
+        """Ký ECDSA lên SHA-256 digest đã tính sẵn."""
+        return self.private_key.sign(digest, ec.ECDSA(utils.Prehashed(hashes.SHA256())))
+
+    def sign_digest_b64(self, digest: bytes) -> str:
+        return base64.b64encode(self.sign_digest(digest)).decode("utf-8")
+
+class SecureClient:
+    """
+    Session HTTPS tin cậy RootCA, dùng chung cho mọi request tới cùng các host.
+    requests/urllib3 chỉ hỗ trợ HTTP/1.1, nên lợi ích đến từ keep-alive và connection pool.
+    """
+    def __init__(self, root_ca_path: str = ROOT_CA_PATH, max_attempts: int = MAX_ATTEMPTS,
+                 backoff_seconds: float = BACKOFF_SECONDS):
+        self.root_ca_path = root_ca_path
+        with open(root_ca_path, "rb") as f:
+            self.root_cert = x509.load_pem_x509_certificate(f.read())
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+
+        self.session = requests.Session()
+        self.session.verify = root_ca_path
+        adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+        self.session.mount("https://", adapter)
+
+    def request(self, method: str, url: str, build=None, retry: bool = True, **kwargs) -> requests.Response:
+        """
+        Gửi request, thử lại khi lỗi mạng hoặc lỗi 5xx; trả về response cuối cùng (status < 500).
+        build: hàm build(stack) trả về thêm kwargs cho mỗi lần gửi, dùng khi body là luồng không gửi lại được
+        (file đang mở, MultipartEncoder) để mỗi lần thử có body mới. File mở cho body phải đăng ký vào
+        stack (ExitStack) để được đóng ngay sau lần gửi đó.
+        """
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        attempts = self.max_attempts if retry else 1
+        for attempt in range(1, attempts + 1):
+            try:
+                with ExitStack() as stack:
+                    response = self.session.request(method, url, **kwargs, **(build(stack) if build else {}))
+                if response.status_code < 500:
+                    return response
+                error = f"{response.status_code}: {response.text}"
+                if attempt == attempts:
+                    return response
+            except requests.RequestException as e:
+                error = str(e)
+                if attempt == attempts:
+                    raise
+            delay = self.backoff_seconds * 2 ** (attempt - 1)
+            print(f"{method} {url} failed ({error}), retrying in {delay}s...")
+            time.sleep(delay)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def verify_server_certificate(self, cert_pem: bytes) -> x509.Certificate:
+        """Kiểm tra certificate do server gửi kèm kết quả có được RootCA ký; lỗi thì raise."""
+        cert = x509.load_pem_x509_certificate(cert_pem)
+        self.root_cert.public_key().verify(
+            cert.signature,
+            cert.tbs_certificate_bytes,
+            ec.ECDSA(cert.signature_hash_algorithm)
+        )
+        return cert
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+_lock = threading.Lock()
+_clients = {}
+_identities = {}
+
+def get_client(root_ca_path: str = ROOT_CA_PATH) -> SecureClient:
+    """SecureClient dùng chung trong process cho mỗi RootCA."""
+    with _lock:
+        if root_ca_path not in _clients:
+            _clients[root_ca_path] = SecureClient(root_ca_path)
+        return _clients[root_ca_path]
+
+def get_identity(bank_code: str, cert_dir: Path = CERT_DIR) -> SigningIdentity:
+    """SigningIdentity của bank_code, nạp một lần trong process."""
+    with _lock:
+        key = (bank_code, str(cert_dir))
+        if key not in _identities:
+            _identities[key] = SigningIdentity(bank_code, cert_dir)
+        return _identities[key]
+
+def negotiate_codec(base_url: str, client: SecureClient = None) -> str:
+    """Chọn codec nén mà cả hai bên cùng hỗ trợ; không hỏi được thì không nén."""
+    client = client or get_client()
+    try:
+        server_codecs = client.get(f"{base_url}/codecs", retry=False, timeout=(10, 30)).json()["codecs"]
+    except Exception:
+        server_codecs = [transportCodec.IDENTITY]
+    return transportCodec.choose_codec(server_codecs)
+
+def hash_upload(file_path: Path, metadata: dict):
+    """
+    Trả về (SHA-256 của file, SHA-256(file_bytes + metadata)), băm theo chunk.
+    interbankAPI xác minh chữ ký trên digest thứ hai; digest thứ nhất là khóa trong kho nội dung.
+    """
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            hasher.update(chunk)
+    file_digest = hasher.digest()
+    hasher.update(json.dumps(metadata, sort_keys=True).encode())
+    return file_digest, hasher.digest()
+
+def object_exists(base_url: str, digest: bytes, client: SecureClient = None) -> bool:
+    """Bên nhận đã có nội dung với SHA-256 này chưa; không hỏi được thì coi như chưa có."""
+    client = client or get_client()
+    try:
+        return client.get(f"{base_url}/objects/{digest.hex()}", retry=False, timeout=(10, 30)).status_code == 200
+    except requests.RequestException:
+        return False
+
+def link_objects(base_url: str, digests: dict, metadata: dict, identity: SigningIdentity,
+                 client: SecureClient = None) -> requests.Response:
+    """
+    Gắn tên cho nội dung bên nhận đã có (digests: tên file -> SHA-256), không gửi dữ liệu.
+    Chữ ký giống hệt khi gửi chính các file đó qua /upload/batch.
+    """
+    client = client or get_client()
+    data = {
+        "manifest": json.dumps({name: digest.hex() for name, digest in digests.items()}),
+        "metadata": json.dumps(metadata),
+        "signature": identity.sign_digest_b64(compute_signed_digest(digests, metadata)),
+    }
+    files = {"certificate": (f"{identity.bank_code}.crt", identity.cert_pem, "application/x-x509-ca-cert")}
+    return client.post(f"{base_url}/objects/link", data=data, files=files, timeout=(10, 60))
+
+def upload_resumable(base_url: str, file_path: Path, metadata: dict, identity: SigningIdentity,
+                     client: SecureClient = None, codec: str = None, state_dir: Path = STATE_DIR) -> requests.Response:
+    """
+    Gửi file tới interbankAPI qua phiên upload theo chunk, rồi commit kèm chữ ký.
+    Mỗi chunk được nén độc lập, offset tính trên dữ liệu gốc. Nếu lần trước bị gián đoạn,
+    phiên cũ (lưu trong state_dir) được tiếp tục từ các đoạn còn thiếu. Trả về response của bước commit.
+    """
+    client = client or get_client()
+    file_path = Path(file_path)
+    codec = codec or negotiate_codec(base_url, client)
+    sessions_url = f"{base_url}/upload/sessions"
+    file_digest, signed_digest = hash_upload(file_path, metadata)
+
+    # Bên nhận đã có nội dung này (vd. khóa không đổi giữa các phiên) thì chỉ gắn tên
+    if object_exists(base_url, file_digest, client):
+        response = link_objects(base_url, {file_path.name: file_digest}, metadata, identity, client)
+        if response.status_code == 200:
+            print(f"{file_path.name}: receiver already has this content, linked without upload.")
+            return response
+    signature_b64 = identity.sign_digest_b64(signed_digest)
+
+    file_stat = file_path.stat()
+    file_identity = {"path": str(file_path.resolve()), "size": file_stat.st_size, "mtime": file_stat.st_mtime}
+    Path(state_dir).mkdir(exist_ok=True)
+    host = base_url.split("://", 1)[-1].replace(":", "_").replace("/", "_")
+    state_path = Path(state_dir) / f"{host}_{file_path.name}.session.json"
+
+    status = None
+    if state_path.exists():
+        state = json.loads(state_path.read_text())
+        if state["file"] == file_identity:
+            response = client.get(f"{sessions_url}/{state['session_id']}", timeout=(10, 30))
+            if response.status_code == 200:
+                status = response.json()
+                print(f"Resuming upload session {state['session_id']} for {file_path.name}.")
+    if status is None:
+        # Phiên chỉ được mở kèm certificate và chữ ký trên SHA-256 của file, như /objects/link
+        response = client.post(sessions_url, data={
+            "filename": file_path.name,
+            "size": file_stat.st_size,
+            "sha256": file_digest.hex(),
+            "metadata": json.dumps(metadata),
+            "signature": identity.sign_digest_b64(compute_signed_digest({file_path.name: file_digest}, metadata)),
+        }, files={"certificate": ("cert.pem", identity.cert_pem)}, timeout=(10, 30))
+        if response.status_code != 201:
+            raise Exception(f"Cannot create upload session ({response.status_code}): {response.text}")
+        status = response.json()
+        state_path.write_text(json.dumps({"session_id": status["session_id"], "file": file_identity}))
+    session_url = f"{sessions_url}/{status['session_id']}"
+
+    # Gửi các đoạn còn thiếu
+    with open(file_path, "rb") as f:
+        for start, end in status["missing"]:
+            for offset in range(start, end, CHUNK_SIZE):
+                f.seek(offset)
+                payload = transportCodec.compress(f.read(min(CHUNK_SIZE, end - offset)), codec)
+                response = client.put(session_url, params={"offset": offset, transportCodec.ENCODING_FIELD: codec},
+                                      data=payload)
+                if response.status_code != 200:
+                    raise Exception(f"Chunk at {offset} rejected ({response.status_code}): {response.text}")
+
+    # Xác nhận và gửi chữ ký
+    response = client.post(
+        f"{session_url}/commit",
+        data={"metadata": json.dumps(metadata), "signature": signature_b64},
+        files={"certificate": ("cert.pem", identity.cert_pem)},
+        timeout=(10, 600)
+    )
+    if response.status_code == 200:
+        state_path.unlink(missing_ok=True)
+    return response
+
+def hash_file(path: Path) -> bytes:
+    """Băm SHA-256 một file theo từng chunk, không nạp cả file vào bộ nhớ."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.digest()
+
+def compute_signed_digest(part_digests: dict, metadata: dict) -> bytes:
+    """
+    Digest được ký: SHA-256(H(part_1) || ... || H(part_n) || H(metadata)),
+    các phần sắp xếp theo tên, H là SHA-256. Phải khớp với interbankAPI và HEServer.compute_signed_digest.
+    """
+    hasher = hashlib.sha256()
+    for key in sorted(part_digests.keys()):
+        hasher.update(part_digests[key])
+    hasher.update(hashlib.sha256(json.dumps(metadata, sort_keys=True).encode('utf-8')).digest())
+    return hasher.digest()
+
+def upload_batch(base_url: str, paths, metadata: dict, identity: SigningIdentity,
+                 client: SecureClient = None, codec: str = None, digests: dict = None) -> requests.Response:
+    """
+    Gửi nhiều file trong một request tới /upload/batch, một chữ ký trên digest của từng file và metadata.
+    digests: SHA-256 đã tính sẵn theo đường dẫn, nếu có.
+    """
+    client = client or get_client()
+    codec = codec or negotiate_codec(base_url, client)
+    paths = [Path(path) for path in paths]
+    digests = digests or {}
+    signed_digest = compute_signed_digest({path.name: digests.get(path) or hash_file(path) for path in paths}, metadata)
+    data = {
+        "metadata": json.dumps(metadata),
+        "signature": identity.sign_digest_b64(signed_digest),
+        transportCodec.ENCODING_FIELD: codec,
+    }
+
+    def build_body(stack: ExitStack):
+        # Không nén thì file được stream từ đĩa; body được dựng lại cho mỗi lần gửi
+        fields = list(data.items())
+        for path in paths:
+            content = stack.enter_context(open(path, "rb")) if codec == transportCodec.IDENTITY else transportCodec.compress(path.read_bytes(), codec)
+            fields.append(("files", (path.name, content, "application/octet-stream")))
+        fields.append(("certificate", (f"{identity.bank_code}.crt", identity.cert_pem, "application/x-x509-ca-cert")))
+        encoder = MultipartEncoder(fields=fields)
+        return {"data": encoder, "headers": {"Content-Type": encoder.content_type}}
+
+    return client.post(f"{base_url}/upload/batch", build=build_body, timeout=(10, 600))
+
+def upload_files(base_url: str, paths, metadata: dict, identity: SigningIdentity,
+                 client: SecureClient = None, requests_count: int = BATCH_REQUESTS) -> list:
+    """
+    Gửi các file qua tối đa requests_count request /upload/batch đồng thời,
+    chia file sao cho tổng kích thước mỗi request gần bằng nhau. File mà bên nhận đã có nội dung
+    được gắn tên bằng một request /objects/link. Trả về danh sách response.
+    """
+    client = client or get_client()
+    paths = sorted((Path(p) for p in paths), key=lambda p: p.stat().st_size, reverse=True)
+    if not paths:
+        raise Exception("No files to upload.")
+    codec = negotiate_codec(base_url, client)
+
+    responses = []
+    digests = {path: hash_file(path) for path in paths}
+    existing = [path for path in paths if object_exists(base_url, digests[path], client)]
+    if existing:
+        response = link_objects(base_url, {path.name: digests[path] for path in existing}, metadata, identity, client)
+        if response.status_code == 200:
+            print(f"{len(existing)} files already on receiver, linked without upload.")
+            responses.append(response)
+            paths = [path for path in paths if path not in existing]
+    if not paths:
+        return responses
+
+    # Gán file lớn trước vào nhóm đang nhẹ nhất
+    groups = [[] for _ in range(min(requests_count, len(paths)))]
+    sizes = [0] * len(groups)
+    for path in paths:
+        i = sizes.index(min(sizes))
+        groups[i].append(path)
+        sizes[i] += path.stat().st_size
+
+    with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+        futures = [pool.submit(upload_batch, base_url, group, metadata, identity, client, codec, digests)
+                   for group in groups]
+        return responses + [future.result() for future in futures]
+
+def upload_directory(base_url: str, directory: Path, metadata: dict, identity: SigningIdentity,
+                     client: SecureClient = None, requests_count: int = BATCH_REQUESTS) -> list:
+    """Gửi mọi file trong directory bằng upload_files."""
+    paths = [p for p in Path(directory).iterdir() if p.is_file()]
+    return upload_files(base_url, paths, metadata, identity, client, requests_count)
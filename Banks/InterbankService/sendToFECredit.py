@@ -1,14 +1,20 @@
 import requests
 import json
-import base64
+import hashlib
+import os
+import tempfile
+import time
 from pathlib import Path
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import ec
-from cryptography import x509
-from cryptography.hazmat.primitives import hashes, serialization
+from contextlib import ExitStack
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, utils
 from cryptography.exceptions import InvalidSignature
-from requests_toolbelt.multipart import decoder
-from base64 import b64decode
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+import transportCodec
+import secureClient
+from secureClient import hash_file, compute_signed_digest
 
 # === CẤU HÌNH ===
 URL_MAPPER = {
@@ -16,8 +22,96 @@ URL_MAPPER = {
 }
 # Endpoint trên server nhận
 API_ENDPOINT = "/calculate-credit-score"
+BATCH_API_ENDPOINT = "/calculate-credit-score-batch"
 
 ROOT_CA_PATH = "./RootCA.crt" 
+# Session keep-alive dùng chung cho mọi request tới server (submit, poll, lấy kết quả)
+client = secureClient.get_client(ROOT_CA_PATH)
+
+# Khoảng thời gian giữa các lần hỏi trạng thái job (giây)
+JOB_POLL_INTERVAL = 5
+
+# Kích thước chunk khi đọc response
+READ_CHUNK_SIZE = 1024 * 1024
+
+def receive_multipart_response(response, output_dir: Path, file_parts=("result_data",)) -> dict:
+    """
+    Parse multipart response theo luồng (response phải được gửi với stream=True).
+    Các phần trong file_parts được ghi thẳng ra file tạm trong output_dir và băm SHA-256
+    khi nhận; các phần nhỏ còn lại (chữ ký, certificate) giữ trong bộ nhớ.
+    Trả về dict: tên phần -> bytes, hoặc (đường dẫn file tạm, SHA-256) với các phần trong file_parts.
+    """
+    _, options = parse_options_header(response.headers.get("Content-Type", ""))
+    boundary = options.get(b"boundary")
+    if not boundary:
+        raise ValueError("Response is not multipart.")
+
+    parts = {}
+    state = {}
+
+    def on_part_begin():
+        state.update(name=None, header_field=b"", header_value=b"", sink=None)
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        if state["header_field"].lower() == b"content-disposition":
+            _, disposition = parse_options_header(state["header_value"])
+            state["name"] = disposition[b"name"].decode()
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        if state["name"] in file_parts:
+            fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix=".part")
+            state["sink"] = (os.fdopen(fd, "wb"), tmp_path, hashlib.sha256())
+        else:
+            state["sink"] = bytearray()
+
+    def on_part_data(data, start, end):
+        sink = state["sink"]
+        if isinstance(sink, bytearray):
+            sink += data[start:end]
+        else:
+            sink[0].write(data[start:end])
+            sink[2].update(data[start:end])
+
+    def on_part_end():
+        sink = state["sink"]
+        if isinstance(sink, bytearray):
+            parts[state["name"]] = bytes(sink)
+        else:
+            sink[0].close()
+            parts[state["name"]] = (Path(sink[1]), sink[2].digest())
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    try:
+        for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+            parser.write(chunk)
+        parser.finalize()
+    except Exception:
+        # Dọn các file tạm đã tạo nếu response bị lỗi giữa chừng
+        for value in parts.values():
+            if isinstance(value, tuple):
+                value[0].unlink(missing_ok=True)
+        sink = state.get("sink")
+        if isinstance(sink, tuple):
+            sink[0].close()
+            Path(sink[1]).unlink(missing_ok=True)
+        raise
+    return parts
 
 # Danh sách các "key" của file mà server mong đợi
 REQUIRED_FILE_KEYS = [
@@ -34,7 +128,18 @@ REQUIRED_FILE_KEYS = [
 # === NHẬP THÔNG TIN CƠ BẢN ===
 bank_code_sender = input("Enter your bank code: ").strip().upper()
 SERVER_KEY = "FECREDIT" 
-SERVER_URL = f"{URL_MAPPER[SERVER_KEY]}{API_ENDPOINT}"
+# Chế độ batch: mỗi ciphertext chứa nhiều khách hàng (mỗi slot một khách hàng)
+count_input = input("How many customers are packed per ciphertext? (default 1): ").strip()
+customer_count = int(count_input) if count_input else 1
+if customer_count > 1:
+    API_ENDPOINT = BATCH_API_ENDPOINT
+# Công thức tính điểm, giống nhau cho cả request đơn lẻ và batch
+scoring = input("Scoring formula, full or simplified? (default full): ").strip().lower() or "full"
+if scoring not in ("full", "simplified"):
+    print("Lỗi: công thức tính điểm phải là full hoặc simplified.")
+    exit(1)
+# Gửi dưới dạng job bất đồng bộ: submit -> poll -> fetch
+SERVER_URL = f"{URL_MAPPER[SERVER_KEY]}/jobs{API_ENDPOINT}"
 
 # === NHẬP ĐƯỜNG DẪN CÁC FILE ===
 print("\n--- Enter required filepath ---")
@@ -56,100 +161,137 @@ try:
 except json.JSONDecodeError:
     print("Lỗi: Metadata không phải là JSON hợp lệ.")
     exit(1)
+if customer_count > 1:
+    metadata["customer_count"] = customer_count
+# Công thức nằm trong metadata nên được ký cùng dữ liệu
+metadata["scoring"] = scoring
 
-# === LOAD EC PRIVATE KEY CỦA BÊN GỬI ===
-key_path = f"../Certificate/{bank_code_sender}.key"  
+# === LOAD EC PRIVATE KEY VÀ X.509 CERTIFICATE CỦA BÊN GỬI ===
+# Certificate sẽ được gửi đi để bên nhận dùng public key trong đó để xác minh chữ ký
 try:
-    with open(key_path, "rb") as f:
-        private_key = serialization.load_pem_private_key(
-            f.read(),
-            password=None,  # Thêm password nếu key có mã hóa
-        )
-    if not isinstance(private_key, ec.EllipticCurvePrivateKey):
-        raise TypeError("Key không phải là Elliptic Curve Private Key.")
+    identity = secureClient.get_identity(bank_code_sender)
 except Exception as e:
-    print(f"Lỗi khi tải private key từ '{key_path}': {e}")
+    print(f"Lỗi khi tải private key/certificate của '{bank_code_sender}': {e}")
     exit(1)
 
 # === TẠO CHỮ KÝ SỐ ===
 try:
-    # 1. Đọc nội dung tất cả các file vào bộ nhớ
-    file_contents = {}
-    for key, path in input_files.items():
-        with open(path, "rb") as f:
-            file_contents[key] = f.read()
-
-    # 2. Tạo dữ liệu để ký
-    #    Rất quan trọng: Nối nội dung các file theo thứ tự key đã được sắp xếp
-    #    để đảm bảo bên nhận có thể tái tạo lại đúng thứ tự để xác minh.
-    data_to_sign = b''
-    for key in sorted(file_contents.keys()):
-        data_to_sign += file_contents[key]
-    
-    # 3. Nối metadata đã được chuẩn hóa vào cuối
-    data_to_sign += json.dumps(metadata, sort_keys=True).encode('utf-8')
-
-    # 4. Ký lên dữ liệu tổng hợp bằng private key
-    signature = private_key.sign(
-        data_to_sign,
-        ec.ECDSA(hashes.SHA256())
-    )
-    signature_b64 = base64.b64encode(signature).decode('utf-8')
+    # 1. Băm từng file theo chunk (không đọc cả file vào bộ nhớ)
+    part_digests = {key: hash_file(path) for key, path in input_files.items()}
+
+    # 1b. Nếu server đã cache EvalKey (cùng SHA-256) thì chỉ gửi digest thay cho cả khóa
+    eval_key_digest = part_digests['eval_mult_key'].hex()
+    eval_key_cached = False
+    try:
+        check = client.get(f"{URL_MAPPER[SERVER_KEY]}/eval-keys/{eval_key_digest}", retry=False, timeout=(10, 30))
+        eval_key_cached = check.status_code == 200
+    except requests.exceptions.RequestException:
+        pass
+    if eval_key_cached:
+        print("Server already has this EvalMultKey, sending its digest only.")
+        part_digests['eval_mult_key'] = hashlib.sha256(eval_key_digest.encode('utf-8')).digest()
+
+    # 2. Tạo digest tổng hợp từ digest của từng file (theo thứ tự key đã sắp xếp) và metadata
+    signed_digest = compute_signed_digest(part_digests, metadata)
+
+    # 3. Ký ECDSA lên digest đã băm sẵn bằng private key
+    signature_b64 = identity.sign_digest_b64(signed_digest)
     print("\nCreate digital signature successful.")
 
 except Exception as e:
     print(f"Lỗi khi tạo chữ ký số: {e}")
     exit(1)
 
-# === LOAD X.509 CERTIFICATE CỦA BÊN GỬI ===
-# Certificate này sẽ được gửi đi để bên nhận dùng public key trong đó để xác minh chữ ký
-cert_path = f"../Certificate/{bank_code_sender}.crt"
-try:
-    with open(cert_path, "rb") as f:
-        cert_pem_bytes = f.read()
-except Exception as e:
-    print(f"Lỗi khi đọc certificate từ '{cert_path}': {e}")
-    exit(1)
-
 # === CHUẨN BỊ VÀ GỬI REQUEST ===
-# Chuẩn bị `files` dictionary cho requests
-# Bao gồm tất cả các file dữ liệu VÀ file certificate của bên gửi
-files_to_send = {
-    # Thêm certificate vào danh sách file gửi đi
-    "certificate": (f"{bank_code_sender}.crt", cert_pem_bytes, 'application/x-x509-ca-cert'),
-}
-for key, content in file_contents.items():
-    # Sử dụng tên file gốc làm tên trong request
-    original_filename = input_files[key].name
-    files_to_send[key] = (original_filename, content, 'application/octet-stream')
+# Chọn codec nén mà server hỗ trợ; chữ ký vẫn tính trên dữ liệu gốc
+codec = secureClient.negotiate_codec(URL_MAPPER[SERVER_KEY], client)
+print(f"Transport codec: {codec}")
+
+# Dữ liệu đã nén được giữ lại để gửi lại khi cần; không nén thì file được stream từ đĩa khi gửi
+compressed_files = {}
+if codec != transportCodec.IDENTITY:
+    for key, path in input_files.items():
+        if not (key == 'eval_mult_key' and eval_key_cached):
+            compressed_files[key] = transportCodec.compress(path.read_bytes(), codec)
+
+def build_files_to_send(stack: ExitStack) -> dict:
+    """
+    Bao gồm tất cả các file dữ liệu VÀ file certificate của bên gửi; tạo mới cho mỗi lần gửi.
+    File mở ra được đăng ký vào stack để secureClient đóng sau lần gửi đó.
+    """
+    files_to_send = {
+        "certificate": (f"{bank_code_sender}.crt", identity.cert_pem, 'application/x-x509-ca-cert'),
+    }
+    for key, path in input_files.items():
+        if key == 'eval_mult_key' and eval_key_cached:
+            continue
+        # Sử dụng tên file gốc làm tên trong request
+        content = compressed_files[key] if key in compressed_files else stack.enter_context(open(path, "rb"))
+        files_to_send[key] = (path.name, content, 'application/octet-stream')
+    return files_to_send
 
 # Chuẩn bị `data` dictionary cho requests (form data)
 data_to_send = {
     "metadata": json.dumps(metadata),
-    "signature": signature_b64
+    "signature": signature_b64,
+    transportCodec.ENCODING_FIELD: codec
 }
+if eval_key_cached:
+    data_to_send["eval_mult_key_digest"] = eval_key_digest
 
 try:
     print(f"Sending request...")
-    response = requests.post(SERVER_URL, data=data_to_send, files=files_to_send, verify="./RootCA.crt", timeout=(1000000, 3000000))
-    
+    # MultipartEncoder stream từng file thay vì dựng toàn bộ body trong bộ nhớ; dựng lại khi gửi lại
+    def build_body(stack: ExitStack):
+        encoder = MultipartEncoder(fields={**data_to_send, **build_files_to_send(stack)})
+        return {"data": encoder, "headers": {"Content-Type": encoder.content_type}}
+    response = client.post(SERVER_URL, build=build_body, timeout=(10, 600))
+
+    # Server trả 409 khi EvalKey bị loại khỏi cache sau lần kiểm tra ở trên: ký lại trên cả khóa và gửi lại
+    if response.status_code == 409 and eval_key_cached:
+        print("Server no longer has this EvalMultKey cached, sending the full key...")
+        eval_key_cached = False
+        part_digests['eval_mult_key'] = bytes.fromhex(eval_key_digest)
+        data_to_send["signature"] = identity.sign_digest_b64(compute_signed_digest(part_digests, metadata))
+        del data_to_send["eval_mult_key_digest"]
+        if codec != transportCodec.IDENTITY:
+            compressed_files['eval_mult_key'] = transportCodec.compress(input_files['eval_mult_key'].read_bytes(), codec)
+        response = client.post(SERVER_URL, build=build_body, timeout=(10, 600))
+
+    if response.status_code == 202:
+        job_id = response.json()["job_id"]
+        job_url = f"{URL_MAPPER[SERVER_KEY]}/jobs/{job_id}"
+        print(f"Job {job_id} accepted. Waiting for result...")
+        while True:
+            status_response = client.get(job_url, timeout=(10, 30))
+            if status_response.status_code != 200:
+                print(f"Cannot get job status ({status_response.status_code}): {status_response.text}")
+                exit(1)
+            status = status_response.json()
+            if status["status"] in ("done", "failed"):
+                break
+            time.sleep(JOB_POLL_INTERVAL)
+        print(f"Job finished with status: {status['status']}")
+        if status["status"] == "failed":
+            print(f"Job failed: {status.get('error')}")
+            exit(1)
+        # Lấy kết quả (hoặc lỗi) theo luồng như response đồng bộ trước đây
+        response = client.get(f"{job_url}/result", timeout=(10, 600), stream=True)
+
     print(f"Server response with status code: {response.status_code}")
 
     if response.status_code == 200:
         print("\n--- Verifying response from server ---")
         
-        # 1. Parse multipart response
+        output_dir = Path("Received")
+        output_dir.mkdir(exist_ok=True)
+
+        # 1. Parse multipart response theo luồng, kết quả được ghi thẳng ra file tạm
         try:
-            multipart_data = {}
-            # Dùng decoder để tách các part ra
-            for part in decoder.MultipartDecoder.from_response(response).parts:
-                # Lấy tên của part từ header 'Content-Disposition'
-                disposition = part.headers[b'Content-Disposition'].decode()
-                name = [p.split('=')[1].strip('"') for p in disposition.split(';') if 'name=' in p][0]
-                multipart_data[name] = part.content # Lưu nội dung (bytes)
+            multipart_data = receive_multipart_response(response, output_dir)
 
             # Lấy dữ liệu từ dict đã parse
-            result_bytes = multipart_data['result_data']
+            result_tmp_path, result_digest = multipart_data['result_data']
             server_signature_bytes = multipart_data['server_signature']
             server_cert_pem_bytes = multipart_data['server_certificate']
             print("OK: Multipart response package parsed successfully.")
@@ -160,19 +302,12 @@ try:
         # 2. LỚP BẢO VỆ 1: Kiểm tra cert của server (logic không đổi)
         try:
             print("Step 1: Verifying server's certificate against RootCA...")
-            with open(ROOT_CA_PATH, "rb") as f:
-                root_cert = x509.load_pem_x509_certificate(f.read())
-            
-            server_cert = x509.load_pem_x509_certificate(server_cert_pem_bytes)
-            
-            root_cert.public_key().verify(
-                server_cert.signature,
-                server_cert.tbs_certificate_bytes,
-                ec.ECDSA(server_cert.signature_hash_algorithm)
-            )
+            # RootCA đã được nạp một lần cùng với session
+            server_cert = client.verify_server_certificate(server_cert_pem_bytes)
             print("OK: Server's certificate is trusted.")
         except Exception as e:
             print(f"CRITICAL: Server's certificate cannot be trusted! Aborting. Reason: {e}")
+            result_tmp_path.unlink(missing_ok=True)
             exit(1)
             
         # 3. LỚP BẢO VỆ 2: Kiểm tra chữ ký của server (logic không đổi)
@@ -180,26 +315,28 @@ try:
             print("Step 2: Verifying server's signature on the result data...")
             server_public_key = server_cert.public_key()
             
+            # Server ký ECDSA-SHA256 trên kết quả; digest đã được tính khi nhận nên dùng Prehashed
             server_public_key.verify(
                 server_signature_bytes, # Dùng trực tiếp bytes
-                result_bytes,           # Dùng trực tiếp bytes
-                ec.ECDSA(hashes.SHA256())
+                result_digest,
+                ec.ECDSA(utils.Prehashed(hashes.SHA256()))
             )
             print("OK: Server's signature is valid. Response is authentic and integral.")
         except InvalidSignature:
             print("CRITICAL: Invalid signature from server! Response may have been tampered with. Aborting.")
+            result_tmp_path.unlink(missing_ok=True)
             exit(1)
         except Exception as e:
             print(f"CRITICAL: An error occurred while verifying server signature. Aborting. Reason: {e}")
+            result_tmp_path.unlink(missing_ok=True)
             exit(1)
 
-        # 4. Chỉ khi TẤT CẢ đều OK, mới lưu file
-        output_dir = Path("Received")
-        output_dir.mkdir(exist_ok=True)
+        # 4. Chỉ khi TẤT CẢ đều OK, mới đổi tên file tạm thành file kết quả
         output_filename = output_dir / 'encryptedResult.bin'
-        
-        with open(output_filename, 'wb') as f:
-            f.write(result_bytes)
+        os.replace(result_tmp_path, output_filename)
+        # Ghi số khách hàng cạnh kết quả để batchDecrypt.py biết cần lấy bao nhiêu slot
+        with open(f"{output_filename}.json", "w") as f:
+            json.dump({"customer_count": customer_count}, f)
         print(f"\nSuccess! Verified result has been saved to '{output_filename}'")
         
     else:
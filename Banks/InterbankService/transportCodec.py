@@ -0,0 +1,128 @@
+"""
+File: transportCodec.py
+Mô tả: Định dạng nén tùy chọn cho khóa và ciphertext truyền giữa các ngân hàng và FE Credit
+Chức năng chính:
+- Nén/giải nén bằng zstd (nếu cài gói zstandard) hoặc zlib
+- Giải nén theo luồng ở phía nhận, từng chunk một, với giới hạn tổng số byte sau giải nén
+- Thương lượng codec: client chọn codec đầu tiên mà cả hai bên cùng hỗ trợ
+Lưu ý: giữ đồng bộ với FinanceOrg/transportCodec.py
+"""
+
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Tên form field/metadata mô tả codec của các file đã nén
+ENCODING_FIELD = "content_encoding"
+IDENTITY = "identity"
+
+# Mức nén mặc định: ưu tiên tốc độ vì dữ liệu OpenFHE BINARY chủ yếu là hệ số ngẫu nhiên
+DEFAULT_LEVELS = {"zstd": 3, "zlib": 1}
+
+# Kích thước tối đa của mỗi phần dữ liệu giải nén được chuyển cho bên gọi
+OUTPUT_CHUNK_SIZE = 1024 * 1024
+
+class OutputLimitExceeded(ValueError):
+    """Dữ liệu sau giải nén vượt quá giới hạn của request (decompression bomb)."""
+
+def available_codecs() -> list:
+    """Các codec được hỗ trợ, theo thứ tự ưu tiên."""
+    codecs = []
+    if zstandard is not None:
+        codecs.append("zstd")
+    codecs.append("zlib")
+    codecs.append(IDENTITY)
+    return codecs
+
+def choose_codec(remote_codecs) -> str:
+    """Chọn codec ưu tiên nhất mà bên nhận cũng hỗ trợ."""
+    for codec in available_codecs():
+        if codec in remote_codecs:
+            return codec
+    return IDENTITY
+
+def compress(data: bytes, codec: str, level: int = None) -> bytes:
+    if codec == IDENTITY:
+        return data
+    level = DEFAULT_LEVELS[codec] if level is None else level
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if codec == "zlib":
+        return zlib.compress(data, level)
+    raise ValueError(f"Unsupported codec: {codec}")
+
+class _Decompressor:
+    """
+    Giải nén theo luồng, chuyển đầu ra cho write(phần) theo từng phần tối đa OUTPUT_CHUNK_SIZE byte,
+    nên bộ nhớ chỉ giữ một phần dù tỉ lệ nén cao tới đâu. Tổng đầu ra vượt max_output_size
+    thì ném OutputLimitExceeded ngay, không giải nén tiếp.
+    """
+    def __init__(self, max_output_size: int = None):
+        self.max_output_size = max_output_size
+        self.output_size = 0
+
+    def _emit(self, data: bytes, write):
+        if not data:
+            return
+        self.output_size += len(data)
+        if self.max_output_size is not None and self.output_size > self.max_output_size:
+            raise OutputLimitExceeded(f"Decompressed data exceeds {self.max_output_size} bytes")
+        write(data)
+
+    def flush(self, write):
+        pass
+
+class _IdentityDecompressor(_Decompressor):
+    def decompress(self, data: bytes, write):
+        self._emit(data, write)
+
+class _ZlibDecompressor(_Decompressor):
+    def __init__(self, max_output_size: int = None):
+        super().__init__(max_output_size)
+        self._obj = zlib.decompressobj()
+
+    def decompress(self, data: bytes, write):
+        # Giới hạn đầu ra mỗi lần gọi; phần đầu vào chưa dùng nằm trong unconsumed_tail
+        while True:
+            output = self._obj.decompress(data, OUTPUT_CHUNK_SIZE)
+            self._emit(output, write)
+            data = self._obj.unconsumed_tail
+            if not data and len(output) < OUTPUT_CHUNK_SIZE:
+                return
+
+    def flush(self, write):
+        self._emit(self._obj.flush(), write)
+
+class _ZstdDecompressor(_Decompressor):
+    def __init__(self, max_output_size: int = None):
+        super().__init__(max_output_size)
+        self._write = None
+        # stream_writer gọi self.write cho mỗi phần đầu ra tối đa OUTPUT_CHUNK_SIZE byte
+        self._writer = zstandard.ZstdDecompressor().stream_writer(
+            self, write_size=OUTPUT_CHUNK_SIZE, write_return_read=True)
+
+    def write(self, data: bytes) -> int:
+        self._emit(data, self._write)
+        return len(data)
+
+    def decompress(self, data: bytes, write):
+        self._write = write
+        self._writer.write(data)
+
+def decompressor(codec: str, max_output_size: int = None):
+    """
+    Trả về bộ giải nén theo luồng với hai hàm decompress(chunk, write) và flush(write);
+    write nhận lần lượt từng phần dữ liệu gốc. max_output_size: giới hạn tổng số byte sau giải nén.
+    """
+    if codec == IDENTITY:
+        return _IdentityDecompressor(max_output_size)
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd codec is not available on this host")
+        return _ZstdDecompressor(max_output_size)
+    if codec == "zlib":
+        return _ZlibDecompressor(max_output_size)
+    raise ValueError(f"Unsupported codec: {codec}")
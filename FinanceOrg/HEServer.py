@@ -3,23 +3,33 @@ import json
 import base64
 import logging
 import traceback
-from typing import Dict, Any
+import time
+import asyncio
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
-from fastapi.responses import Response
+from fastapi.responses import StreamingResponse, Response
 import openfhe as fhe
 import numpy as np
 from cryptography import x509
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric import ec, utils
 from cryptography.exceptions import InvalidSignature
 import uuid
+import transportCodec
+import metrics
+import peerCertificates
 
 # --- CONFIGURATION ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Secure Homomorphic Credit Score Server")
-
 CUSTOM_CA_PATH = "./Certificate/RootCA.crt" 
 SERVER_KEY_PATH = "./Certificate/FECREDIT.key"
 SERVER_CERT_PATH = "./Certificate/FECREDIT.crt"
@@ -27,21 +37,494 @@ SERVER_CERT_PATH = "./Certificate/FECREDIT.crt"
 if not os.path.exists(CUSTOM_CA_PATH):
     raise FileNotFoundError(f"RootCA file not found at: {CUSTOM_CA_PATH}")
 
+# Trust anchor và certificate của server được nạp một lần khi khởi động
+with open(CUSTOM_CA_PATH, "rb") as f:
+    ROOT_CERT = x509.load_pem_x509_certificate(f.read())
+with open(SERVER_CERT_PATH, "rb") as f:
+    SERVER_CERT_PEM_BYTES = f.read()
+
+CPU_COUNT = os.cpu_count() or 1
+# Số nhánh độc lập nhiều nhất có thể chạy cùng lúc trong mạch tính điểm đầy đủ
+CIRCUIT_WIDTH = 5
+# Số thread mỗi worker dùng để chạy song song các nhánh độc lập của mạch tính điểm; 1 = chạy tuần tự.
+# Mặc định bằng CIRCUIT_WIDTH (không quá số core dành cho mỗi worker nếu FHE_WORKERS được đặt).
+FHE_CIRCUIT_THREADS = int(os.environ.get(
+    "FHE_CIRCUIT_THREADS", min(CIRCUIT_WIDTH, max(1, CPU_COUNT // int(os.environ.get("FHE_WORKERS", 1))))))
+# Số worker process tính toán FHE, mỗi worker có CryptoContext và cache EvalKey riêng.
+# Mặc định ít worker hơn số core để mỗi worker có đủ core cho các nhánh của mạch:
+# giảm thời gian của từng request thay vì chỉ tăng số request chạy đồng thời.
+FHE_WORKERS = int(os.environ.get("FHE_WORKERS", max(1, CPU_COUNT // FHE_CIRCUIT_THREADS)))
+# Số thread OpenMP của OpenFHE trong mỗi thread tính toán. Mặc định chia đều số core,
+# để FHE_WORKERS x FHE_CIRCUIT_THREADS thread không cùng lúc chạy mỗi thread cpu_count thread OpenMP.
+FHE_OMP_THREADS = int(os.environ.get("FHE_OMP_THREADS", max(1, CPU_COUNT // (FHE_WORKERS * FHE_CIRCUIT_THREADS))))
+
+# CryptoContext của worker process, được tạo một lần khi worker khởi động.
+# InsertEvalMultKey ghi vào bảng khóa toàn cục của OpenFHE, nên việc nạp khóa và tính toán
+# phải được thực hiện dưới cùng một lock.
+crypto_context = None
+crypto_context_lock = threading.Lock()
+server_private_key = None
+circuit_executor: Optional[ThreadPoolExecutor] = None
+
+# Số slot mỗi ciphertext, phải trùng với BATCH_SIZE của các ngân hàng khi sinh khóa và mã hóa
+BATCH_SIZE = int(os.environ.get("FHE_BATCH_SIZE", 4096))
+
+# Trọng số của công thức tính điểm tín dụng
+WEIGHTS = {
+    'w1': 0.35, 'w2': 0.30, 'w3': 0.20, 'w4': 0.10,
+    'w5': 0.05, 'w6': 0.03, 'w7': 0.02
+}
+
+# Giới hạn bộ nhớ cho cache EvalKey (tính theo kích thước bản serialize của khóa)
+EVAL_KEY_CACHE_MAX_BYTES = int(os.environ.get("EVAL_KEY_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+EVAL_KEY_CACHE_MAX_ENTRIES = int(os.environ.get("EVAL_KEY_CACHE_MAX_ENTRIES", 8))
+
+# --- METRICS ---
+# Thời gian từng giai đoạn: upload_read, certificate_verify, signature_verify, eval_key_store (ở process chính);
+# executor_wait, eval_key_load, ciphertext_deserialize, compute, serialize, sign (do worker đo và gửi về)
+STAGE_SECONDS = metrics.REGISTRY.histogram(
+    "heserver_stage_seconds", "Time spent in each credit score processing stage.", ("stage",))
+PAYLOAD_BYTES = metrics.REGISTRY.histogram(
+    "heserver_payload_bytes", "Size of uploaded parts and serialized results.", ("part",), buckets=metrics.SIZE_BUCKETS)
+REQUESTS_TOTAL = metrics.REGISTRY.counter(
+    "heserver_requests_total", "HTTP requests by endpoint and status code.", ("endpoint", "method", "status"))
+REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    "heserver_request_seconds", "HTTP request latency until the response headers are sent.", ("endpoint",))
+REQUESTS_IN_FLIGHT = metrics.REGISTRY.gauge(
+    "heserver_requests_in_flight", "HTTP requests currently being handled.")
+FHE_COMPUTATIONS_PENDING = metrics.REGISTRY.gauge(
+    "heserver_fhe_computations_pending", "Computations submitted to the worker pool and not yet finished.")
+JOBS_QUEUED = metrics.REGISTRY.gauge(
+    "heserver_jobs_queued", "Async jobs waiting in the job queue.",
+    callback=lambda: job_queue.qsize() if job_queue is not None else 0)
+
+def deserialize_eval_key(data: bytes):
+    eval_key = fhe.DeserializeEvalKeyString(data, fhe.BINARY)
+    if not isinstance(eval_key, fhe.EvalKey):
+        raise ValueError("Invalid FHE evaluation key")
+    return eval_key
+
+class EvalKeyCacheMiss(Exception):
+    """Worker không có EvalKey với digest này trong cache, process chính cần gửi kèm bytes của khóa."""
+
+class EvalKeyCache:
+    """
+    Cache LRU các EvalKey, khóa theo SHA-256 của bytes.
+    Khóa merged của liên minh chỉ đổi khi xoay vòng khóa, nên phần lớn request
+    không cần upload hay deserialize lại.
+    loader: hàm chuyển bytes thành giá trị được cache (mặc định giữ nguyên bytes).
+    """
+    def __init__(self, max_bytes: int, max_entries: int, loader=None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.loader = loader
+        self._entries = OrderedDict()  # digest -> (value, size)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, digest: str):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            self._entries.move_to_end(digest)
+            return entry[0]
+
+    def contains(self, digest: str) -> bool:
+        with self._lock:
+            return digest in self._entries
+
+    def get_or_load(self, data: bytes, digest: Optional[str] = None):
+        digest = digest or self.digest(data)
+        value = self.get(digest)
+        if value is not None:
+            return digest, value
+        value = self.loader(data) if self.loader else data
+        self.put(digest, value, len(data))
+        return digest, value
+
+    def put(self, digest: str, value, size: int):
+        if size > self.max_bytes:
+            # Khóa lớn hơn toàn bộ ngân sách cache thì không giữ lại
+            return
+        with self._lock:
+            if digest in self._entries:
+                self._entries.move_to_end(digest)
+                return
+            self._entries[digest] = (value, size)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+
+# Process chính giữ bytes của EvalKey để client có thể chỉ gửi digest;
+# mỗi worker giữ bản đã deserialize của riêng nó.
+eval_key_store = EvalKeyCache(EVAL_KEY_CACHE_MAX_BYTES, EVAL_KEY_CACHE_MAX_ENTRIES)
+eval_key_cache = EvalKeyCache(EVAL_KEY_CACHE_MAX_BYTES, EVAL_KEY_CACHE_MAX_ENTRIES, loader=deserialize_eval_key)
+# Digest của EvalKey đang được nạp trong CryptoContext, theo key tag
+inserted_eval_keys: Dict[str, str] = {}
+
+fhe_executor: Optional[ProcessPoolExecutor] = None
+
+# Hàng đợi job có giới hạn và thời gian giữ kết quả đã xong
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 64))
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", 3600))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+class CreditScoreJob:
+    """Một yêu cầu tính điểm đã qua kiểm tra bảo mật, chờ chạy trên worker pool."""
+    def __init__(self, fhe_inputs: Dict[str, bytes], eval_key_digest: str, eval_key_bytes: bytes, scoring_function):
+        self.job_id = uuid.uuid4().hex
+        self.status = JOB_QUEUED
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+        self.result_data: Optional[bytes] = None
+        self.server_signature: Optional[bytes] = None
+        self.inputs = (fhe_inputs, eval_key_digest, eval_key_bytes, scoring_function)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error,
+        }
+
+jobs: Dict[str, CreditScoreJob] = {}
+job_queue: Optional[asyncio.Queue] = None
+
+async def run_job_queue():
+    while True:
+        job = await job_queue.get()
+        job.status = JOB_RUNNING
+        try:
+            job.result_data, job.server_signature = await run_credit_score(*job.inputs)
+            job.status = JOB_DONE
+        except HTTPException as e:
+            job.status = JOB_FAILED
+            job.error = e.detail
+        except Exception as e:
+            job.status = JOB_FAILED
+            job.error = str(e)
+        finally:
+            # Giải phóng ciphertext và khóa đầu vào ngay khi job kết thúc
+            job.inputs = None
+            job.finished_at = datetime.now(timezone.utc)
+            job_queue.task_done()
+        logger.info(f"Job {job.job_id} {job.status}.")
+
+async def purge_expired_jobs():
+    while True:
+        await asyncio.sleep(60)
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=JOB_RETENTION_SECONDS)
+        for job_id in [k for k, job in jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del jobs[job_id]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global fhe_executor
+    # Ghi bảng hệ số Chebyshev trước khi khởi động worker để các worker chỉ cần nạp lại
+    load_chebyshev_registry(save_if_missing=True)
+    logger.info(f"Starting {FHE_WORKERS} FHE worker processes "
+                f"({FHE_CIRCUIT_THREADS} circuit threads, {FHE_OMP_THREADS} OpenMP threads each)...")
+    # OpenMP đọc OMP_NUM_THREADS khi OpenFHE được nạp, tức là lúc worker import module này,
+    # trước cả initializer; worker tạo bằng spawn kế thừa biến môi trường tại thời điểm được tạo.
+    os.environ["OMP_NUM_THREADS"] = str(FHE_OMP_THREADS)
+    # Dùng spawn để worker không kế thừa trạng thái OpenFHE/thread của process chính
+    fhe_executor = ProcessPoolExecutor(
+        max_workers=FHE_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker
+    )
+    # Chờ tất cả worker khởi tạo xong CryptoContext trước khi nhận request
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*[loop.run_in_executor(fhe_executor, worker_ready) for _ in range(FHE_WORKERS)])
+    logger.info("FHE workers are ready.")
+
+    # Mỗi worker process có một consumer lấy job từ hàng đợi
+    global job_queue
+    job_queue = asyncio.Queue(maxsize=JOB_QUEUE_SIZE)
+    background_tasks = [asyncio.create_task(run_job_queue()) for _ in range(FHE_WORKERS)]
+    background_tasks.append(asyncio.create_task(purge_expired_jobs()))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    fhe_executor.shutdown(wait=True)
+
+app = FastAPI(title="Secure Homomorphic Credit Score Server", lifespan=lifespan)
+
 # --- SECURITY VERIFICATION FUNCTIONS ---
-def verify_certificate_signed_by_root(cert: x509.Certificate, root_cert: x509.Certificate) -> bool:
-    try:
-        root_pubkey = root_cert.public_key()
-        root_pubkey.verify(
-            cert.signature,
-            cert.tbs_certificate_bytes,
-            ec.ECDSA(cert.signature_hash_algorithm)
-        )
-        return True
-    except Exception:
-        return False
+# Certificate đã xác thực được cache theo fingerprint, xem peerCertificates.py
+verify_peer_certificate = peerCertificates.PeerCertificateVerifier(ROOT_CERT).verify
+
+# Kích thước chunk khi đọc file upload
+READ_CHUNK_SIZE = 1024 * 1024
+# Tổng dung lượng tối đa (sau giải nén) của mọi file trong một request; vượt quá thì trả 413
+MAX_REQUEST_BYTES = int(os.environ.get("MAX_REQUEST_BYTES", 2 * 1024 ** 3))
+
+async def read_and_hash(upload_file: UploadFile, content_encoding: str = transportCodec.IDENTITY,
+                        max_size: Optional[int] = None):
+    """
+    Đọc file upload theo chunk, giải nén theo luồng nếu client gửi bản nén,
+    trả về (nội dung gốc, SHA-256 của nội dung gốc).
+    Nội dung gốc vượt max_size byte thì ném transportCodec.OutputLimitExceeded.
+    """
+    hasher = hashlib.sha256()
+    decompressor = transportCodec.decompressor(content_encoding, max_size)
+    chunks = []
+
+    def write(data: bytes):
+        hasher.update(data)
+        chunks.append(data)
+
+    while chunk := await upload_file.read(READ_CHUNK_SIZE):
+        decompressor.decompress(chunk, write)
+    decompressor.flush(write)
+    return b''.join(chunks), hasher.digest()
+
+def compute_signed_digest(part_digests: Dict[str, bytes], metadata_dict: Dict[str, Any]) -> bytes:
+    """
+    Digest được ký: SHA-256(H(part_1) || ... || H(part_n) || H(metadata)),
+    các phần sắp xếp theo tên, H là SHA-256, metadata là JSON chuẩn hóa (sort_keys).
+    Bên gửi và bên nhận chỉ cần digest của từng phần, không cần giữ bản nối của dữ liệu.
+    """
+    hasher = hashlib.sha256()
+    for key in sorted(part_digests.keys()):
+        hasher.update(part_digests[key])
+    hasher.update(hashlib.sha256(json.dumps(metadata_dict, sort_keys=True).encode('utf-8')).digest())
+    return hasher.digest()
+
+# --- MULTIPART RESPONSE ---
+def multipart_part_header(boundary: str, name: str, filename: str, content_type: str) -> bytes:
+    return (
+        f"--{boundary}\r\n"
+        f"Content-Disposition: form-data; name=\"{name}\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"\r\n"
+    ).encode('utf-8')
+
+def iter_multipart(boundary: str, parts, chunk_size: int = READ_CHUNK_SIZE):
+    """
+    Sinh body multipart theo từng chunk. Nội dung mỗi phần được cắt bằng memoryview
+    nên không bị sao chép thêm lần nào.
+    parts: danh sách (name, filename, content_type, content: bytes)
+    """
+    for name, filename, content_type, content in parts:
+        yield multipart_part_header(boundary, name, filename, content_type)
+        view = memoryview(content)
+        for offset in range(0, len(view), chunk_size):
+            yield view[offset:offset + chunk_size]
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode('utf-8')
+
+def multipart_streaming_response(parts) -> StreamingResponse:
+    boundary = f"----Boundary{uuid.uuid4().hex}"
+    # Độ dài body tính trước được, client biết kích thước mà không cần server dựng body
+    content_length = sum(
+        len(multipart_part_header(boundary, name, filename, content_type)) + len(content) + 2
+        for name, filename, content_type, content in parts
+    ) + len(f"--{boundary}--\r\n")
+    return StreamingResponse(
+        iter_multipart(boundary, parts),
+        media_type=f"multipart/form-data; boundary={boundary}",
+        headers={"Content-Length": str(content_length)}
+    )
+
+# --- HOMOMORPHIC COMPUTATION FUNCTIONS ---
+class PlaintextConstantTable:
+    """
+    Bảng các hằng số đã encode sẵn (trọng số, 1.0, 3.0) của một CryptoContext,
+    khóa theo (giá trị, level). Mỗi hằng số chỉ đi qua FFT/NTT một lần cho mỗi level.
+    """
+    def __init__(self, crypto_context):
+        self.crypto_context = crypto_context
+        self._table = {}
+        self._lock = threading.Lock()
+
+    def get(self, value, level=0):
+        key = (float(value), level)
+        plaintext = self._table.get(key)
+        if plaintext is None:
+            # Hằng số được lặp lại trên mọi slot để phép tính đúng cho từng khách hàng trong batch
+            plaintext = self.crypto_context.MakeCKKSPackedPlaintext([value] * BATCH_SIZE, 1, level)
+            with self._lock:
+                plaintext = self._table.setdefault(key, plaintext)
+        return plaintext
+
+    def precompute(self, values, levels=(0,)):
+        for level in levels:
+            for value in values:
+                self.get(value, level)
+
+# Mỗi CryptoContext có một bảng hằng số riêng
+constant_tables: Dict[int, PlaintextConstantTable] = {}
+
+def make_constant(crypto_context, value, level=0):
+    table = constant_tables.get(id(crypto_context))
+    if table is None:
+        table = constant_tables.setdefault(id(crypto_context), PlaintextConstantTable(crypto_context))
+    return table.get(value, level)
+
+# --- CHEBYSHEV COEFFICIENT REGISTRY ---
+# Các họ hàm được xấp xỉ bằng đa thức Chebyshev: tên -> hàm tạo f(x) từ tham số (thường là trọng số)
+CHEBYSHEV_FAMILIES = {
+    "sqrt": lambda: np.sqrt,
+    "log": lambda: np.log,
+    "log1p": lambda: np.log1p,
+    "inverse": lambda: (lambda x: 1 / x),
+    "inverse_plus_one": lambda: (lambda x: 1 / (x + 1)),
+    "scaled_sqrt": lambda scale: (lambda x: scale * np.sqrt(x)),
+    "scaled_inverse_sqrt_plus_one": lambda scale: (lambda x: scale / (np.sqrt(x) + 1)),
+}
+
+# Bảng hệ số được nạp khi khởi động (nếu có) và ghi ra nếu chưa có
+CHEBYSHEV_TABLE_PATH = os.environ.get("CHEBYSHEV_TABLE_PATH", "./chebyshev_coefficients.json")
+
+def chebyshev_coefficients(func, a: float, b: float, degree: int) -> list:
+    """
+    Hệ số Chebyshev của func trên [a, b], tính giống EvalChebyshevCoefficients của OpenFHE
+    (degree + 1 hệ số, nội suy tại các nút Chebyshev) để EvalChebyshevSeries cho cùng kết quả
+    với EvalChebyshevFunction.
+    """
+    n = degree + 1
+    k = np.arange(n)
+    nodes = np.cos(np.pi * (k + 0.5) / n) * (b - a) / 2 + (b + a) / 2
+    values = np.array([func(x) for x in nodes], dtype=float)
+    return (2.0 / n * np.cos(np.pi * np.outer(k, k + 0.5) / n) @ values).tolist()
+
+class ChebyshevRegistry:
+    """
+    Hệ số Chebyshev đã tính sẵn, khóa theo (họ hàm, tham số, a, b, bậc).
+    Mỗi bộ hệ số chỉ tính một lần cho mỗi process; có thể lưu ra file JSON và nạp lại,
+    kể cả bảng hệ số đã được tinh chỉnh thủ công.
+    """
+    def __init__(self):
+        self._table = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(family: str, a: float, b: float, degree: int, params=()) -> tuple:
+        return (family, tuple(float(p) for p in params), float(a), float(b), int(degree))
+
+    def get(self, family: str, a: float, b: float, degree: int, params=()) -> list:
+        key = self.key(family, a, b, degree, params)
+        coefficients = self._table.get(key)
+        if coefficients is None:
+            func = CHEBYSHEV_FAMILIES[family](*params)
+            coefficients = chebyshev_coefficients(func, a, b, degree)
+            with self._lock:
+                coefficients = self._table.setdefault(key, coefficients)
+        return coefficients
+
+    def precompute(self, approximations):
+        for family, a, b, degree, params in approximations:
+            self.get(family, a, b, degree, params)
+
+    def load(self, path: str) -> int:
+        with open(path) as f:
+            entries = json.load(f)
+        with self._lock:
+            for entry in entries:
+                key = self.key(entry["family"], entry["a"], entry["b"], entry["degree"], entry.get("params", ()))
+                if len(entry["coefficients"]) != key[4] + 1:
+                    raise ValueError(f"Wrong number of coefficients for {key}")
+                self._table[key] = [float(c) for c in entry["coefficients"]]
+        return len(entries)
+
+    def save(self, path: str):
+        with self._lock:
+            entries = [
+                {"family": family, "params": list(params), "a": a, "b": b, "degree": degree, "coefficients": coefficients}
+                for (family, params, a, b, degree), coefficients in sorted(self._table.items())
+            ]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f, indent=2)
+        os.replace(tmp_path, path)
+
+chebyshev_registry = ChebyshevRegistry()
+
+def eval_chebyshev(crypto_context, ciphertext, family: str, a: float, b: float, degree: int, *params):
+    # Đánh giá bằng EvalChebyshevSeries với hệ số có sẵn, không gọi lại hàm Python từ OpenFHE
+    coefficients = chebyshev_registry.get(family, a, b, degree, params)
+    return crypto_context.EvalChebyshevSeries(ciphertext, coefficients, a, b)
+
+def chebyshev_approximations(weights) -> list:
+    """Các xấp xỉ (họ hàm, a, b, bậc, tham số) mà hai mạch đầy đủ dùng với bộ trọng số cho trước."""
+    k = 3 * weights['w7'] ** 2 / weights['w2']
+    return [
+        # homomorphic_credit_score
+        ("sqrt", 1.0, 3.0, 15, ()),
+        ("sqrt", 0.0, 0.3012, 15, ()),
+        ("inverse", 1.0, 3.0, 7, ()),
+        ("log", 1.0, 1.08, 15, ()),
+        ("inverse", 1.0, 3.0, 5, ()),
+        # homomorphic_credit_score_low_depth
+        ("scaled_sqrt", 0.0, 1 / k + 1, 15, (np.sqrt(3) * weights['w7'],)),
+        ("scaled_inverse_sqrt_plus_one", 1.0, 3.0, 7, (weights['w4'] ** 2,)),
+        ("log1p", 0.0, weights['w5'] + weights['w6'], 5, ()),
+        ("inverse_plus_one", 0.0, 2.0, 5, ()),
+    ]
+
+def load_chebyshev_registry(save_if_missing: bool = False):
+    if os.path.exists(CHEBYSHEV_TABLE_PATH):
+        count = chebyshev_registry.load(CHEBYSHEV_TABLE_PATH)
+        logger.info(f"Loaded {count} Chebyshev coefficient sets from {CHEBYSHEV_TABLE_PATH}.")
+    chebyshev_registry.precompute(chebyshev_approximations(WEIGHTS))
+    if save_if_missing and not os.path.exists(CHEBYSHEV_TABLE_PATH):
+        chebyshev_registry.save(CHEBYSHEV_TABLE_PATH)
+        logger.info(f"Saved Chebyshev coefficient table to {CHEBYSHEV_TABLE_PATH}.")
+
+# --- CIRCUIT SCHEDULER ---
+def run_circuit(graph: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Chạy mạch dưới dạng đồ thị phụ thuộc: tên nút -> (hàm, các nút phụ thuộc).
+    Hàm của mỗi nút nhận kết quả các nút phụ thuộc theo thứ tự. Các nút đã đủ đầu vào được
+    chạy đồng thời trên circuit_executor (nếu có), ngược lại chạy tuần tự theo thứ tự khai báo.
+    """
+    results: Dict[str, Any] = {}
+    pending = dict(graph)
+    running = {}
+    while pending or running:
+        progressed = False
+        for name, (func, deps) in list(pending.items()):
+            if all(dep in results for dep in deps):
+                del pending[name]
+                progressed = True
+                args = [results[dep] for dep in deps]
+                if circuit_executor is None:
+                    results[name] = func(*args)
+                else:
+                    running[circuit_executor.submit(func, *args)] = name
+        if not running:
+            if pending and not progressed:
+                raise ValueError(f"Circuit has unresolved dependencies: {sorted(pending)}")
+            continue
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            results[running.pop(future)] = future.result()
+    return results
+
+def tree_sum(crypto_context, ciphertexts):
+    # Cộng theo cây cân bằng: các cặp ở cùng tầng độc lập với nhau và cộng ciphertext cùng level trước
+    ciphertexts = list(ciphertexts)
+    while len(ciphertexts) > 1:
+        paired = [crypto_context.EvalAdd(ciphertexts[i], ciphertexts[i + 1]) for i in range(0, len(ciphertexts) - 1, 2)]
+        if len(ciphertexts) % 2:
+            paired.append(ciphertexts[-1])
+        ciphertexts = paired
+    return ciphertexts[0]
 
-# --- HOMOMORPHIC COMPUTATION FUNCTIONS (Không thay đổi) ---
-# ... (Giữ nguyên toàn bộ các hàm get_A, get_B, get_first_param, etc.)
 def get_A(crypto_context, S_util, S_inquiries):
     S_inquiries_sq = crypto_context.EvalMult(S_inquiries, S_inquiries)
     result = crypto_context.EvalAdd(S_util, S_inquiries_sq)
@@ -49,94 +532,147 @@ def get_A(crypto_context, S_util, S_inquiries):
 
 def get_B(crypto_context, S_creditmix, S_incomestability):
     total = crypto_context.EvalAdd(S_creditmix, S_incomestability)
-    total = crypto_context.EvalAdd(total, crypto_context.MakeCKKSPackedPlaintext([1.0]))
-    result = crypto_context.EvalChebyshevFunction(
-        func=lambda x: np.sqrt(x),
-        ciphertext=total,
-        a=1.0, 
-        b=3.0,
-        degree=15
-    )
+    total = crypto_context.EvalAdd(total, make_constant(crypto_context, 1.0, total.GetLevel()))
+    result = eval_chebyshev(crypto_context, total, "sqrt", 1.0, 3.0, 15)
     return result
 
 def get_first_param(crypto_context, S_payment, w1=0.35):
-    w1_p = crypto_context.MakeCKKSPackedPlaintext([w1])
+    w1_p = make_constant(crypto_context, w1, S_payment.GetLevel())
     S_payment_scaled = crypto_context.EvalMult(S_payment, w1_p)
     result = crypto_context.EvalMult(S_payment_scaled, S_payment_scaled)
     return result
 
 def get_second_param(crypto_context, S_util, S_behavioral, w2=0.30, w7=0.02):
-    w2_p = crypto_context.MakeCKKSPackedPlaintext([w2])
-    w7_p = crypto_context.MakeCKKSPackedPlaintext([w7])
+    w2_p = make_constant(crypto_context, w2, S_util.GetLevel())
+    w7_p = make_constant(crypto_context, w7, S_behavioral.GetLevel())
     S_util_scaled = crypto_context.EvalMult(S_util, w2_p)
     S_behavioral_scaled = crypto_context.EvalMult(S_behavioral, w7_p)
     S_behavioral_scaled = crypto_context.EvalMult(S_behavioral_scaled, S_behavioral_scaled)
-    S_behavioral_scaled = crypto_context.EvalMult(S_behavioral_scaled, crypto_context.MakeCKKSPackedPlaintext([3.0]))
+    S_behavioral_scaled = crypto_context.EvalMult(S_behavioral_scaled, make_constant(crypto_context, 3.0, S_behavioral_scaled.GetLevel()))
     result = crypto_context.EvalAdd(S_util_scaled, S_behavioral_scaled)
-    result = crypto_context.EvalChebyshevFunction(
-        func=lambda x: np.sqrt(x),
-        ciphertext=result,
-        a=0.0,
-        b=0.3012,
-        degree=15
-    )
+    result = eval_chebyshev(crypto_context, result, "sqrt", 0.0, 0.3012, 15)
     return result
 
 def get_third_param(crypto_context, S_length, S_creditmix, B, w3=0.20, w4=0.10):
-    w3_p = crypto_context.MakeCKKSPackedPlaintext([w3])
-    w4_p = crypto_context.MakeCKKSPackedPlaintext([w4])
+    w3_p = make_constant(crypto_context, w3, S_length.GetLevel())
+    w4_p = make_constant(crypto_context, w4, S_creditmix.GetLevel())
     S_length_scaled = crypto_context.EvalMult(S_length, w3_p)
     S_creditmix_scaled = crypto_context.EvalMult(S_creditmix, w4_p)
     S_creditmix_scaledsqed = crypto_context.EvalMult(S_creditmix_scaled, S_creditmix_scaled)
-    B_plus = crypto_context.EvalAdd(B, crypto_context.MakeCKKSPackedPlaintext([1.0]))
-    B_plus_inverse = crypto_context.EvalChebyshevFunction(lambda x: 1/x, B_plus, 1, 3, 7)
+    B_plus = crypto_context.EvalAdd(B, make_constant(crypto_context, 1.0, B.GetLevel()))
+    B_plus_inverse = eval_chebyshev(crypto_context, B_plus, "inverse", 1.0, 3.0, 7)
     S_total = crypto_context.EvalAdd(S_length_scaled, S_creditmix_scaledsqed)
     result = crypto_context.EvalMult(S_total, B_plus_inverse)
     return result
 
 def get_fourth_param(crypto_context, S_inquiries, S_incomestability, w5=0.05, w6=0.03):
-    w5_p = crypto_context.MakeCKKSPackedPlaintext([w5])
-    w6_p = crypto_context.MakeCKKSPackedPlaintext([w6])
+    w5_p = make_constant(crypto_context, w5, S_inquiries.GetLevel())
+    w6_p = make_constant(crypto_context, w6, S_incomestability.GetLevel())
     S_inquiries_scaled = crypto_context.EvalMult(S_inquiries, w5_p)
     S_incomestability_scaled = crypto_context.EvalMult(S_incomestability, w6_p)
     S_total = crypto_context.EvalAdd(S_inquiries_scaled, S_incomestability_scaled)
-    S_totalplus = crypto_context.EvalAdd(S_total, crypto_context.MakeCKKSPackedPlaintext([1.0]))
-    result = crypto_context.EvalChebyshevFunction(
-        func=lambda x: np.log(x),
-        ciphertext=S_totalplus,
-        a=1.0,
-        b=1.08,
-        degree=15
-    )
+    S_totalplus = crypto_context.EvalAdd(S_total, make_constant(crypto_context, 1.0, S_total.GetLevel()))
+    result = eval_chebyshev(crypto_context, S_totalplus, "log", 1.0, 1.08, 15)
     return result
 
+def get_A_plus_inverse(crypto_context, A):
+    A_plus = crypto_context.EvalAdd(A, make_constant(crypto_context, 1.0, A.GetLevel()))
+    return eval_chebyshev(crypto_context, A_plus, "inverse", 1.0, 3.0, 5)
+
 def homomorphic_credit_score(crypto_context, weights, encrypted_params):
-    weighted_scores = []
-    A = get_A(crypto_context, encrypted_params['S_util'], encrypted_params['S_inquiries'])
-    B = get_B(crypto_context, encrypted_params['S_creditmix'], encrypted_params['S_incomestability'])
-    weighted_scores.append(get_first_param(crypto_context, encrypted_params['S_payment'], weights['w1']))
-    weighted_scores.append(get_second_param(crypto_context, encrypted_params['S_util'], encrypted_params['S_behavioral'], weights['w2'], weights['w7']))
-    weighted_scores.append(get_third_param(crypto_context, encrypted_params['S_length'], encrypted_params['S_creditmix'], B, weights['w3'], weights['w4']))
-    weighted_scores.append(get_fourth_param(crypto_context, encrypted_params['S_inquiries'], encrypted_params['S_incomestability'], weights['w5'], weights['w6']))
-    
-    final_score = weighted_scores[0]
-    for score in weighted_scores[1:]:
-        final_score = crypto_context.EvalAdd(final_score, score)
+    p = encrypted_params
+    # A, B và các tham số 1, 2, 4 độc lập với nhau; tham số 3 chờ B, 1/(A+1) chờ A
+    nodes = run_circuit({
+        'A': (lambda: get_A(crypto_context, p['S_util'], p['S_inquiries']), ()),
+        'B': (lambda: get_B(crypto_context, p['S_creditmix'], p['S_incomestability']), ()),
+        'first': (lambda: get_first_param(crypto_context, p['S_payment'], weights['w1']), ()),
+        'second': (lambda: get_second_param(crypto_context, p['S_util'], p['S_behavioral'], weights['w2'], weights['w7']), ()),
+        'fourth': (lambda: get_fourth_param(crypto_context, p['S_inquiries'], p['S_incomestability'], weights['w5'], weights['w6']), ()),
+        'third': (lambda B: get_third_param(crypto_context, p['S_length'], p['S_creditmix'], B, weights['w3'], weights['w4']), ('B',)),
+        'A_plus_inverse': (lambda A: get_A_plus_inverse(crypto_context, A), ('A',)),
+    })
 
-    A_plus = crypto_context.EvalAdd(A, crypto_context.MakeCKKSPackedPlaintext([1.0]))
-    A_plus_inverse = crypto_context.EvalChebyshevFunction(lambda x: 1/x, A_plus, 1, 3, 5)
-    final_score = crypto_context.EvalMult(final_score, A_plus_inverse)
+    final_score = tree_sum(crypto_context, [nodes['first'], nodes['second'], nodes['third'], nodes['fourth']])
+    final_score = crypto_context.EvalMult(final_score, nodes['A_plus_inverse'])
+    return final_score
+
+def homomorphic_credit_score_low_depth(crypto_context, weights, encrypted_params):
+    """
+    Cùng công thức với homomorphic_credit_score nhưng sắp xếp lại để giảm độ sâu nhân
+    từ 13 xuống 8 (với bảng độ sâu Chebyshev của OpenFHE: bậc 3-5 -> 4, 6-13 -> 5, 14-27 -> 6):
+    - Trọng số được gộp vào hệ số đa thức Chebyshev thay vì nhân riêng với ciphertext.
+    - sqrt(B) và 1/(B+1) được gộp thành một xấp xỉ w4^2/(sqrt(y)+1) trên y thuộc [1, 3].
+    - Đầu vào của sqrt trong tham số thứ hai được đổi tỉ lệ (u/k + b^2) để chỉ tốn 1 level.
+    - Nhân với 1/(A+1) một lần ở cuối, khi các nhánh đã ở level gần nhau.
+    Trên miền [0, 1]^7, kết quả lệch tối đa khoảng 0.003 điểm (thang 300-850) so với
+    homomorphic_credit_score. Sai số so với công thức chính xác vẫn khoảng 7.4 điểm, giống
+    mạch gốc, do xấp xỉ sqrt gần 0 chi phối. Chưa tính nhiễu CKKS.
+    """
+    w1, w2, w3, w4 = weights['w1'], weights['w2'], weights['w3'], weights['w4']
+    w5, w6, w7 = weights['w5'], weights['w6'], weights['w7']
+    S_payment = encrypted_params['S_payment']
+    S_util = encrypted_params['S_util']
+    S_length = encrypted_params['S_length']
+    S_creditmix = encrypted_params['S_creditmix']
+    S_inquiries = encrypted_params['S_inquiries']
+    S_behavioral = encrypted_params['S_behavioral']
+    S_incomestability = encrypted_params['S_incomestability']
+
+    # (w1 * S_payment)^2 -> depth 2
+    def get_first():
+        S_payment_scaled = crypto_context.EvalMult(S_payment, make_constant(crypto_context, w1, S_payment.GetLevel()))
+        return crypto_context.EvalSquare(S_payment_scaled)
+
+    # sqrt(w2*u + 3*(w7*b)^2) = sqrt(3)*w7 * sqrt(u/k + b^2), với k = 3*w7^2/w2 -> depth 1 + 6
+    def get_second():
+        k = 3 * w7 ** 2 / w2
+        S_util_rescaled = crypto_context.EvalMult(S_util, make_constant(crypto_context, 1 / k, S_util.GetLevel()))
+        second_input = crypto_context.EvalAdd(S_util_rescaled, crypto_context.EvalSquare(S_behavioral))
+        return eval_chebyshev(crypto_context, second_input, "scaled_sqrt", 0.0, 1 / k + 1, 15, np.sqrt(3) * w7)
+
+    # (w3*l + (w4*c)^2) / (sqrt(c + i + 1) + 1) = (l*w3/w4^2 + c^2) * w4^2/(sqrt(y) + 1) -> depth 5 + 1 = 6
+    def get_third():
+        y = crypto_context.EvalAdd(S_creditmix, S_incomestability)
+        y = crypto_context.EvalAdd(y, make_constant(crypto_context, 1.0, y.GetLevel()))
+        B_plus_inverse_scaled = eval_chebyshev(crypto_context, y, "scaled_inverse_sqrt_plus_one", 1.0, 3.0, 7, w4 ** 2)
+        S_length_scaled = crypto_context.EvalMult(S_length, make_constant(crypto_context, w3 / w4 ** 2, S_length.GetLevel()))
+        third_numerator = crypto_context.EvalAdd(S_length_scaled, crypto_context.EvalSquare(S_creditmix))
+        return crypto_context.EvalMult(third_numerator, B_plus_inverse_scaled)
+
+    # log(1 + w5*q + w6*i) -> depth 1 + 4
+    def get_fourth():
+        S_inquiries_scaled = crypto_context.EvalMult(S_inquiries, make_constant(crypto_context, w5, S_inquiries.GetLevel()))
+        S_incomestability_scaled = crypto_context.EvalMult(S_incomestability, make_constant(crypto_context, w6, S_incomestability.GetLevel()))
+        return eval_chebyshev(crypto_context, crypto_context.EvalAdd(S_inquiries_scaled, S_incomestability_scaled),
+                              "log1p", 0.0, w5 + w6, 5)
+
+    # 1/(A + 1) với A = u + q^2 -> depth 1 + 4
+    def get_A_plus_inverse():
+        A = crypto_context.EvalAdd(S_util, crypto_context.EvalSquare(S_inquiries))
+        return eval_chebyshev(crypto_context, A, "inverse_plus_one", 0.0, 2.0, 5)
+
+    # Năm nhánh độc lập hoàn toàn với nhau
+    nodes = run_circuit({
+        'first': (get_first, ()),
+        'second': (get_second, ()),
+        'third': (get_third, ()),
+        'fourth': (get_fourth, ()),
+        'A_plus_inverse': (get_A_plus_inverse, ()),
+    })
+
+    final_score = tree_sum(crypto_context, [nodes['first'], nodes['second'], nodes['third'], nodes['fourth']])
+    final_score = crypto_context.EvalMult(final_score, nodes['A_plus_inverse'])
     return final_score
 
 def homomorphic_credit_score_simplified(crypto_context, weights, encrypted_params):
     weighted_scores = []
-    S1_weighted = crypto_context.EvalMult(encrypted_params['S_payment'], crypto_context.MakeCKKSPackedPlaintext([weights['w1']]))
-    S2_weighted = crypto_context.EvalMult(encrypted_params['S_util'], crypto_context.MakeCKKSPackedPlaintext([weights['w2']]))
-    S3_weighted = crypto_context.EvalMult(encrypted_params['S_length'], crypto_context.MakeCKKSPackedPlaintext([weights['w3']]))
-    S4_weighted = crypto_context.EvalMult(encrypted_params['S_creditmix'], crypto_context.MakeCKKSPackedPlaintext([weights['w4']]))
-    S5_weighted = crypto_context.EvalMult(encrypted_params['S_inquiries'], crypto_context.MakeCKKSPackedPlaintext([weights['w5']]))
-    S6_weighted = crypto_context.EvalMult(encrypted_params['S_incomestability'], crypto_context.MakeCKKSPackedPlaintext([weights['w6']]))
-    S7_weighted = crypto_context.EvalMult(encrypted_params['S_behavioral'], crypto_context.MakeCKKSPackedPlaintext([weights['w7']]))
+    S1_weighted = crypto_context.EvalMult(encrypted_params['S_payment'], make_constant(crypto_context, weights['w1'], encrypted_params['S_payment'].GetLevel()))
+    S2_weighted = crypto_context.EvalMult(encrypted_params['S_util'], make_constant(crypto_context, weights['w2'], encrypted_params['S_util'].GetLevel()))
+    S3_weighted = crypto_context.EvalMult(encrypted_params['S_length'], make_constant(crypto_context, weights['w3'], encrypted_params['S_length'].GetLevel()))
+    S4_weighted = crypto_context.EvalMult(encrypted_params['S_creditmix'], make_constant(crypto_context, weights['w4'], encrypted_params['S_creditmix'].GetLevel()))
+    S5_weighted = crypto_context.EvalMult(encrypted_params['S_inquiries'], make_constant(crypto_context, weights['w5'], encrypted_params['S_inquiries'].GetLevel()))
+    S6_weighted = crypto_context.EvalMult(encrypted_params['S_incomestability'], make_constant(crypto_context, weights['w6'], encrypted_params['S_incomestability'].GetLevel()))
+    S7_weighted = crypto_context.EvalMult(encrypted_params['S_behavioral'], make_constant(crypto_context, weights['w7'], encrypted_params['S_behavioral'].GetLevel()))
     weighted_scores.append(S1_weighted)
     weighted_scores.append(S2_weighted)
     weighted_scores.append(S3_weighted)
@@ -145,17 +681,44 @@ def homomorphic_credit_score_simplified(crypto_context, weights, encrypted_param
     weighted_scores.append(S6_weighted)
     weighted_scores.append(S7_weighted)
     
-    final_score = weighted_scores[0]
-    for score in weighted_scores[1:]:
-        final_score = crypto_context.EvalAdd(final_score, score)
+    return tree_sum(crypto_context, weighted_scores)
 
-    return final_score
+# Bộ tham số CKKS và mạch đầy đủ tương ứng. Các ngân hàng phải chạy với cùng FHE_PARAMETER_PROFILE
+# (và FHE_BATCH_SIZE) khi sinh khóa và mã hóa; giữ đồng bộ với Banks/HEModule/fheParameters.py.
+# standard: mạch gốc cần độ sâu 13, dư 2 level.
+# low_depth: mạch homomorphic_credit_score_low_depth cần độ sâu 8, dư 1 level;
+#            vòng số nhỏ hơn nên khóa, ciphertext và mọi phép toán đều nhẹ hơn.
+PARAMETER_PROFILES = {
+    "standard": {
+        "multiplicative_depth": 15,
+        "scaling_mod_size": 59,
+        "full_scoring_function": homomorphic_credit_score,
+    },
+    "low_depth": {
+        "multiplicative_depth": 9,
+        "scaling_mod_size": 59,
+        "full_scoring_function": homomorphic_credit_score_low_depth,
+    },
+}
+PROFILE_NAME = os.environ.get("FHE_PARAMETER_PROFILE", "standard")
+if PROFILE_NAME not in PARAMETER_PROFILES:
+    raise ValueError(f"Unknown FHE_PARAMETER_PROFILE: {PROFILE_NAME} (expected one of {', '.join(PARAMETER_PROFILES)})")
+PARAMETER_PROFILE = PARAMETER_PROFILES[PROFILE_NAME]
+
+# Công thức tính điểm, chọn bằng trường "scoring" trong metadata (đã được ký).
+# Mọi endpoint, đơn lẻ hay batch, đều dùng cùng một công thức cho cùng giá trị "scoring",
+# nên điểm của một khách hàng không phụ thuộc vào số khách hàng trong request.
+DEFAULT_SCORING = "full"
+SCORING_FUNCTIONS = {
+    "full": PARAMETER_PROFILE["full_scoring_function"],
+    "simplified": homomorphic_credit_score_simplified,
+}
 
 def init_crypto_context():
     parameters = fhe.CCParamsCKKSRNS()
-    parameters.SetMultiplicativeDepth(15)
-    parameters.SetScalingModSize(59)
-    parameters.SetBatchSize(1)
+    parameters.SetMultiplicativeDepth(PARAMETER_PROFILE["multiplicative_depth"])
+    parameters.SetScalingModSize(PARAMETER_PROFILE["scaling_mod_size"])
+    parameters.SetBatchSize(BATCH_SIZE)
     cc = fhe.GenCryptoContext(parameters)
     cc.Enable(fhe.PKESchemeFeature.PKE)
     cc.Enable(fhe.PKESchemeFeature.KEYSWITCH)
@@ -164,9 +727,89 @@ def init_crypto_context():
     cc.Enable(fhe.PKESchemeFeature.MULTIPARTY)
     return cc
 
+def warm_crypto_context(cc):
+    # Encode sẵn trọng số và các hằng số của mạch ở level của ciphertext mới mã hóa;
+    # đồng thời OpenFHE dựng sẵn các bảng FFT/NTT trước khi nhận request.
+    # Hằng số ở các level sâu hơn được encode ở request đầu tiên rồi giữ lại trong bảng.
+    make_constant(cc, 1.0)
+    constant_tables[id(cc)].precompute(list(WEIGHTS.values()) + [1.0, 3.0])
+
+# --- FHE WORKER PROCESS ---
+def init_worker():
+    global crypto_context, server_private_key, circuit_executor
+    if FHE_CIRCUIT_THREADS > 1:
+        circuit_executor = ThreadPoolExecutor(max_workers=FHE_CIRCUIT_THREADS, thread_name_prefix="fhe-circuit")
+    load_chebyshev_registry()
+    crypto_context = init_crypto_context()
+    warm_crypto_context(crypto_context)
+    with open(SERVER_KEY_PATH, "rb") as f:
+        server_private_key = serialization.load_pem_private_key(f.read(), password=None)
+
+def worker_ready() -> int:
+    return os.getpid()
+
+def compute_credit_score(file_contents: Dict[str, bytes], eval_key_digest: str, eval_key_bytes: Optional[bytes],
+                         scoring_function):
+    """
+    Chạy trong worker process: nạp EvalKey (qua cache của worker), deserialize ciphertext,
+    tính điểm đồng cấu, serialize và ký kết quả.
+    eval_key_bytes là None khi process chính chỉ gửi digest; nếu worker chưa có khóa đó thì
+    ném EvalKeyCacheMiss để process chính gửi lại kèm bytes.
+    Trả về (result_data, server_signature_bytes, thời gian từng giai đoạn tính bằng giây).
+    """
+    cc = crypto_context
+    if cc is None:
+        raise RuntimeError("CryptoContext has not been initialized")
+
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    if eval_key_bytes is None:
+        eval_key = eval_key_cache.get(eval_key_digest)
+        if eval_key is None:
+            raise EvalKeyCacheMiss(eval_key_digest)
+    else:
+        _, eval_key = eval_key_cache.get_or_load(eval_key_bytes, eval_key_digest)
+    timings["eval_key_load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    encrypted_params: Dict[str, Any] = {}
+    for key in [k for k in file_contents.keys() if k.startswith('S_')]:
+        param = fhe.DeserializeCiphertextString(file_contents[key], fhe.BINARY)
+        if not isinstance(param, fhe.Ciphertext): raise ValueError(f"Invalid ciphertext for {key}")
+        encrypted_params[key] = param
+    timings["ciphertext_deserialize"] = time.perf_counter() - start
+
+    weights = WEIGHTS
+
+    start = time.perf_counter()
+    with crypto_context_lock:
+        key_tag = eval_key.GetKeyTag()
+        if inserted_eval_keys.get(key_tag) != eval_key_digest:
+            cc.InsertEvalMultKey([eval_key])
+            inserted_eval_keys[key_tag] = eval_key_digest
+        encrypted_result = scoring_function(cc, weights, encrypted_params)
+    timings["compute"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result_data = fhe.Serialize(encrypted_result, fhe.BINARY)
+    if not result_data:
+        raise ValueError("Failed to serialize FHE result.")
+    timings["serialize"] = time.perf_counter() - start
+
+    # Dữ liệu cần ký là kết quả FHE
+    start = time.perf_counter()
+    server_signature_bytes = server_private_key.sign(
+        result_data,
+        ec.ECDSA(hashes.SHA256())
+    )
+    timings["sign"] = time.perf_counter() - start
+    return result_data, server_signature_bytes, timings
+
 # Danh sách IP cho phép: MSB, ACB, FECREDIT
 ALLOWED_IPS = {"192.168.1.11", "192.168.1.12", "192.168.1.14"}  
 
+metrics.instrument_app(app, REQUESTS_TOTAL, REQUEST_SECONDS, REQUESTS_IN_FLIGHT)
+
 @app.middleware("http")
 async def verify_client_ip(request: Request, call_next):
     client_ip = request.client.host
@@ -176,34 +819,139 @@ async def verify_client_ip(request: Request, call_next):
     return response
 
 # --- MAIN API ENDPOINT ---
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus scrape endpoint
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/codecs")
+async def list_codecs():
+    # Client chọn codec nén cho khóa và ciphertext từ danh sách này
+    return {"codecs": transportCodec.available_codecs()}
+
+@app.get("/eval-keys/{digest}")
+async def check_eval_key(digest: str):
+    # Client gọi trước khi gửi để biết có cần upload lại EvalKey hay không
+    if not eval_key_store.contains(digest):
+        raise HTTPException(status_code=404, detail="Evaluation key not cached.")
+    return {"digest": digest, "cached": True}
+
 @app.post("/calculate-credit-score")
 async def calculate_credit_score(
-    eval_mult_key: UploadFile = File(...),
+    eval_mult_key: Optional[UploadFile] = File(None),
     S_payment: UploadFile = File(...), S_util: UploadFile = File(...), S_length: UploadFile = File(...),
     S_creditmix: UploadFile = File(...), S_inquiries: UploadFile = File(...),
     S_behavioral: UploadFile = File(...), S_incomestability: UploadFile = File(...),
     certificate: UploadFile = File(...),
     signature: str = Form(...),
-    metadata: str = Form("{}")
+    metadata: str = Form("{}"),
+    eval_mult_key_digest: Optional[str] = Form(None),
+    content_encoding: str = Form(transportCodec.IDENTITY)
 ):
     logger.info("Received request for credit score calculation.")
-    
-    # Gom tất cả các file dữ liệu FHE vào một dict riêng
     fhe_data_files = {
-        'eval_mult_key': eval_mult_key,
         'S_payment': S_payment, 'S_util': S_util, 'S_length': S_length,
         'S_creditmix': S_creditmix, 'S_inquiries': S_inquiries,
         'S_behavioral': S_behavioral, 'S_incomestability': S_incomestability
     }
+    return await process_credit_score_request(
+        eval_mult_key, fhe_data_files, certificate, signature, metadata,
+        eval_mult_key_digest, resolve_scoring_function(metadata), content_encoding
+    )
 
-    # Đọc nội dung file
-    file_contents: Dict[str, bytes] = {}
+@app.post("/calculate-credit-score-batch")
+async def calculate_credit_score_batch(
+    eval_mult_key: Optional[UploadFile] = File(None),
+    S_payment: UploadFile = File(...), S_util: UploadFile = File(...), S_length: UploadFile = File(...),
+    S_creditmix: UploadFile = File(...), S_inquiries: UploadFile = File(...),
+    S_behavioral: UploadFile = File(...), S_incomestability: UploadFile = File(...),
+    certificate: UploadFile = File(...),
+    signature: str = Form(...),
+    metadata: str = Form("{}"),
+    eval_mult_key_digest: Optional[str] = Form(None),
+    content_encoding: str = Form(transportCodec.IDENTITY)
+):
+    # Mỗi ciphertext chứa giá trị của tối đa BATCH_SIZE khách hàng (mỗi slot một khách hàng),
+    # công thức được tính đồng thời trên mọi slot.
+    logger.info("Received request for batch credit score calculation.")
+    validate_batch_metadata(metadata)
+
+    fhe_data_files = {
+        'S_payment': S_payment, 'S_util': S_util, 'S_length': S_length,
+        'S_creditmix': S_creditmix, 'S_inquiries': S_inquiries,
+        'S_behavioral': S_behavioral, 'S_incomestability': S_incomestability
+    }
+    return await process_credit_score_request(
+        eval_mult_key, fhe_data_files, certificate, signature, metadata,
+        eval_mult_key_digest, resolve_scoring_function(metadata), content_encoding
+    )
+
+def resolve_scoring_function(metadata: str):
+    """Công thức được chọn trong metadata ("scoring"), mặc định là mạch đầy đủ của profile đang dùng."""
+    try:
+        scoring = json.loads(metadata).get("scoring", DEFAULT_SCORING)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid file or metadata format.")
+    if scoring not in SCORING_FUNCTIONS:
+        raise HTTPException(status_code=400, detail=f"scoring must be one of {sorted(SCORING_FUNCTIONS)}.")
+    return SCORING_FUNCTIONS[scoring]
+
+def validate_batch_metadata(metadata: str):
+    try:
+        customer_count = int(json.loads(metadata).get("customer_count", BATCH_SIZE))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid file or metadata format.")
+    if not 1 <= customer_count <= BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"customer_count must be between 1 and {BATCH_SIZE}.")
+
+async def process_credit_score_request(
+    eval_mult_key: Optional[UploadFile],
+    fhe_data_files: Dict[str, UploadFile],
+    certificate: UploadFile,
+    signature: str,
+    metadata: str,
+    eval_mult_key_digest: Optional[str],
+    scoring_function,
+    content_encoding: str = transportCodec.IDENTITY
+):
+    fhe_inputs, eval_key_digest, eval_key_bytes = await verify_credit_score_request(
+        eval_mult_key, fhe_data_files, certificate, signature, metadata,
+        eval_mult_key_digest, content_encoding
+    )
+    result_data, server_signature_bytes = await run_credit_score(
+        fhe_inputs, eval_key_digest, eval_key_bytes, scoring_function
+    )
+    return signed_result_response(result_data, server_signature_bytes)
+
+async def verify_credit_score_request(
+    eval_mult_key: Optional[UploadFile],
+    fhe_data_files: Dict[str, UploadFile],
+    certificate: UploadFile,
+    signature: str,
+    metadata: str,
+    eval_mult_key_digest: Optional[str],
+    content_encoding: str = transportCodec.IDENTITY
+):
+    """
+    Xác thực certificate và chữ ký, đọc dữ liệu FHE.
+    Trả về (ciphertext theo tên, digest của EvalKey, bytes của EvalKey).
+    """
+    if content_encoding not in transportCodec.available_codecs():
+        raise HTTPException(status_code=415, detail=f"Unsupported content encoding: {content_encoding}")
+
+    # Client có thể chỉ gửi SHA-256 của EvalKey nếu server đã có khóa đó trong cache
+    if eval_mult_key is None and not eval_mult_key_digest:
+        raise HTTPException(status_code=400, detail="Either eval_mult_key or eval_mult_key_digest is required.")
+    if eval_mult_key is None and not eval_key_store.contains(eval_mult_key_digest):
+        raise HTTPException(status_code=409, detail="Unknown eval_mult_key_digest, please upload the key.")
+
+    # Gom tất cả các file dữ liệu FHE vào một dict riêng
+    fhe_data_files = dict(fhe_data_files)
+    if eval_mult_key is not None:
+        fhe_data_files['eval_mult_key'] = eval_mult_key
+
+    # Đọc certificate và metadata trước, để request giả mạo bị từ chối trước khi đọc dữ liệu lớn
     try:
-        # Đọc các file dữ liệu FHE
-        for key, upload_file in fhe_data_files.items():
-            file_contents[key] = await upload_file.read()
-        
-        # Đọc riêng file certificate và metadata
         cert_pem_bytes = await certificate.read()
         metadata_dict = json.loads(metadata)
     except Exception:
@@ -212,18 +960,16 @@ async def calculate_credit_score(
     # === LỚP BẢO VỆ 1: XÁC THỰC CERTIFICATE ===
     logger.info("Verifying sender's certificate...")
     try:
-        cert = x509.load_pem_x509_certificate(cert_pem_bytes)
-        client_public_key = cert.public_key()
-
-        if not isinstance(client_public_key, ec.EllipticCurvePublicKey):
-            raise HTTPException(status_code=400, detail="Certificate must use an Elliptic Curve key.")
+        with STAGE_SECONDS.time(stage="certificate_verify"):
+            cert = x509.load_pem_x509_certificate(cert_pem_bytes)
+            client_public_key = cert.public_key()
 
-        with open(CUSTOM_CA_PATH, "rb") as f:
-            root_cert = x509.load_pem_x509_certificate(f.read())
+            if not isinstance(client_public_key, ec.EllipticCurvePublicKey):
+                raise HTTPException(status_code=400, detail="Certificate must use an Elliptic Curve key.")
 
-        if not verify_certificate_signed_by_root(cert, root_cert):
-            logger.warning("Certificate verification failed: Not signed by trusted RootCA.")
-            raise HTTPException(status_code=403, detail="Certificate not signed by the trusted RootCA.")
+            if not verify_peer_certificate(cert):
+                logger.warning("Certificate verification failed: Expired or not signed by trusted RootCA.")
+                raise HTTPException(status_code=403, detail="Certificate expired or not signed by the trusted RootCA.")
         
         logger.info("Certificate is valid and trusted.")
     except HTTPException as e:
@@ -232,26 +978,38 @@ async def calculate_credit_score(
         logger.error(f"Error processing certificate: {e}")
         raise HTTPException(status_code=400, detail=f"Certificate processing error: {e}")
 
-    # === LỚP BẢO VỆ 2: XÁC MINH CHỮ KÝ SỐ (ĐÃ SỬA LẠI LOGIC) ===
+    # Đọc các file dữ liệu FHE theo từng chunk, băm SHA-256 từng phần ngay khi đọc
+    file_contents: Dict[str, bytes] = {}
+    part_digests: Dict[str, bytes] = {}
+    try:
+        with STAGE_SECONDS.time(stage="upload_read"):
+            remaining = MAX_REQUEST_BYTES
+            for key, upload_file in fhe_data_files.items():
+                file_contents[key], part_digests[key] = await read_and_hash(upload_file, content_encoding, remaining)
+                remaining -= len(file_contents[key])
+                PAYLOAD_BYTES.observe(len(file_contents[key]), part=key)
+        # Khi chỉ gửi digest, phần eval_mult_key được thay bằng chuỗi hex của digest
+        if eval_mult_key is None:
+            file_contents['eval_mult_key'] = eval_mult_key_digest.encode('utf-8')
+            part_digests['eval_mult_key'] = hashlib.sha256(file_contents['eval_mult_key']).digest()
+    except transportCodec.OutputLimitExceeded:
+        raise HTTPException(status_code=413, detail=f"Request data exceeds {MAX_REQUEST_BYTES} bytes.")
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid file or metadata format.")
+
+    # === LỚP BẢO VỆ 2: XÁC MINH CHỮ KÝ SỐ ===
     logger.info("Verifying digital signature...")
     try:
-        # SỬA ĐỔI CHÍNH Ở ĐÂY
-        # Tái tạo dữ liệu đã ký, chỉ bao gồm các file dữ liệu FHE, KHÔNG BAO GỒM certificate.
-        data_to_verify = b''
-        # Sắp xếp các key của file dữ liệu để đảm bảo thứ tự nhất quán
-        for key in sorted(file_contents.keys()):
-            data_to_verify += file_contents[key]
-        
-        # Thêm metadata đã được chuẩn hóa vào cuối
-        data_to_verify += json.dumps(metadata_dict, sort_keys=True).encode('utf-8')
-        
-        decoded_sig = base64.b64decode(signature)
+        # Chữ ký ECDSA trên digest tổng hợp từ digest của từng phần, không cần nối dữ liệu
+        with STAGE_SECONDS.time(stage="signature_verify"):
+            signed_digest = compute_signed_digest(part_digests, metadata_dict)
+            decoded_sig = base64.b64decode(signature)
 
-        client_public_key.verify( # Dùng public key từ certificate đã được xác thực
-            decoded_sig,
-            data_to_verify,
-            ec.ECDSA(hashes.SHA256())
-        )
+            client_public_key.verify( # Dùng public key từ certificate đã được xác thực
+                decoded_sig,
+                signed_digest,
+                ec.ECDSA(utils.Prehashed(hashes.SHA256()))
+            )
         logger.info("Digital signature is valid.")
     except InvalidSignature:
         logger.warning("Signature verification failed: Invalid signature.")
@@ -260,82 +1018,159 @@ async def calculate_credit_score(
         logger.error(f"Error verifying signature: {e}")
         raise HTTPException(status_code=400, detail=f"Error during signature verification: {e}")
 
+    if eval_mult_key is None:
+        eval_key_digest = eval_mult_key_digest
+        eval_key_bytes = eval_key_store.get(eval_key_digest)
+        if eval_key_bytes is None:
+            raise HTTPException(status_code=409, detail="Evaluation key was evicted from cache, please upload it again.")
+    else:
+        with STAGE_SECONDS.time(stage="eval_key_store"):
+            eval_key_digest, eval_key_bytes = eval_key_store.get_or_load(file_contents['eval_mult_key'])
+
+    fhe_inputs = {k: v for k, v in file_contents.items() if k.startswith('S_')}
+    logger.info("Security checks passed.")
+    return fhe_inputs, eval_key_digest, eval_key_bytes
+
+async def run_credit_score(fhe_inputs: Dict[str, bytes], eval_key_digest: str, eval_key_bytes: bytes, scoring_function):
+    """Gửi phép tính sang worker process, trả về (kết quả đã serialize, chữ ký của server)."""
     # === BẮT ĐẦU XỬ LÝ FHE (SAU KHI ĐÃ AN TOÀN) ===
-    logger.info("Security checks passed. Starting homomorphic computation.")
     try:
-        cc = init_crypto_context()
-        
-        eval_mult_key = fhe.DeserializeEvalKeyString(file_contents['eval_mult_key'], fhe.BINARY)
-        if not isinstance(eval_mult_key, fhe.EvalKey): raise ValueError("Invalid FHE evaluation key")
-        cc.InsertEvalMultKey([eval_mult_key])
-        
-        encrypted_params: Dict[str, Any] = {}
-        for key in [k for k in file_contents.keys() if k.startswith('S_')]:
-            param = fhe.DeserializeCiphertextString(file_contents[key], fhe.BINARY)
-            if not isinstance(param, fhe.Ciphertext): raise ValueError(f"Invalid ciphertext for {key}")
-            encrypted_params[key] = param
-
-        weights = {
-            'w1': 0.35, 'w2': 0.30, 'w3': 0.20, 'w4': 0.10, 
-            'w5': 0.05, 'w6': 0.03, 'w7': 0.02
-        }
-
         logger.info("Calculating final encrypted score...")
-        encrypted_result = homomorphic_credit_score_simplified(cc, weights, encrypted_params)
-
-        result_data = fhe.Serialize(encrypted_result, fhe.BINARY)
-        if not result_data:
-            raise HTTPException(status_code=500, detail="Failed to serialize FHE result.")
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        with FHE_COMPUTATIONS_PENDING.track():
+            # Khóa merged nặng nhiều MB: chỉ gửi digest, và chỉ gửi bytes khi worker chưa có khóa trong cache
+            try:
+                result_data, server_signature_bytes, timings = await loop.run_in_executor(
+                    fhe_executor, compute_credit_score,
+                    fhe_inputs, eval_key_digest, None, scoring_function
+                )
+            except EvalKeyCacheMiss:
+                result_data, server_signature_bytes, timings = await loop.run_in_executor(
+                    fhe_executor, compute_credit_score,
+                    fhe_inputs, eval_key_digest, eval_key_bytes, scoring_function
+                )
+        elapsed = time.perf_counter() - start
+        # Phần thời gian không do worker đo là thời gian chờ worker rảnh và truyền dữ liệu giữa các process
+        STAGE_SECONDS.observe(max(elapsed - sum(timings.values()), 0.0), stage="executor_wait")
+        for stage, seconds in timings.items():
+            STAGE_SECONDS.observe(seconds, stage=stage)
+        PAYLOAD_BYTES.observe(len(result_data), part="result_data")
 
     except Exception as e:
         logger.error(f"Error during FHE processing: {e}\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"An error occurred during homomorphic computation: {e}")
-    
+    return result_data, server_signature_bytes
+
+def signed_result_response(result_data: bytes, server_signature_bytes: bytes):
     # === PHẦN 3: KÝ VÀ TẠO MULTIPART RESPONSE ===
-    logger.info("Signing the response and preparing multipart package...")
+    # Kết quả đã được worker ký cùng lúc với tính toán
+    logger.info("Preparing signed multipart package...")
     try:
-        # 1. Load private key và certificate của SERVER (không đổi)
-        with open(SERVER_KEY_PATH, "rb") as f:
-            server_private_key = serialization.load_pem_private_key(f.read(), password=None)
-        with open(SERVER_CERT_PATH, "rb") as f:
-            server_cert_pem_bytes = f.read()
-
-        # 2. Dữ liệu cần ký là kết quả FHE (không đổi)
-        data_to_sign = result_data
-        
-        # 3. Tạo chữ ký (không đổi)
-        server_signature_bytes = server_private_key.sign(
-            data_to_sign,
-            ec.ECDSA(hashes.SHA256())
-        )
-        # 1. Tạo boundary
-        boundary = f"----Boundary{uuid.uuid4().hex}"
-
-        # 2. Hàm tạo từng phần
-        def create_part(name, filename, content_type, content: bytes):
-            return (
-                f"--{boundary}\r\n"
-                f"Content-Disposition: form-data; name=\"{name}\"; filename=\"{filename}\"\r\n"
-                f"Content-Type: {content_type}\r\n"
-                f"\r\n"   
-            ).encode('utf-8') + content + b"\r\n"
-
-        # 3. Gộp các phần
-        body = b''
-        body += create_part("result_data", "encryptedResult.bin", "application/octet-stream", result_data)
-        body += create_part("server_signature", "signature.sig", "application/octet-stream", server_signature_bytes)
-        body += create_part("server_certificate", "server.crt", "application/x-x509-ca-cert", server_cert_pem_bytes)
-        body += f"--{boundary}--\r\n".encode('utf-8')
-
-        # 4. Trả về multipart response
-        return Response(
-            content=body,
-            media_type=f"multipart/form-data; boundary={boundary}"
-        )        
+        # 1. Certificate của SERVER đã được nạp khi khởi động
+        server_cert_pem_bytes = SERVER_CERT_PEM_BYTES
+
+        # 2. Stream từng phần trực tiếp từ buffer đã serialize, không nối body trong bộ nhớ
+        return multipart_streaming_response([
+            ("result_data", "encryptedResult.bin", "application/octet-stream", result_data),
+            ("server_signature", "signature.sig", "application/octet-stream", server_signature_bytes),
+            ("server_certificate", "server.crt", "application/x-x509-ca-cert", server_cert_pem_bytes),
+        ])
     except Exception as e:
         logger.error(f"FATAL: Could not create or sign the multipart response: {e}\n{traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="Server failed to prepare the response.")
 
+# --- ASYNC JOB API (SUBMIT / POLL / FETCH) ---
+@app.post("/jobs/calculate-credit-score", status_code=202)
+async def submit_credit_score_job(
+    eval_mult_key: Optional[UploadFile] = File(None),
+    S_payment: UploadFile = File(...), S_util: UploadFile = File(...), S_length: UploadFile = File(...),
+    S_creditmix: UploadFile = File(...), S_inquiries: UploadFile = File(...),
+    S_behavioral: UploadFile = File(...), S_incomestability: UploadFile = File(...),
+    certificate: UploadFile = File(...),
+    signature: str = Form(...),
+    metadata: str = Form("{}"),
+    eval_mult_key_digest: Optional[str] = Form(None),
+    content_encoding: str = Form(transportCodec.IDENTITY)
+):
+    fhe_data_files = {
+        'S_payment': S_payment, 'S_util': S_util, 'S_length': S_length,
+        'S_creditmix': S_creditmix, 'S_inquiries': S_inquiries,
+        'S_behavioral': S_behavioral, 'S_incomestability': S_incomestability
+    }
+    return await submit_credit_score_job_request(
+        eval_mult_key, fhe_data_files, certificate, signature, metadata,
+        eval_mult_key_digest, resolve_scoring_function(metadata), content_encoding
+    )
+
+@app.post("/jobs/calculate-credit-score-batch", status_code=202)
+async def submit_credit_score_batch_job(
+    eval_mult_key: Optional[UploadFile] = File(None),
+    S_payment: UploadFile = File(...), S_util: UploadFile = File(...), S_length: UploadFile = File(...),
+    S_creditmix: UploadFile = File(...), S_inquiries: UploadFile = File(...),
+    S_behavioral: UploadFile = File(...), S_incomestability: UploadFile = File(...),
+    certificate: UploadFile = File(...),
+    signature: str = Form(...),
+    metadata: str = Form("{}"),
+    eval_mult_key_digest: Optional[str] = Form(None),
+    content_encoding: str = Form(transportCodec.IDENTITY)
+):
+    validate_batch_metadata(metadata)
+    fhe_data_files = {
+        'S_payment': S_payment, 'S_util': S_util, 'S_length': S_length,
+        'S_creditmix': S_creditmix, 'S_inquiries': S_inquiries,
+        'S_behavioral': S_behavioral, 'S_incomestability': S_incomestability
+    }
+    return await submit_credit_score_job_request(
+        eval_mult_key, fhe_data_files, certificate, signature, metadata,
+        eval_mult_key_digest, resolve_scoring_function(metadata), content_encoding
+    )
+
+async def submit_credit_score_job_request(
+    eval_mult_key: Optional[UploadFile],
+    fhe_data_files: Dict[str, UploadFile],
+    certificate: UploadFile,
+    signature: str,
+    metadata: str,
+    eval_mult_key_digest: Optional[str],
+    scoring_function,
+    content_encoding: str
+):
+    # Kiểm tra hàng đợi trước khi đọc dữ liệu lớn
+    if job_queue.full():
+        raise HTTPException(status_code=503, detail="Job queue is full, retry later.", headers={"Retry-After": "30"})
+
+    fhe_inputs, eval_key_digest, eval_key_bytes = await verify_credit_score_request(
+        eval_mult_key, fhe_data_files, certificate, signature, metadata,
+        eval_mult_key_digest, content_encoding
+    )
+    job = CreditScoreJob(fhe_inputs, eval_key_digest, eval_key_bytes, scoring_function)
+    try:
+        job_queue.put_nowait(job)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Job queue is full, retry later.", headers={"Retry-After": "30"})
+    jobs[job.job_id] = job
+    logger.info(f"Job {job.job_id} queued ({job_queue.qsize()} in queue).")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    if job.status == JOB_FAILED:
+        raise HTTPException(status_code=409, detail=f"Job failed: {job.error}")
+    if job.status != JOB_DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}.")
+    return signed_result_response(job.result_data, job.server_signature)
+
 # --- KHỞI CHẠY SERVER VỚI HTTPS ---
 if __name__ == "__main__":
     import uvicorn
@@ -8,6 +8,29 @@ def ensure_dir(path):
     if not os.path.exists(path):
         os.makedirs(path)
 
+# Số slot của mỗi CryptoContext, để hằng số được lặp lại trên mọi slot khi batch > 1
+batch_sizes = {}
+
+def make_crypto_context(multiplicative_depth=15, scaling_mod_size=59, batch_size=1, ring_dimension=0):
+    parameters = fhe.CCParamsCKKSRNS()
+    parameters.SetMultiplicativeDepth(multiplicative_depth)
+    parameters.SetScalingModSize(scaling_mod_size)
+    parameters.SetBatchSize(batch_size)
+    if ring_dimension:
+        parameters.SetRingDim(ring_dimension)
+
+    cc = fhe.GenCryptoContext(parameters)
+    cc.Enable(fhe.PKESchemeFeature.PKE)
+    cc.Enable(fhe.PKESchemeFeature.KEYSWITCH)
+    cc.Enable(fhe.PKESchemeFeature.LEVELEDSHE)
+    cc.Enable(fhe.PKESchemeFeature.ADVANCEDSHE)
+    cc.Enable(fhe.PKESchemeFeature.MULTIPARTY)
+    batch_sizes[id(cc)] = batch_size
+    return cc
+
+def make_constant(crypto_context, value):
+    return crypto_context.MakeCKKSPackedPlaintext([value] * batch_sizes.get(id(crypto_context), 1))
+
 def get_A(crypto_context, S_util, S_inquiries):
     S_inquiries_sq = crypto_context.EvalMult(S_inquiries, S_inquiries)
     result = crypto_context.EvalAdd(S_util, S_inquiries_sq)
@@ -15,7 +38,7 @@ def get_A(crypto_context, S_util, S_inquiries):
 
 def get_B(crypto_context, S_creditmix, S_incomestability):
     total = crypto_context.EvalAdd(S_creditmix, S_incomestability)
-    total = crypto_context.EvalAdd(total, crypto_context.MakeCKKSPackedPlaintext([1.0]))
+    total = crypto_context.EvalAdd(total, make_constant(crypto_context, 1.0))
     result = crypto_context.EvalChebyshevFunction(
         func=lambda x: np.sqrt(x),
         ciphertext=total,
@@ -26,18 +49,18 @@ def get_B(crypto_context, S_creditmix, S_incomestability):
     return result
 
 def get_first_param(crypto_context, S_payment, w1=0.35):
-    w1_p = crypto_context.MakeCKKSPackedPlaintext([w1])
+    w1_p = make_constant(crypto_context, w1)
     S_payment_scaled = crypto_context.EvalMult(S_payment, w1_p)
     result = crypto_context.EvalMult(S_payment_scaled, S_payment_scaled)
     return result
 
 def get_second_param(crypto_context, S_util, S_behavioral, w2=0.30, w7=0.02):
-    w2_p = crypto_context.MakeCKKSPackedPlaintext([w2])
-    w7_p = crypto_context.MakeCKKSPackedPlaintext([w7])
+    w2_p = make_constant(crypto_context, w2)
+    w7_p = make_constant(crypto_context, w7)
     S_util_scaled = crypto_context.EvalMult(S_util, w2_p)
     S_behavioral_scaled = crypto_context.EvalMult(S_behavioral, w7_p)
     S_behavioral_scaled = crypto_context.EvalMult(S_behavioral_scaled, S_behavioral_scaled)
-    S_behavioral_scaled = crypto_context.EvalMult(S_behavioral_scaled, crypto_context.MakeCKKSPackedPlaintext([3.0]))
+    S_behavioral_scaled = crypto_context.EvalMult(S_behavioral_scaled, make_constant(crypto_context, 3.0))
     result = crypto_context.EvalAdd(S_util_scaled, S_behavioral_scaled)
     result = crypto_context.EvalChebyshevFunction(
         func=lambda x: np.sqrt(x),
@@ -49,24 +72,24 @@ def get_second_param(crypto_context, S_util, S_behavioral, w2=0.30, w7=0.02):
     return result
 
 def get_third_param(crypto_context, S_length, S_creditmix, B, w3=0.20, w4=0.10):
-    w3_p = crypto_context.MakeCKKSPackedPlaintext([w3])
-    w4_p = crypto_context.MakeCKKSPackedPlaintext([w4])
+    w3_p = make_constant(crypto_context, w3)
+    w4_p = make_constant(crypto_context, w4)
     S_length_scaled = crypto_context.EvalMult(S_length, w3_p)
     S_creditmix_scaled = crypto_context.EvalMult(S_creditmix, w4_p)
     S_creditmix_scaledsqed = crypto_context.EvalMult(S_creditmix_scaled, S_creditmix_scaled)
-    B_plus = crypto_context.EvalAdd(B, crypto_context.MakeCKKSPackedPlaintext([1.0]))
+    B_plus = crypto_context.EvalAdd(B, make_constant(crypto_context, 1.0))
     B_plus_inverse = crypto_context.EvalChebyshevFunction(lambda x: 1/x, B_plus, 1, 3, 7)
     S_total = crypto_context.EvalAdd(S_length_scaled, S_creditmix_scaledsqed)
     result = crypto_context.EvalMult(S_total, B_plus_inverse)
     return result
 
 def get_fourth_param(crypto_context, S_inquiries, S_incomestability, w5=0.05, w6=0.03):
-    w5_p = crypto_context.MakeCKKSPackedPlaintext([w5])
-    w6_p = crypto_context.MakeCKKSPackedPlaintext([w6])
+    w5_p = make_constant(crypto_context, w5)
+    w6_p = make_constant(crypto_context, w6)
     S_inquiries_scaled = crypto_context.EvalMult(S_inquiries, w5_p)
     S_incomestability_scaled = crypto_context.EvalMult(S_incomestability, w6_p)
     S_total = crypto_context.EvalAdd(S_inquiries_scaled, S_incomestability_scaled)
-    S_totalplus = crypto_context.EvalAdd(S_total, crypto_context.MakeCKKSPackedPlaintext([1.0]))
+    S_totalplus = crypto_context.EvalAdd(S_total, make_constant(crypto_context, 1.0))
     result = crypto_context.EvalChebyshevFunction(
         func=lambda x: np.log(x),
         ciphertext=S_totalplus,
@@ -89,11 +112,25 @@ def homomorphic_credit_score(crypto_context, weights, encrypted_params):
     for score in weighted_scores[1:]:
         final_score = crypto_context.EvalAdd(final_score, score)
     
-    A_plus = crypto_context.EvalAdd(A, crypto_context.MakeCKKSPackedPlaintext([1.0]))
+    A_plus = crypto_context.EvalAdd(A, make_constant(crypto_context, 1.0))
     A_plus_inverse = crypto_context.EvalChebyshevFunction(lambda x: 1/x, A_plus, 1, 3, 5)
     final_score = crypto_context.EvalMult(final_score, A_plus_inverse)
     return final_score
 
+def homomorphic_credit_score_simplified(crypto_context, weights, encrypted_params):
+    final_score = None
+    for key, weight in (('S_payment', 'w1'), ('S_util', 'w2'), ('S_length', 'w3'), ('S_creditmix', 'w4'),
+                        ('S_inquiries', 'w5'), ('S_incomestability', 'w6'), ('S_behavioral', 'w7')):
+        weighted = crypto_context.EvalMult(encrypted_params[key], make_constant(crypto_context, weights[weight]))
+        final_score = weighted if final_score is None else crypto_context.EvalAdd(final_score, weighted)
+    return final_score
+
+def plaintext_credit_score_simplified(weights, params):
+    return (params['S_payment'] * weights['w1'] + params['S_util'] * weights['w2'] +
+            params['S_length'] * weights['w3'] + params['S_creditmix'] * weights['w4'] +
+            params['S_inquiries'] * weights['w5'] + params['S_incomestability'] * weights['w6'] +
+            params['S_behavioral'] * weights['w7'])
+
 def plaintext_credit_score(weights, params):
     A = params['S_util'] + params['S_inquiries']**2
     B = np.sqrt(params['S_creditmix'] + params['S_incomestability'] + 1.0)
@@ -104,66 +141,75 @@ def plaintext_credit_score(weights, params):
     raw_score = (p1 + p2 + p3 + p4) / (A + 1)
     return raw_score
 
-def generate_test_cases(num_cases=10):
+# Khoảng giá trị ngẫu nhiên của từng tham số đầu vào
+PARAM_RANGES = {
+    'S_payment': (0.5, 1.0),
+    'S_util': (0.1, 0.9),
+    'S_length': (0.3, 1.0),
+    'S_creditmix': (0.3, 0.9),
+    'S_inquiries': (0.0, 0.2),
+    'S_behavioral': (0.5, 1.0),
+    'S_incomestability': (0.3, 0.9)
+}
+
+def generate_test_cases(num_cases=10, batch_size=1):
+    # Mỗi test case gồm batch_size khách hàng, mỗi khách hàng một slot
     test_cases = []
     for _ in range(num_cases):
-        case = {
-            'S_payment': [np.random.uniform(0.5, 1.0)],
-            'S_util': [np.random.uniform(0.1, 0.9)],
-            'S_length': [np.random.uniform(0.3, 1.0)],
-            'S_creditmix': [np.random.uniform(0.3, 0.9)],
-            'S_inquiries': [np.random.uniform(0.0, 0.2)],
-            'S_behavioral': [np.random.uniform(0.5, 1.0)],
-            'S_incomestability': [np.random.uniform(0.3, 0.9)]
-        }
+        case = {key: list(np.random.uniform(low, high, batch_size)) for key, (low, high) in PARAM_RANGES.items()}
         test_cases.append(case)
     return test_cases
 
-def run_benchmark():
-    print("=== Starting FHE Credit Score Benchmark ===")
-    print(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    
-    # Create results directory
-    results_dir = "benchmark_results"
-    ensure_dir(results_dir)
-    
-    # Initialize FHE parameters
-    parameters = fhe.CCParamsCKKSRNS()
-    parameters.SetMultiplicativeDepth(15)
-    parameters.SetScalingModSize(59)
-    parameters.SetBatchSize(1)
-
-    cc = fhe.GenCryptoContext(parameters)
-    cc.Enable(fhe.PKESchemeFeature.PKE)
-    cc.Enable(fhe.PKESchemeFeature.KEYSWITCH)
-    cc.Enable(fhe.PKESchemeFeature.LEVELEDSHE)
-    cc.Enable(fhe.PKESchemeFeature.ADVANCEDSHE)
-    cc.Enable(fhe.PKESchemeFeature.MULTIPARTY)
+def generate_multiparty_keys(cc, num_parties):
+    keys = [cc.KeyGen()]
+    for i in range(1, num_parties):
+        keys.append(cc.MultipartyKeyGen(keys[i-1].publicKey))
+    joint_public_key = keys[-1].publicKey
+    return keys, joint_public_key
 
-    # Generate keys
-    print("\nGenerating keys...")
-    keys = [cc.KeyGen() for _ in range(5)]
-    for i in range(1, 5):
-        keys[i] = cc.MultipartyKeyGen(keys[i-1].publicKey)
-    joint_public_key = keys[4].publicKey
-
-    # Generate evaluation keys
+def generate_eval_mult_key(cc, keys, joint_public_key):
     eval_mult_keys = []
     eval_mult_keys.append(cc.KeySwitchGen(keys[0].secretKey, keys[0].secretKey))
-    for i in range(1, 5):
+    for i in range(1, len(keys)):
         new_key_part = cc.MultiKeySwitchGen(keys[i].secretKey, keys[i].secretKey, eval_mult_keys[i-1])
         accumulated_key = cc.MultiAddEvalKeys(eval_mult_keys[i-1], new_key_part, keys[i].publicKey.GetKeyTag())
         eval_mult_keys.append(accumulated_key)
     
     eval_mult_ab = eval_mult_keys[-1]
     final_key_parts = []
-    for i in range(5):
+    for i in range(len(keys)):
         part = cc.MultiMultEvalKey(keys[i].secretKey, eval_mult_ab, joint_public_key.GetKeyTag())
         final_key_parts.append(part)
     
     eval_mult_final = final_key_parts[0]
-    for i in range(1, 5):
+    for i in range(1, len(keys)):
         eval_mult_final = cc.MultiAddEvalMultKeys(eval_mult_final, final_key_parts[i], eval_mult_final.GetKeyTag())
+    return eval_mult_final
+
+def partial_decrypt(cc, encrypted_result, keys):
+    partial_decryptions = []
+    partial_decryptions.append(cc.MultipartyDecryptLead([encrypted_result], keys[0].secretKey)[0])
+    for j in range(1, len(keys)):
+        partial_decryptions.append(cc.MultipartyDecryptMain([encrypted_result], keys[j].secretKey)[0])
+    return partial_decryptions
+
+def run_benchmark():
+    print("=== Starting FHE Credit Score Benchmark ===")
+    print(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    
+    # Create results directory
+    results_dir = "benchmark_results"
+    ensure_dir(results_dir)
+    
+    # Initialize FHE parameters
+    cc = make_crypto_context(multiplicative_depth=15, scaling_mod_size=59, batch_size=1)
+
+    # Generate keys
+    print("\nGenerating keys...")
+    keys, joint_public_key = generate_multiparty_keys(cc, 5)
+
+    # Generate evaluation keys
+    eval_mult_final = generate_eval_mult_key(cc, keys, joint_public_key)
     cc.InsertEvalMultKey([eval_mult_final])
 
     # Generate test cases
@@ -178,26 +224,23 @@ def run_benchmark():
         print(f"\nRunning test case {i}/10...")
         
         # Time encryption
-        encrypt_start = time.time()
+        encrypt_start = time.perf_counter()
         encrypted_params = {}
         for key, value in test_case.items():
             encrypted_params[key] = cc.Encrypt(joint_public_key, cc.MakeCKKSPackedPlaintext(value))
-        encrypt_time = time.time() - encrypt_start
+        encrypt_time = time.perf_counter() - encrypt_start
         
         # Time computation
-        compute_start = time.time()
+        compute_start = time.perf_counter()
         encrypted_result = homomorphic_credit_score(cc, weights, encrypted_params)
-        compute_time = time.time() - compute_start
+        compute_time = time.perf_counter() - compute_start
         
         # Time decryption
-        decrypt_start = time.time()
-        partial_decryptions = []
-        partial_decryptions.append(cc.MultipartyDecryptLead([encrypted_result], keys[0].secretKey)[0])
-        for j in range(1, 5):
-            partial_decryptions.append(cc.MultipartyDecryptMain([encrypted_result], keys[j].secretKey)[0])
+        decrypt_start = time.perf_counter()
+        partial_decryptions = partial_decrypt(cc, encrypted_result, keys)
         result_ptxt = cc.MultipartyDecryptFusion(partial_decryptions)
         result_ptxt.SetLength(1)
-        decrypt_time = time.time() - decrypt_start
+        decrypt_time = time.perf_counter() - decrypt_start
         
         # Get FHE result
         raw_score = result_ptxt.GetRealPackedValue()[0]
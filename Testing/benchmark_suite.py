@@ -0,0 +1,226 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import platform
+import itertools
+import traceback
+from datetime import datetime
+
+import numpy as np
+import openfhe as fhe
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from PoC_benchmark import (
+    ensure_dir, make_crypto_context, generate_test_cases, generate_multiparty_keys,
+    generate_eval_mult_key, partial_decrypt,
+    homomorphic_credit_score, homomorphic_credit_score_simplified,
+    plaintext_credit_score, plaintext_credit_score_simplified
+)
+
+WEIGHTS = {'w1': 0.35, 'w2': 0.30, 'w3': 0.20, 'w4': 0.10, 'w5': 0.05, 'w6': 0.03, 'w7': 0.02}
+
+# Tên hàm tính điểm -> (mạch đồng cấu, công thức plaintext để so sánh độ chính xác)
+SCORING_FUNCTIONS = {
+    "full": (homomorphic_credit_score, plaintext_credit_score),
+    "simplified": (homomorphic_credit_score_simplified, plaintext_credit_score_simplified),
+}
+
+# Các tham số được quét; mỗi tổ hợp là một cấu hình
+CONFIG_FIELDS = ("function", "multiplicative_depth", "scaling_mod_size", "ring_dimension", "parties", "batch_size")
+# context, keygen, eval_key đo một lần mỗi cấu hình; các giai đoạn còn lại đo mỗi lần lặp
+STAGES = ("context", "keygen", "eval_key", "encrypt", "compute", "partial_decrypt", "fusion")
+PERCENTILES = (50, 90, 95, 99)
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def summarize(samples):
+    samples = np.asarray(samples, dtype=float)
+    summary = {
+        'n': int(samples.size),
+        'mean': float(samples.mean()),
+        'stdev': float(samples.std(ddof=1)) if samples.size > 1 else 0.0,
+        'min': float(samples.min()),
+        'max': float(samples.max()),
+    }
+    for p in PERCENTILES:
+        summary[f'p{p}'] = float(np.percentile(samples, p))
+    return summary
+
+def config_key(config):
+    return tuple(config[field] for field in CONFIG_FIELDS)
+
+def run_config(config, repeat):
+    """Chạy toàn bộ quy trình cho một cấu hình; trả về thời gian, kích thước serialize và sai số."""
+    scoring_function, plaintext_function = SCORING_FUNCTIONS[config['function']]
+    batch_size = config['batch_size']
+    samples = {stage: [] for stage in STAGES}
+
+    cc, elapsed = timed(make_crypto_context, config['multiplicative_depth'], config['scaling_mod_size'],
+                        batch_size, config['ring_dimension'])
+    samples['context'].append(elapsed)
+    (keys, joint_public_key), elapsed = timed(generate_multiparty_keys, cc, config['parties'])
+    samples['keygen'].append(elapsed)
+    eval_mult_key, elapsed = timed(generate_eval_mult_key, cc, keys, joint_public_key)
+    samples['eval_key'].append(elapsed)
+    cc.InsertEvalMultKey([eval_mult_key])
+
+    sizes = {
+        'public_key': len(fhe.Serialize(joint_public_key, fhe.BINARY)),
+        'eval_mult_key': len(fhe.Serialize(eval_mult_key, fhe.BINARY)),
+    }
+    errors = []
+    for test_case in generate_test_cases(repeat, batch_size):
+        start = time.perf_counter()
+        encrypted_params = {key: cc.Encrypt(joint_public_key, cc.MakeCKKSPackedPlaintext(value))
+                            for key, value in test_case.items()}
+        samples['encrypt'].append(time.perf_counter() - start)
+
+        encrypted_result, elapsed = timed(scoring_function, cc, WEIGHTS, encrypted_params)
+        samples['compute'].append(elapsed)
+
+        partial_decryptions, elapsed = timed(partial_decrypt, cc, encrypted_result, keys)
+        samples['partial_decrypt'].append(elapsed)
+
+        result_ptxt, elapsed = timed(cc.MultipartyDecryptFusion, partial_decryptions)
+        samples['fusion'].append(elapsed)
+        result_ptxt.SetLength(batch_size)
+
+        # Sai số tính theo thang điểm 300-850 trên mọi slot
+        fhe_scores = 300 + np.array(result_ptxt.GetRealPackedValue()[:batch_size]) * 550
+        plaintext_scores = 300 + plaintext_function(WEIGHTS, {k: np.array(v) for k, v in test_case.items()}) * 550
+        errors.extend(np.abs(fhe_scores - plaintext_scores))
+
+    sizes['ciphertext'] = len(fhe.Serialize(encrypted_params['S_payment'], fhe.BINARY))
+    sizes['result'] = len(fhe.Serialize(encrypted_result, fhe.BINARY))
+    sizes['partial_decryption'] = len(fhe.Serialize(partial_decryptions[0], fhe.BINARY))
+
+    compute_p50 = float(np.percentile(samples['compute'], 50))
+    return {
+        'config': dict(config),
+        'actual_ring_dimension': int(cc.GetRingDimension()),
+        'timings': {stage: summarize(values) for stage, values in samples.items()},
+        'sizes': sizes,
+        'accuracy': {
+            'mean_abs_error': float(np.mean(errors)),
+            'max_abs_error': float(np.max(errors)),
+        },
+        'customers_per_second': batch_size / compute_p50 if compute_p50 > 0 else None,
+    }
+
+def expand_configs(args):
+    for values in itertools.product(args.function, args.depth, args.scaling_mod_size,
+                                    args.ring_dim, args.parties, args.batch_size):
+        yield dict(zip(CONFIG_FIELDS, values))
+
+def write_csv(path, results):
+    header = list(CONFIG_FIELDS) + ['metric', 'n', 'mean', 'stdev', 'min', 'max'] + [f'p{p}' for p in PERCENTILES]
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for result in results:
+            row_prefix = [result['config'][field] for field in CONFIG_FIELDS]
+            if 'error' in result:
+                writer.writerow(row_prefix + ['error', 0, result['error']])
+                continue
+            for stage, stats in result['timings'].items():
+                writer.writerow(row_prefix + [f'{stage}_seconds'] + [stats[c] for c in header[len(CONFIG_FIELDS) + 1:]])
+            for name, size in result['sizes'].items():
+                writer.writerow(row_prefix + [f'{name}_bytes', 1, size, 0.0, size, size] + [size] * len(PERCENTILES))
+            for name, value in result['accuracy'].items():
+                writer.writerow(row_prefix + [name, 1, value, 0.0, value, value] + [value] * len(PERCENTILES))
+
+def compare_with_baseline(results, baseline_path, tolerance):
+    """So sánh p50 của từng giai đoạn và kích thước với baseline; trả về danh sách regression."""
+    with open(baseline_path) as f:
+        baseline = {config_key(r['config']): r for r in json.load(f)['results'] if 'error' not in r}
+
+    print(f"\n=== Comparison with baseline {baseline_path} (tolerance {tolerance:.0%}) ===")
+    regressions = []
+    for result in results:
+        old = baseline.get(config_key(result['config']))
+        if old is None or 'error' in result:
+            continue
+        label = ", ".join(f"{field}={result['config'][field]}" for field in CONFIG_FIELDS)
+        print(f"\n{label}")
+        metrics = [(f"{stage} p50 (s)", old['timings'][stage]['p50'], stats['p50'])
+                   for stage, stats in result['timings'].items() if stage in old['timings']]
+        metrics += [(f"{name} (bytes)", old['sizes'][name], size)
+                    for name, size in result['sizes'].items() if name in old['sizes']]
+        metrics.append(("max_abs_error (points)", old['accuracy']['max_abs_error'], result['accuracy']['max_abs_error']))
+        for name, old_value, new_value in metrics:
+            change = (new_value - old_value) / old_value if old_value else 0.0
+            flag = ""
+            if change > tolerance:
+                flag = "  REGRESSION"
+                regressions.append((label, name, old_value, new_value))
+            elif change < -tolerance:
+                flag = "  improved"
+            print(f"  {name:<28} {old_value:>14.6g} -> {new_value:<14.6g} ({change:+.1%}){flag}")
+    return regressions
+
+def run_suite(args):
+    print("=== FHE Credit Score Benchmark Suite ===")
+    print(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    results = []
+    for config in expand_configs(args):
+        label = ", ".join(f"{field}={config[field]}" for field in CONFIG_FIELDS)
+        print(f"\nRunning {label}...")
+        try:
+            result = run_config(config, args.repeat)
+        except Exception as e:
+            # Tổ hợp tham số không hợp lệ (vd. độ sâu không đủ cho mạch đầy đủ) được ghi lại và bỏ qua
+            print(f"  FAILED: {e}")
+            if args.verbose:
+                traceback.print_exc()
+            results.append({'config': config, 'error': str(e)})
+            continue
+        results.append(result)
+        for stage in STAGES:
+            stats = result['timings'][stage]
+            print(f"  {stage:<16} p50={stats['p50']:.4f}s p95={stats['p95']:.4f}s max={stats['max']:.4f}s")
+        print(f"  Ring dimension: {result['actual_ring_dimension']}")
+        print("  Sizes: " + ", ".join(f"{k}={v}" for k, v in result['sizes'].items()))
+        print(f"  Max error: {result['accuracy']['max_abs_error']:.6f} points")
+
+    ensure_dir(args.output_dir)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    json_file = os.path.join(args.output_dir, f'benchmark_suite_{timestamp}.json')
+    csv_file = os.path.join(args.output_dir, f'benchmark_suite_{timestamp}.csv')
+    with open(json_file, 'w') as f:
+        json.dump({
+            'timestamp': datetime.now().isoformat(),
+            'host': {'platform': platform.platform(), 'processor': platform.processor(), 'cpu_count': os.cpu_count()},
+            'repeat': args.repeat,
+            'results': results,
+        }, f, indent=2)
+    write_csv(csv_file, results)
+    print(f"\nResults saved to: {json_file}, {csv_file}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.tolerance:.0%}.")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quét tham số CKKS và đo toàn bộ quy trình tính điểm tín dụng đa bên")
+    parser.add_argument("--function", nargs="+", choices=sorted(SCORING_FUNCTIONS), default=["full", "simplified"])
+    parser.add_argument("--depth", nargs="+", type=int, default=[15])
+    parser.add_argument("--scaling-mod-size", nargs="+", type=int, default=[59])
+    parser.add_argument("--ring-dim", nargs="+", type=int, default=[0], help="0 = để OpenFHE chọn theo mức bảo mật")
+    parser.add_argument("--parties", nargs="+", type=int, default=[5])
+    parser.add_argument("--batch-size", nargs="+", type=int, default=[1])
+    parser.add_argument("--repeat", type=int, default=10, help="Số lần lặp encrypt/compute/decrypt mỗi cấu hình")
+    parser.add_argument("--output-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_results"))
+    parser.add_argument("--baseline", help="File JSON của một lần chạy trước để so sánh")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Ngưỡng tăng tương đối bị coi là regression")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    run_suite(args)
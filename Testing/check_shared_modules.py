@@ -0,0 +1,62 @@
+import os
+import ast
+import sys
+import difflib
+
+# Các module được chép vào từng thư mục triển khai (FE Credit và ngân hàng), phải giống hệt nhau
+# ngoại trừ dòng "Lưu ý: giữ đồng bộ với ..." trỏ sang bản còn lại.
+SHARED_MODULES = [
+    ("FinanceOrg/transportCodec.py", "Banks/InterbankService/transportCodec.py"),
+    ("FinanceOrg/metrics.py", "Banks/InterbankService/metrics.py"),
+    ("FinanceOrg/peerCertificates.py", "Banks/InterbankService/peerCertificates.py"),
+]
+SYNC_NOTE_PREFIX = "Lưu ý: giữ đồng bộ với"
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+def read_module(path):
+    with open(os.path.join(ROOT, path), encoding="utf-8") as f:
+        return [line for line in f.read().splitlines(keepends=True) if not line.startswith(SYNC_NOTE_PREFIX)]
+
+def check_shared_modules():
+    errors = []
+    for left, right in SHARED_MODULES:
+        diff = list(difflib.unified_diff(read_module(left), read_module(right), left, right))
+        if diff:
+            errors.append("".join(diff))
+    return errors
+
+def literal_profiles(path, name):
+    """Đọc dict PARAMETER_PROFILES trong file mà không import (HEServer cần openfhe)."""
+    with open(os.path.join(ROOT, path), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == name for t in node.targets):
+            profiles = {}
+            for key, value in zip(node.value.keys, node.value.values):
+                profiles[ast.literal_eval(key)] = {
+                    ast.literal_eval(k): ast.literal_eval(v)
+                    for k, v in zip(value.keys, value.values)
+                    if ast.literal_eval(k) in ("multiplicative_depth", "scaling_mod_size")
+                }
+            return profiles
+    raise Exception(f"{name} not found in {path}")
+
+def check_parameter_profiles():
+    # Tham số CKKS của HEServer và của các ngân hàng phải khớp theo từng profile
+    server = literal_profiles("FinanceOrg/HEServer.py", "PARAMETER_PROFILES")
+    banks = literal_profiles("Banks/HEModule/fheParameters.py", "PARAMETER_PROFILES")
+    if server != banks:
+        return [f"PARAMETER_PROFILES differ:\n  FinanceOrg/HEServer.py: {server}\n"
+                f"  Banks/HEModule/fheParameters.py: {banks}\n"]
+    return []
+
+if __name__ == "__main__":
+    # Chạy trước khi commit thay đổi ở một trong các module dùng chung
+    errors = check_shared_modules() + check_parameter_profiles()
+    for error in errors:
+        print(error)
+    if errors:
+        print(f"{len(errors)} shared module(s) out of sync.")
+        sys.exit(1)
+    print(f"{len(SHARED_MODULES)} shared modules and parameter profiles are in sync.")
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Banks", "InterbankService"))
+import transportCodec
+
+def ensure_dir(path):
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+def benchmark_file(path, codec, level, repeat):
+    with open(path, "rb") as f:
+        data = f.read()
+
+    compress_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compressed = transportCodec.compress(data, codec, level)
+        compress_times.append(time.perf_counter() - start)
+
+    decompress_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        # Giải nén theo luồng giống phía server, chunk 1 MiB
+        decompressor = transportCodec.decompressor(codec)
+        restored = []
+        for offset in range(0, len(compressed), 1024 * 1024):
+            decompressor.decompress(compressed[offset:offset + 1024 * 1024], restored.append)
+        decompressor.flush(restored.append)
+        decompress_times.append(time.perf_counter() - start)
+    if b"".join(restored) != data:
+        raise Exception(f"Round trip failed for {path} with {codec}")
+
+    size_mb = len(data) / (1024 * 1024)
+    return {
+        'file': os.path.basename(path),
+        'codec': codec,
+        'level': level,
+        'original_size': len(data),
+        'compressed_size': len(compressed),
+        'ratio': len(data) / max(len(compressed), 1),
+        'compress_mb_s': size_mb / min(compress_times),
+        'decompress_mb_s': size_mb / min(decompress_times),
+    }
+
+def run_benchmark(paths, repeat):
+    print("=== Transport Compression Benchmark ===")
+    print(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Codecs: {', '.join(transportCodec.available_codecs())}")
+
+    results = []
+    for path in paths:
+        for codec in transportCodec.available_codecs():
+            if codec == transportCodec.IDENTITY:
+                continue
+            default_level = transportCodec.DEFAULT_LEVELS[codec]
+            for level in sorted({1, default_level, 9}):
+                result = benchmark_file(path, codec, level, repeat)
+                results.append(result)
+                print(f"  {result['file']} {codec}:{level} "
+                      f"ratio={result['ratio']:.3f} "
+                      f"compress={result['compress_mb_s']:.1f}MB/s "
+                      f"decompress={result['decompress_mb_s']:.1f}MB/s")
+
+    results_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_results")
+    ensure_dir(results_dir)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    results_file = os.path.join(results_dir, f'transport_benchmark_{timestamp}.txt')
+    with open(results_file, 'w') as f:
+        f.write("=== Transport Compression Benchmark Results ===\n")
+        f.write(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        for result in results:
+            f.write(f"{result['file']} ({result['codec']} level {result['level']}):\n")
+            f.write(f"  Size: {result['original_size']} -> {result['compressed_size']} bytes\n")
+            f.write(f"  Ratio: {result['ratio']:.3f}\n")
+            f.write(f"  Compress throughput: {result['compress_mb_s']:.1f} MB/s\n")
+            f.write(f"  Decompress throughput: {result['decompress_mb_s']:.1f} MB/s\n\n")
+    print(f"\nResults saved to: {results_file}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đo tỉ lệ nén và thông lượng trên khóa/ciphertext OpenFHE thật")
+    parser.add_argument("files", nargs="+", help="Ví dụ: Keys/evalMultKey_merged.txt ciphertext_MSB_S_payment.txt")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run_benchmark(args.files, args.repeat)